@@ -1,3 +1,4 @@
+import os
 from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config
@@ -50,6 +51,18 @@ def run_migrations_offline() -> None:
         context.run_migrations()
 
 
+def database_urls() -> list:
+    """The configured database, then every shard in SQLALCHEMY_SHARD_URLS.
+    Shards hold todos and copies of users, so they take every revision too."""
+    urls = [config.get_main_option("sqlalchemy.url")]
+    urls += [
+        url.strip()
+        for url in os.getenv("SQLALCHEMY_SHARD_URLS", "").split(",")
+        if url.strip()
+    ]
+    return list(dict.fromkeys(urls))
+
+
 def run_migrations_online() -> None:
     """Run migrations in 'online' mode.
 
@@ -57,17 +70,27 @@ def run_migrations_online() -> None:
     and associate a connection with the context.
 
     """
-    connectable = engine_from_config(
-        config.get_section(config.config_ini_section, {}),
-        prefix="sqlalchemy.",
-        poolclass=pool.NullPool,
-    )
-
-    with connectable.connect() as connection:
-        context.configure(connection=connection, target_metadata=target_metadata)
-
-        with context.begin_transaction():
-            context.run_migrations()
+    for url in database_urls():
+        connectable = engine_from_config(
+            {
+                **config.get_section(config.config_ini_section, {}),
+                "sqlalchemy.url": url,
+            },
+            prefix="sqlalchemy.",
+            poolclass=pool.NullPool,
+        )
+
+        with connectable.connect() as connection:
+            # One transaction per revision, so revisions that backfill in
+            # chunks (see backfill.py) do not leave earlier DDL uncommitted.
+            context.configure(
+                connection=connection,
+                target_metadata=target_metadata,
+                transaction_per_migration=True,
+            )
+
+            with context.begin_transaction():
+                context.run_migrations()
 
 
 if context.is_offline_mode():
@@ -0,0 +1,49 @@
+"""Create todos archive table and completed_at column
+
+Revision ID: 3c1d9e0a6b27
+Revises: 7f98f85b570f
+Create Date: 2026-10-19 09:12:41.518203
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3c1d9e0a6b27"
+down_revision: Union[str, Sequence[str], None] = "7f98f85b570f"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "todos", sa.Column("completed_at", sa.DateTime(timezone=True), nullable=True)
+    )
+    op.create_table(
+        "todos_archive",
+        sa.Column("id", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("title", sa.String(), nullable=True),
+        sa.Column("description", sa.String(), nullable=True),
+        sa.Column("priority", sa.Integer(), nullable=True),
+        sa.Column("complete", sa.Boolean(), nullable=True),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("completed_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("archived_at", sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_todos_archive_user_id"), "todos_archive", ["user_id"], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f("ix_todos_archive_user_id"), table_name="todos_archive")
+    op.drop_table("todos_archive")
+    op.drop_column("todos", "completed_at")
@@ -0,0 +1,73 @@
+"""Add updated_at to todos and todo tombstones for delta sync
+
+Revision ID: 9b4e2f71c0d5
+Revises: 3c1d9e0a6b27
+Create Date: 2026-10-19 13:40:07.204518
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from backfill import run_backfill
+
+# revision identifiers, used by Alembic.
+revision: str = "9b4e2f71c0d5"
+down_revision: Union[str, Sequence[str], None] = "3c1d9e0a6b27"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "todos", sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True)
+    )
+    op.create_table(
+        "todo_tombstones",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("todo_id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=True),
+        sa.Column("deleted_at", sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        op.f("ix_todo_tombstones_id"), "todo_tombstones", ["id"], unique=False
+    )
+    op.create_index(
+        "ix_todo_tombstones_user_id_deleted_at",
+        "todo_tombstones",
+        ["user_id", "deleted_at"],
+        unique=False,
+    )
+
+    todos = sa.table("todos", sa.column("id"), sa.column("updated_at"))
+
+    with op.get_context().autocommit_block():
+        run_backfill(
+            op.get_bind(),
+            name="todos_updated_at",
+            table=todos,
+            values={"updated_at": sa.func.current_timestamp()},
+            where=todos.c.updated_at.is_(None),
+            batch_size=5000,
+            sleep=0.05,
+        )
+
+    op.create_index(
+        "ix_todos_user_id_updated_at",
+        "todos",
+        ["user_id", "updated_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_todos_user_id_updated_at", table_name="todos")
+    op.drop_index("ix_todo_tombstones_user_id_deleted_at", table_name="todo_tombstones")
+    op.drop_index(op.f("ix_todo_tombstones_id"), table_name="todo_tombstones")
+    op.drop_table("todo_tombstones")
+    op.drop_column("todos", "updated_at")
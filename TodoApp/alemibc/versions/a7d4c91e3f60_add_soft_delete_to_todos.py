@@ -0,0 +1,89 @@
+"""Add soft delete to todos
+
+Revision ID: a7d4c91e3f60
+Revises: e5a8c3f19d42
+Create Date: 2026-10-19 17:21:43.508914
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a7d4c91e3f60"
+down_revision: Union[str, Sequence[str], None] = "e5a8c3f19d42"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+LIVE = sa.text("deleted_at IS NULL")
+DELETED = sa.text("deleted_at IS NOT NULL")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Nullable with no default, so PostgreSQL adds it without a table rewrite.
+    op.add_column(
+        "todos", sa.Column("deleted_at", sa.DateTime(timezone=True), nullable=True)
+    )
+
+    op.drop_index("ix_todos_user_id_updated_at", table_name="todos")
+    op.create_index(
+        "ix_todos_user_id_updated_at",
+        "todos",
+        ["user_id", "updated_at"],
+        unique=False,
+        postgresql_where=LIVE,
+        sqlite_where=LIVE,
+    )
+    op.drop_index("ix_todos_next_up", table_name="todos")
+    op.create_index(
+        "ix_todos_next_up",
+        "todos",
+        ["user_id", "complete", sa.text("priority DESC"), "id"],
+        unique=False,
+        postgresql_where=LIVE,
+        sqlite_where=LIVE,
+    )
+    op.create_index(
+        "ix_todos_user_id_live",
+        "todos",
+        ["user_id", "id"],
+        unique=False,
+        postgresql_where=LIVE,
+        sqlite_where=LIVE,
+    )
+    op.create_index(
+        "ix_todos_deleted_at",
+        "todos",
+        ["deleted_at"],
+        unique=False,
+        postgresql_where=DELETED,
+        sqlite_where=DELETED,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Soft-deleted rows would reappear once the column is gone.
+    op.execute("DELETE FROM todos WHERE deleted_at IS NOT NULL")
+
+    op.drop_index("ix_todos_deleted_at", table_name="todos")
+    op.drop_index("ix_todos_user_id_live", table_name="todos")
+    op.drop_index("ix_todos_next_up", table_name="todos")
+    op.create_index(
+        "ix_todos_next_up",
+        "todos",
+        ["user_id", "complete", sa.text("priority DESC"), "id"],
+        unique=False,
+    )
+    op.drop_index("ix_todos_user_id_updated_at", table_name="todos")
+    op.create_index(
+        "ix_todos_user_id_updated_at",
+        "todos",
+        ["user_id", "updated_at"],
+        unique=False,
+    )
+    op.drop_column("todos", "deleted_at")
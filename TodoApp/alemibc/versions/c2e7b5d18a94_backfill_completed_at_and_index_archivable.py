@@ -0,0 +1,64 @@
+"""Backfill completed_at and index archivable todos
+
+Revision ID: c2e7b5d18a94
+Revises: a7d4c91e3f60
+Create Date: 2026-10-19 19:02:15.730461
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from backfill import run_backfill
+
+# revision identifiers, used by Alembic.
+revision: str = "c2e7b5d18a94"
+down_revision: Union[str, Sequence[str], None] = "a7d4c91e3f60"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+LIVE = sa.text("deleted_at IS NULL")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    todos = sa.table(
+        "todos",
+        sa.column("id"),
+        sa.column("complete"),
+        sa.column("completed_at"),
+        sa.column("updated_at"),
+    )
+
+    # Todos completed before completed_at existed count as completed when
+    # last changed, so the archiver ages them from there instead of moving
+    # them all on its first run.
+    with op.get_context().autocommit_block():
+        run_backfill(
+            op.get_bind(),
+            name="todos_completed_at",
+            table=todos,
+            values={
+                "completed_at": sa.func.coalesce(
+                    todos.c.updated_at, sa.func.current_timestamp()
+                )
+            },
+            where=sa.and_(todos.c.complete.is_(True), todos.c.completed_at.is_(None)),
+            batch_size=5000,
+            sleep=0.05,
+        )
+
+    op.create_index(
+        "ix_todos_archivable",
+        "todos",
+        ["complete", "completed_at"],
+        unique=False,
+        postgresql_where=LIVE,
+        sqlite_where=LIVE,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_todos_archivable", table_name="todos")
@@ -0,0 +1,34 @@
+"""Add next-up index to todos
+
+Revision ID: e5a8c3f19d42
+Revises: 9b4e2f71c0d5
+Create Date: 2026-10-19 15:02:55.871036
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e5a8c3f19d42"
+down_revision: Union[str, Sequence[str], None] = "9b4e2f71c0d5"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        "ix_todos_next_up",
+        "todos",
+        ["user_id", "complete", sa.text("priority DESC"), "id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_todos_next_up", table_name="todos")
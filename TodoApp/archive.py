@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from sqlalchemy import delete, insert, select
+from .database import SessionLocal, shard_router
+from .models import Todos, TodosArchive
+from .sync import record_tombstones
+
+ARCHIVE_AFTER_DAYS = float(os.getenv("TODO_ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("TODO_ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("TODO_ARCHIVE_INTERVAL_SECONDS", "0"))
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_COLUMNS = [
+    "id",
+    "title",
+    "description",
+    "priority",
+    "complete",
+    "user_id",
+    "completed_at",
+]
+
+
+def archivable(cutoff: datetime):
+    # Todos completed before completed_at was tracked got one from the
+    # migration that added ix_todos_archivable; any still without one are
+    # never archived rather than guessed to be old.
+    return (
+        Todos.deleted_at.is_(None),
+        Todos.complete.is_(True),
+        Todos.completed_at < cutoff,
+    )
+
+
+def archive_batch(db, cutoff: datetime, batch_size: int) -> int:
+    rows = db.execute(
+        select(Todos.id, Todos.user_id)
+        .where(*archivable(cutoff))
+        .order_by(Todos.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+
+    if not rows:
+        return 0
+
+    ids = [row.id for row in rows]
+
+    db.execute(
+        insert(TodosArchive).from_select(
+            ARCHIVED_COLUMNS,
+            select(*[getattr(Todos, name) for name in ARCHIVED_COLUMNS]).where(
+                Todos.id.in_(ids)
+            ),
+        )
+    )
+    db.execute(delete(Todos).where(Todos.id.in_(ids)))
+    # Archived todos drop out of the default listing, so synced clients
+    # should remove them too.
+    record_tombstones(db, [tuple(row) for row in rows])
+    db.commit()
+
+    return len(ids)
+
+
+def archive_completed_todos(
+    session_factory=SessionLocal,
+    older_than: timedelta = timedelta(days=ARCHIVE_AFTER_DAYS),
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    max_batches: Optional[int] = None,
+) -> int:
+    """Move completed todos older than `older_than` into todos_archive, one
+    short transaction per batch, and return how many rows were moved."""
+    cutoff = datetime.now(timezone.utc) - older_than
+    moved = 0
+    batches = 0
+
+    while max_batches is None or batches < max_batches:
+        db = session_factory()
+        try:
+            count = archive_batch(db, cutoff, batch_size)
+        finally:
+            db.close()
+
+        moved += count
+        batches += 1
+
+        if count < batch_size:
+            break
+
+    return moved
+
+
+async def run_archiver(
+    session_factories: Optional[list] = None,
+    interval: float = ARCHIVE_INTERVAL_SECONDS,
+):
+    session_factories = session_factories or shard_router.sessionmakers
+
+    while True:
+        for shard, session_factory in enumerate(session_factories):
+            try:
+                moved = await asyncio.to_thread(
+                    archive_completed_todos, session_factory
+                )
+                logger.info("Archived %d completed todos on shard %d", moved, shard)
+            except Exception:
+                logger.exception("Archiving completed todos failed on shard %d", shard)
+
+        await asyncio.sleep(interval)
@@ -0,0 +1,214 @@
+"""Chunked, resumable data backfills for Alembic revisions.
+
+A revision that has to touch many rows calls `run_backfill` from inside an
+autocommit block, so every chunk is its own short transaction instead of one
+giant UPDATE that holds locks on the whole table::
+
+    from backfill import run_backfill
+
+    def upgrade() -> None:
+        op.add_column("todos", sa.Column("priority_label", sa.String()))
+
+        todos = sa.table("todos", sa.column("id"), sa.column("priority"),
+                         sa.column("priority_label"))
+
+        with op.get_context().autocommit_block():
+            run_backfill(
+                op.get_bind(),
+                name="todos_priority_label",
+                table=todos,
+                values={"priority_label": sa.cast(todos.c.priority, sa.String)},
+                where=todos.c.priority_label.is_(None),
+                batch_size=5000,
+                sleep=0.05,
+            )
+
+Progress is stored in the `backfill_checkpoints` table after every chunk, so
+a run that is interrupted picks up after the last finished key. Updates must
+be idempotent: with autocommit a chunk can be applied without its checkpoint
+being written, and it is then applied again on resume.
+"""
+
+import logging
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Optional, Union
+from sqlalchemy import (
+    Boolean,
+    Column,
+    DateTime,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    func,
+    select,
+    update,
+)
+from sqlalchemy.engine import Connection
+
+logger = logging.getLogger("alembic.backfill")
+
+checkpoint_metadata = MetaData()
+
+checkpoints = Table(
+    "backfill_checkpoints",
+    checkpoint_metadata,
+    Column("name", String, primary_key=True),
+    Column("last_key", Integer),
+    Column("rows_done", Integer, nullable=False, default=0),
+    Column("completed", Boolean, nullable=False, default=False),
+    Column("updated_at", DateTime(timezone=True)),
+)
+
+
+@dataclass
+class BackfillProgress:
+    name: str
+    last_key: Optional[int] = None
+    max_key: Optional[int] = None
+    rows_done: int = 0
+    rows_this_run: int = 0
+    batches: int = 0
+    elapsed: float = 0.0
+    completed: bool = False
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows_this_run / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def percent(self) -> Optional[float]:
+        # Estimated from the key range, which avoids a COUNT(*) over the table.
+        if self.completed:
+            return 100.0
+        if self.last_key is None or not self.max_key:
+            return None
+        return min(100.0, self.last_key / self.max_key * 100)
+
+
+def run_backfill(
+    connection: Connection,
+    name: str,
+    table: Table,
+    values: Union[dict, Callable[[Connection, list], None]],
+    key: str = "id",
+    where=None,
+    batch_size: int = 1000,
+    sleep: float = 0.0,
+    max_batches: Optional[int] = None,
+    progress: Optional[Callable[[BackfillProgress], None]] = None,
+) -> BackfillProgress:
+    """Apply `values` to the rows of `table` matching `where`, walking the
+    integer `key` column in ascending chunks of `batch_size`.
+
+    `values` is either a dict for `UPDATE ... SET` or a callable receiving the
+    connection and the chunk's keys for backfills that need more than one
+    statement. `sleep` pauses between chunks to leave room for live traffic
+    and replication; `max_batches` stops early and leaves the run resumable.
+    """
+    key_column = table.c[key]
+    criteria = [where] if where is not None else []
+
+    with _transaction(connection):
+        checkpoints.create(connection, checkfirst=True)
+        state = connection.execute(
+            select(checkpoints).where(checkpoints.c.name == name)
+        ).first()
+
+        if state is None:
+            connection.execute(checkpoints.insert().values(name=name, rows_done=0))
+
+        max_key = connection.execute(select(func.max(key_column))).scalar()
+
+    report = BackfillProgress(
+        name=name,
+        last_key=state.last_key if state else None,
+        max_key=max_key,
+        rows_done=state.rows_done if state else 0,
+        completed=bool(state and state.completed),
+    )
+
+    if report.completed:
+        logger.info("Backfill %s already completed", name)
+        return report
+
+    started = time.perf_counter()
+
+    while max_batches is None or report.batches < max_batches:
+        with _transaction(connection):
+            chunk = select(key_column).where(*criteria).order_by(key_column)
+
+            if report.last_key is not None:
+                chunk = chunk.where(key_column > report.last_key)
+
+            keys = connection.execute(chunk.limit(batch_size)).scalars().all()
+
+            if keys:
+                if callable(values):
+                    values(connection, keys)
+                else:
+                    connection.execute(
+                        update(table)
+                        .where(key_column >= keys[0], key_column <= keys[-1], *criteria)
+                        .values(values)
+                    )
+
+                report.last_key = keys[-1]
+                report.rows_done += len(keys)
+                report.rows_this_run += len(keys)
+                report.batches += 1
+
+            report.completed = len(keys) < batch_size
+            report.elapsed = time.perf_counter() - started
+
+            connection.execute(
+                checkpoints.update()
+                .where(checkpoints.c.name == name)
+                .values(
+                    last_key=report.last_key,
+                    rows_done=report.rows_done,
+                    completed=report.completed,
+                    updated_at=datetime.now(timezone.utc),
+                )
+            )
+
+        logger.info(
+            "Backfill %s: %d rows, %.0f rows/s, last key %s%s",
+            name,
+            report.rows_done,
+            report.rows_per_second,
+            report.last_key,
+            f" (~{report.percent:.1f}%)" if report.percent is not None else "",
+        )
+
+        if progress is not None:
+            progress(report)
+
+        if report.completed:
+            break
+
+        if sleep:
+            time.sleep(sleep)
+
+    return report
+
+
+@contextmanager
+def _transaction(connection: Connection):
+    # Each chunk gets its own transaction on a plain connection. Inside
+    # Alembic's autocommit_block every statement already commits on its own.
+    if not connection.in_transaction():
+        with connection.begin():
+            yield
+        return
+
+    if connection.get_execution_options().get("isolation_level") != "AUTOCOMMIT":
+        raise RuntimeError(
+            "run_backfill needs its own transactions; call it inside "
+            "op.get_context().autocommit_block()"
+        )
+
+    yield
@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from sqlalchemy import insert
+from .database import shard_router
+from .models import Todos
+
+BATCH_INSERTS_ENABLED = os.getenv("TODO_BATCH_INSERTS", "false").lower() == "true"
+BATCH_MAX_SIZE = int(os.getenv("TODO_BATCH_MAX_SIZE", "100"))
+BATCH_MAX_DELAY_MS = float(os.getenv("TODO_BATCH_MAX_DELAY_MS", "5"))
+
+logger = logging.getLogger(__name__)
+
+
+class BatchMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+        self.failed_batches = 0
+        self.max_batch_size = 0
+        self.total_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+    def record(self, size: int, seconds: float, failed: bool = False):
+        with self._lock:
+            self.batches += 1
+            self.rows += size
+            self.failed_batches += int(failed)
+            self.max_batch_size = max(self.max_batch_size, size)
+            self.total_flush_seconds += seconds
+            self.max_flush_seconds = max(self.max_flush_seconds, seconds)
+
+    @classmethod
+    def combine(cls, metrics: list) -> "BatchMetrics":
+        combined = cls()
+
+        for item in metrics:
+            with item._lock:
+                combined.batches += item.batches
+                combined.rows += item.rows
+                combined.failed_batches += item.failed_batches
+                combined.max_batch_size = max(
+                    combined.max_batch_size, item.max_batch_size
+                )
+                combined.total_flush_seconds += item.total_flush_seconds
+                combined.max_flush_seconds = max(
+                    combined.max_flush_seconds, item.max_flush_seconds
+                )
+
+        return combined
+
+    def snapshot(self):
+        with self._lock:
+            batches = self.batches or 1
+
+            return {
+                "batches": self.batches,
+                "rows": self.rows,
+                "failed_batches": self.failed_batches,
+                "avg_batch_size": self.rows / batches,
+                "max_batch_size": self.max_batch_size,
+                "avg_flush_ms": self.total_flush_seconds / batches * 1000,
+                "max_flush_ms": self.max_flush_seconds * 1000,
+            }
+
+
+class TodoInsertBatcher:
+    """Collects concurrent todo inserts and writes them with one multi-row
+    INSERT and a single commit, flushing every `max_batch_size` rows or
+    `max_delay_ms` milliseconds, whichever comes first."""
+
+    def __init__(
+        self,
+        session_factory,
+        max_batch_size: int = 100,
+        max_delay_ms: float = 5,
+        enabled: bool = True,
+    ):
+        self.session_factory = session_factory
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay_ms / 1000
+        self.enabled = enabled
+        self.metrics = BatchMetrics()
+        self._pending = []
+        # The loop only keeps weak references to tasks, so scheduled flushes
+        # are held here until they finish.
+        self._flushes = set()
+        self._full = None
+        self._flush_lock = None
+        self._flush_lock_loop = None
+
+    async def submit(self, values: dict) -> int:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((values, future))
+
+        if len(self._pending) == 1:
+            self._schedule_flush()
+        elif len(self._pending) >= self.max_batch_size:
+            self._full.set()
+
+        return await future
+
+    def _schedule_flush(self):
+        self._full = asyncio.Event()
+
+        if len(self._pending) >= self.max_batch_size:
+            self._full.set()
+
+        flush = asyncio.ensure_future(self._flush_after_delay(self._full))
+        self._flushes.add(flush)
+        flush.add_done_callback(self._flush_done)
+
+    def _flush_done(self, flush: asyncio.Future):
+        self._flushes.discard(flush)
+
+        if not flush.cancelled() and flush.exception() is not None:
+            logger.error("Todo insert flush failed", exc_info=flush.exception())
+
+    async def _flush_after_delay(self, full: asyncio.Event):
+        try:
+            await asyncio.wait_for(full.wait(), self.max_delay)
+        except asyncio.TimeoutError:
+            pass
+
+        # Only one flush writes at a time; rows that arrive while it runs
+        # pile up and go out together in the next group commit.
+        async with self._get_flush_lock():
+            batch = self._pending[: self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size :]
+
+            if self._pending:
+                self._schedule_flush()
+
+            if not batch:
+                return
+
+            try:
+                results = await asyncio.to_thread(
+                    self._write, [values for values, _ in batch]
+                )
+            except Exception as exc:
+                # Waiters get the error rather than hang on their futures.
+                results = [exc] * len(batch)
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _get_flush_lock(self):
+        loop = asyncio.get_running_loop()
+
+        if self._flush_lock_loop is not loop:
+            self._flush_lock = asyncio.Lock()
+            self._flush_lock_loop = loop
+
+        return self._flush_lock
+
+    def _write(self, rows: list):
+        started = time.perf_counter()
+
+        try:
+            results = self._insert(rows)
+            failed = False
+        except Exception:
+            # One bad row must not fail the whole group, so retry each row on
+            # its own and hand every waiter its own result or error.
+            results = [self._insert_one(row) for row in rows]
+            failed = True
+
+        self.metrics.record(len(rows), time.perf_counter() - started, failed)
+
+        return results
+
+    def _insert(self, rows: list):
+        db = self.session_factory()
+        try:
+            ids = (
+                db.execute(
+                    insert(Todos).returning(Todos.id, sort_by_parameter_order=True),
+                    rows,
+                )
+                .scalars()
+                .all()
+            )
+            db.commit()
+
+            return ids
+        finally:
+            db.close()
+
+    def _insert_one(self, row: dict):
+        try:
+            return self._insert([row])[0]
+        except Exception as exc:
+            return exc
+
+
+# One batcher per shard: a batch is a single INSERT, so it can only hold rows
+# that live in the same database.
+todo_batchers = [
+    TodoInsertBatcher(
+        session_factory,
+        max_batch_size=BATCH_MAX_SIZE,
+        max_delay_ms=BATCH_MAX_DELAY_MS,
+        enabled=BATCH_INSERTS_ENABLED,
+    )
+    for session_factory in shard_router.sessionmakers
+]
+
+
+def batcher_for(user_id: int) -> TodoInsertBatcher:
+    return todo_batchers[shard_router.shard_id(user_id)]
+
+
+def batcher_metrics() -> dict:
+    return BatchMetrics.combine(
+        [batcher.metrics for batcher in todo_batchers]
+    ).snapshot()
@@ -0,0 +1,104 @@
+"""Compare response compression encodings and levels.
+
+Run from the repository root:
+
+    python -m TodoApp.benchmarks.compression --todos 1000 10000
+
+Brotli and zstd rows appear when the optional `brotli` and `zstandard`
+packages are installed.
+"""
+
+import argparse
+import json
+import os
+import time
+
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite://")
+
+from jinja2 import Environment, FileSystemLoader
+from ..compression import BrotliCompressor, GzipCompressor, ZstdCompressor
+from ..compression import brotli, zstandard
+from ..seed import DatasetSpec, generate_todos
+
+TEMPLATES = os.path.join(os.path.dirname(__file__), "..", "templates")
+
+LEVELS = {
+    "gzip": (GzipCompressor, [1, 5, 6, 9]),
+    "br": (BrotliCompressor, [1, 4, 6, 11]),
+    "zstd": (ZstdCompressor, [1, 3, 9, 19]),
+}
+
+
+def payloads(todos: int) -> dict:
+    spec = DatasetSpec(users=1, todos_per_user=todos)
+    rows = list(generate_todos(spec, range(1, 2), 1))[:todos]
+    # The Pareto draw can come up short; repeat rows to reach the size asked.
+    rows = (rows * (todos // max(1, len(rows)) + 1))[:todos]
+
+    environment = Environment(loader=FileSystemLoader(TEMPLATES))
+    environment.globals["url_for"] = lambda name, path: f"/{name}{path}"
+    html = environment.get_template("todo.html").render(
+        request=None, user={"username": "bench"}, todos=rows, page=None, offset=0
+    )
+
+    return {
+        "json": json.dumps(rows, default=str).encode(),
+        "html": html.encode(),
+    }
+
+
+def measure(compressor_class, level: int, body: bytes, repeat: int):
+    best = float("inf")
+
+    for _ in range(repeat):
+        started = time.perf_counter()
+        compressor = compressor_class(level)
+        data = compressor.compress(body) + compressor.finish()
+        best = min(best, time.perf_counter() - started)
+
+    return best, len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--todos", type=int, nargs="+", default=[1_000, 10_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--link-mbps",
+        type=float,
+        default=10.0,
+        help="link speed used to estimate total response time",
+    )
+    args = parser.parse_args()
+
+    available = {"gzip": True, "br": brotli is not None, "zstd": zstandard is not None}
+    link = args.link_mbps * 1_000_000 / 8
+
+    print(
+        f"{'todos':>7} {'body':<5} {'enc':<5} {'level':>5} {'KiB':>8} {'saved':>7} "
+        f"{'ms':>8} {'MB/s':>8} {'ms@link':>8}"
+    )
+
+    for todos in args.todos:
+        for kind, body in payloads(todos).items():
+            print(
+                f"{todos:>7} {kind:<5} {'none':<5} {'-':>5} {len(body) / 1024:>8.1f} "
+                f"{0:>6.0%} {0:>8.2f} {'-':>8} {len(body) / link * 1000:>8.1f}"
+            )
+
+            for encoding, (compressor_class, levels) in LEVELS.items():
+                if not available[encoding]:
+                    continue
+
+                for level in levels:
+                    seconds, size = measure(compressor_class, level, body, args.repeat)
+                    print(
+                        f"{todos:>7} {kind:<5} {encoding:<5} {level:>5} "
+                        f"{size / 1024:>8.1f} {1 - size / len(body):>6.0%} "
+                        f"{seconds * 1000:>8.2f} {len(body) / seconds / 1e6:>8.0f} "
+                        f"{(seconds + size / link) * 1000:>8.1f}"
+                    )
+
+
+if __name__ == "__main__":
+    main()
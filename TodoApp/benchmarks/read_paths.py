@@ -0,0 +1,98 @@
+"""Compare the ORM read path with the column/DTO read path.
+
+Run from the repository root:
+
+    python -m TodoApp.benchmarks.read_paths --rows 10000 100000
+"""
+
+import argparse
+import os
+import time
+import tracemalloc
+
+os.environ.setdefault("SQLALCHEMY_DATABASE_URL", "sqlite://")
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from ..models import Base, Todos
+from ..readers import read_todos
+
+
+def orm_path(db, user_id):
+    return db.query(Todos).filter(Todos.user_id == user_id).all()
+
+
+def dto_path(db, user_id):
+    return read_todos(db, Todos.user_id == user_id)
+
+
+def seed(session_factory, rows: int):
+    db = session_factory()
+    db.execute(
+        insert(Todos),
+        [
+            {
+                "title": f"Todo {i}",
+                "description": "Benchmark description " * 3,
+                "priority": i % 5 + 1,
+                "complete": i % 3 == 0,
+                "user_id": 1,
+            }
+            for i in range(rows)
+        ],
+    )
+    db.commit()
+    db.close()
+
+
+def measure(session_factory, read, encode: bool, repeat: int):
+    best = float("inf")
+    peak = 0
+
+    for _ in range(repeat):
+        db = session_factory()
+        tracemalloc.start()
+        started = time.perf_counter()
+
+        result = read(db, 1)
+        if encode:
+            jsonable_encoder(result)
+
+        elapsed = time.perf_counter() - started
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        db.close()
+        best = min(best, elapsed)
+
+    return best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'path':<5} {'stage':<12} {'best ms':>10} {'peak MiB':>10}")
+
+    for rows in args.rows:
+        engine = create_engine("sqlite://", poolclass=StaticPool)
+        Base.metadata.create_all(bind=engine)
+        session_factory = sessionmaker(autoflush=False, bind=engine)
+        seed(session_factory, rows)
+
+        for encode, stage in ((False, "fetch"), (True, "fetch+json")):
+            for name, read in (("orm", orm_path), ("dto", dto_path)):
+                seconds, peak = measure(session_factory, read, encode, args.repeat)
+                print(
+                    f"{rows:>8} {name:<5} {stage:<12} "
+                    f"{seconds * 1000:>10.1f} {peak / 2**20:>10.1f}"
+                )
+
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
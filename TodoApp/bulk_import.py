@@ -0,0 +1,105 @@
+import csv
+import itertools
+import json
+from typing import BinaryIO, Iterator, Optional
+
+FORMATS = {
+    ".csv": "csv",
+    "text/csv": "csv",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str]):
+    for hint in (content_type, (filename or "").lower()):
+        for key, format in FORMATS.items():
+            if hint and (hint == key or hint.endswith(key)):
+                return format
+
+    return None
+
+
+def decode_lines(file: BinaryIO, bad_lines: set) -> Iterator[str]:
+    """Decode `file` line by line. Lines that are not UTF-8 are decoded with
+    replacement characters and their numbers added to `bad_lines`, so one
+    bad byte rejects its record rather than the whole upload."""
+    for line_number, raw in enumerate(file, start=1):
+        if line_number == 1:
+            raw = raw.removeprefix(b"\xef\xbb\xbf")
+
+        try:
+            yield raw.decode("utf-8")
+        except UnicodeDecodeError:
+            bad_lines.add(line_number)
+            yield raw.decode("utf-8", errors="replace")
+
+
+def iter_records(file: BinaryIO, format: str) -> Iterator[tuple]:
+    """Yield `(line_number, record, error)` for every record in `file`,
+    reading it line by line so memory stays flat whatever the file size.
+    `line_number` is the first line of the record, even when a quoted CSV
+    field spans several lines."""
+    bad_lines = set()
+    lines = decode_lines(file, bad_lines)
+
+    if format == "csv":
+        yield from iter_csv_records(lines, bad_lines)
+        return
+
+    for line_number, line in enumerate(lines, start=1):
+        if line_number in bad_lines:
+            yield line_number, None, "Invalid UTF-8"
+            continue
+
+        if not line.strip():
+            continue
+
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            yield line_number, None, f"Invalid JSON: {exc}"
+            continue
+
+        if not isinstance(record, dict):
+            yield line_number, None, "Expected a JSON object"
+            continue
+
+        yield line_number, record, None
+
+
+def iter_csv_records(lines: Iterator[str], bad_lines: set) -> Iterator[tuple]:
+    reader = csv.reader(lines)
+    header = None
+    first_line = 1
+
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as exc:
+            yield first_line, None, f"Invalid CSV: {exc}"
+
+            if reader.line_num < first_line:
+                return  # Nothing was consumed; the rest cannot be read.
+
+            first_line = reader.line_num + 1
+            continue
+
+        start, first_line = first_line, reader.line_num + 1
+
+        if not row:
+            continue
+
+        if header is None:
+            header = row
+            continue
+
+        if bad_lines.intersection(range(start, reader.line_num + 1)):
+            yield start, None, "Invalid UTF-8"
+            continue
+
+        yield start, dict(itertools.zip_longest(header, row[: len(header)])), None
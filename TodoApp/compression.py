@@ -0,0 +1,280 @@
+import asyncio
+import os
+import zlib
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_ENABLED = os.getenv("TODO_COMPRESSION", "true").lower() == "true"
+COMPRESSION_MIN_SIZE = int(os.getenv("TODO_COMPRESSION_MIN_SIZE", "1024"))
+# Preferred first when the client accepts several equally.
+COMPRESSION_ENCODINGS = os.getenv("TODO_COMPRESSION_ENCODINGS", "zstd,br,gzip")
+# Levels trade CPU per response for bytes on the wire; see
+# `python -m TodoApp.benchmarks.compression`.
+GZIP_LEVEL = int(os.getenv("TODO_GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.getenv("TODO_BROTLI_QUALITY", "4"))
+ZSTD_LEVEL = int(os.getenv("TODO_ZSTD_LEVEL", "3"))
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+# Chunks at least this big are compressed off the event loop; zlib, brotli
+# and zstd all release the GIL while they work.
+THREAD_OFFLOAD_SIZE = 64 * 1024
+
+
+class GzipCompressor:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdCompressor:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+def available_encodings() -> dict:
+    encodings = {"gzip": lambda: GzipCompressor(GZIP_LEVEL)}
+
+    if brotli is not None:
+        encodings["br"] = lambda: BrotliCompressor(BROTLI_QUALITY)
+    if zstandard is not None:
+        encodings["zstd"] = lambda: ZstdCompressor(ZSTD_LEVEL)
+
+    return encodings
+
+
+def negotiate(accept_encoding: str, preferred: list) -> Optional[str]:
+    """The encoding from `preferred` with the highest q-value in the
+    Accept-Encoding header; ties go to the earlier entry of `preferred`."""
+    weights = {}
+
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        weight = 1.0
+
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+
+        if name:
+            weights[name.strip()] = weight
+
+    best, best_weight = None, 0.0
+
+    for encoding in preferred:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+
+    return best
+
+
+def compressible(message) -> bool:
+    headers = {
+        key.lower(): value.decode("latin-1")
+        for key, value in message.get("headers", [])
+    }
+    content_type = headers.get(b"content-type", "").split(";")[0].strip()
+
+    return (
+        message["status"] not in (204, 304)
+        and b"content-encoding" not in headers
+        and content_type.startswith(COMPRESSIBLE_TYPES)
+    )
+
+
+def with_vary(message, drop: tuple = ()) -> list:
+    """Returns the response headers with Accept-Encoding merged into Vary,
+    leaving out any header named in `drop`."""
+    headers = []
+    vary = []
+
+    for key, value in message.get("headers", []):
+        if key.lower() == b"vary":
+            vary.append(value)
+        elif key.lower() not in drop:
+            headers.append((key, value))
+
+    varies = [field.strip().lower() for value in vary for field in value.split(b",")]
+    if b"accept-encoding" not in varies and b"*" not in varies:
+        vary.append(b"Accept-Encoding")
+    headers.append((b"vary", b", ".join(vary)))
+
+    return headers
+
+
+class CompressionMiddleware:
+    """Compresses compressible responses of at least `minimum_size` bytes
+    with gzip, brotli or zstd, whichever the client prefers and is
+    installed. Streaming responses are compressed and flushed chunk by
+    chunk, so rows still reach the browser as they are rendered."""
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = COMPRESSION_MIN_SIZE,
+        encodings: str = COMPRESSION_ENCODINGS,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compressors = available_encodings()
+        self.preferred = [
+            encoding.strip()
+            for encoding in encodings.split(",")
+            if encoding.strip() in self.compressors
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        encoding = negotiate(
+            headers.get(b"accept-encoding", b"").decode("latin-1"), self.preferred
+        )
+
+        if encoding is None:
+            # Caches still need to know the body would differ for other clients.
+            async def send_with_vary(message):
+                if message["type"] == "http.response.start" and compressible(message):
+                    message = {**message, "headers": with_vary(message)}
+                await send(message)
+
+            return await self.app(scope, receive, send_with_vary)
+
+        responder = CompressedResponder(
+            send, self.compressors[encoding], encoding, self.minimum_size
+        )
+        await self.app(scope, receive, responder)
+
+
+class CompressedResponder:
+    def __init__(self, send, new_compressor, encoding: str, minimum_size: int):
+        self.send = send
+        self.new_compressor = new_compressor
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start = None
+        self.compressor = None
+        self.passthrough = False
+        self.buffer = []
+        self.buffered = 0
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            self.passthrough = not compressible(message)
+
+            if self.passthrough:
+                await self.send(message)
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            return await self.send(message)
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is not None:
+            return await self.send_compressed(body, more_body)
+
+        self.buffer.append(body)
+        self.buffered += len(body)
+
+        if self.buffered < self.minimum_size:
+            if more_body:
+                return
+            # The whole response turned out small: send it as it was.
+            self.passthrough = True
+            await self.send({**self.start, "headers": with_vary(self.start)})
+            return await self.send(
+                {"type": "http.response.body", "body": b"".join(self.buffer)}
+            )
+
+        body, self.buffer = b"".join(self.buffer), []
+        self.compressor = self.new_compressor()
+        data = await self.compress(body, more_body)
+        # A response sent in one piece keeps an exact Content-Length.
+        length = None if more_body else len(data)
+
+        await self.send({**self.start, "headers": self.compressed_headers(length)})
+        await self.send(
+            {"type": "http.response.body", "body": data, "more_body": more_body}
+        )
+
+    def compressed_headers(self, length: Optional[int]) -> list:
+        headers = with_vary(self.start, drop=(b"content-length",))
+        headers.append((b"content-encoding", self.encoding.encode()))
+
+        if length is not None:
+            headers.append((b"content-length", str(length).encode()))
+
+        return headers
+
+    async def send_compressed(self, body: bytes, more_body: bool):
+        data = await self.compress(body, more_body)
+
+        await self.send(
+            {"type": "http.response.body", "body": data, "more_body": more_body}
+        )
+
+    async def compress(self, body: bytes, more_body: bool) -> bytes:
+        if len(body) >= THREAD_OFFLOAD_SIZE:
+            return await asyncio.to_thread(self.compress_chunk, body, more_body)
+
+        return self.compress_chunk(body, more_body)
+
+    def compress_chunk(self, body: bytes, more_body: bool) -> bytes:
+        data = self.compressor.compress(body) if body else b""
+
+        if not more_body:
+            data += self.compressor.finish()
+
+        return data
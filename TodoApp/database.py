@@ -1,14 +1,354 @@
 from dotenv import load_dotenv
+import bisect
+import itertools
+import logging
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.pool import NullPool
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Connection pool per engine. The launcher sets these for each worker from
+# TODO_DB_CONNECTION_BUDGET; unset means SQLAlchemy's defaults.
+DB_POOL_SIZE = os.getenv("TODO_DB_POOL_SIZE")
+DB_MAX_OVERFLOW = os.getenv("TODO_DB_MAX_OVERFLOW")
+
+
+def new_engine(url: str):
+    options = {}
+
+    if not url.startswith("sqlite"):
+        if DB_POOL_SIZE:
+            options["pool_size"] = int(DB_POOL_SIZE)
+        if DB_MAX_OVERFLOW:
+            options["max_overflow"] = int(DB_MAX_OVERFLOW)
+
+    return create_engine(url, **options)
+
+
 # Local testing "postgresql://will@localhost:5432/todos_app"
 SQLALCHEMY_DATABASE_URL = os.getenv("SQLALCHEMY_DATABASE_URL")
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+engine = new_engine(SQLALCHEMY_DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
+
+# Todos can be spread over several databases by user_id. Users stay in the
+# database above, which doubles as the directory for logins and user ids.
+# Comma separated, e.g. "sqlite:///./shard0.db,sqlite:///./shard1.db".
+SQLALCHEMY_SHARD_URLS = [
+    url.strip()
+    for url in os.getenv("SQLALCHEMY_SHARD_URLS", "").split(",")
+    if url.strip()
+]
+# "hash" spreads users evenly; "range" uses TODO_SHARD_RANGES, the ascending
+# upper user_id bounds of every shard but the last, e.g. "100000,200000".
+SHARD_STRATEGY = os.getenv("TODO_SHARD_STRATEGY", "hash")
+SHARD_RANGES = [
+    int(bound) for bound in os.getenv("TODO_SHARD_RANGES", "").split(",") if bound
+]
+
+
+def hash_strategy(shard_count: int) -> Callable[[int], int]:
+    return lambda user_id: zlib.crc32(str(user_id).encode()) % shard_count
+
+
+def range_strategy(bounds: list) -> Callable[[int], int]:
+    return lambda user_id: bisect.bisect_left(bounds, user_id)
+
+
+class ShardRouter:
+    def __init__(self, engines: list, shard_for: Callable[[int], int], directory):
+        self.engines = engines
+        self.directory = directory
+        self.sessionmakers = [
+            sessionmaker(autocommit=False, autoflush=False, bind=shard_engine)
+            for shard_engine in engines
+        ]
+        self.shard_for = shard_for
+
+    @property
+    def sharded(self) -> bool:
+        return self.engines != [self.directory]
+
+    def shard_id(self, user_id: Optional[int]) -> int:
+        return self.shard_for(user_id) if user_id is not None else 0
+
+    def session_for(self, user_id: Optional[int]) -> Session:
+        return self.sessionmakers[self.shard_id(user_id)]()
+
+    @contextmanager
+    def shard_sessions(self, db: Session, user_id: Optional[int] = None):
+        """One session per shard, or only the user's shard when `user_id` is
+        given; with a single shard that is just `db`."""
+        if not self.sharded:
+            yield [db]
+            return
+
+        if user_id is not None:
+            sessions = [self.session_for(user_id)]
+        else:
+            sessions = [session_factory() for session_factory in self.sessionmakers]
+        try:
+            yield sessions
+        finally:
+            for session in sessions:
+                session.close()
+
+    def fan_out(self, db: Session, query: Callable[[Session], list]) -> list:
+        """Run `query` against every shard and concatenate the results. With
+        a single shard it simply runs on `db`, the request's own session."""
+        if not self.sharded:
+            return query(db)
+
+        def run(session_factory):
+            shard_db = session_factory()
+            try:
+                return query(shard_db)
+            finally:
+                shard_db.close()
+
+        with ThreadPoolExecutor(max_workers=len(self.sessionmakers)) as pool:
+            return [row for rows in pool.map(run, self.sessionmakers) for row in rows]
+
+
+def build_shard_router() -> ShardRouter:
+    if not SQLALCHEMY_SHARD_URLS:
+        return ShardRouter([engine], lambda user_id: 0, engine)
+
+    engines = [
+        engine if url == SQLALCHEMY_DATABASE_URL else new_engine(url)
+        for url in SQLALCHEMY_SHARD_URLS
+    ]
+
+    if SHARD_STRATEGY == "range":
+        if len(SHARD_RANGES) != len(engines) - 1:
+            raise ValueError("TODO_SHARD_RANGES needs one bound less than shards")
+        return ShardRouter(engines, range_strategy(SHARD_RANGES), engine)
+
+    return ShardRouter(engines, hash_strategy(len(engines)), engine)
+
+
+shard_router = build_shard_router()
+
+
+# Read-only requests can be served by replicas of the main database.
+# Comma separated, e.g. "postgresql://replica1/todos,postgresql://replica2/todos".
+SQLALCHEMY_REPLICA_URLS = [
+    url.strip()
+    for url in os.getenv("SQLALCHEMY_REPLICA_URLS", "").split(",")
+    if url.strip()
+]
+# After a write the user reads from the primary for this long, so they see
+# their own change even while replicas catch up.
+REPLICA_STICKY_SECONDS = float(os.getenv("TODO_REPLICA_STICKY_SECONDS", "5"))
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("TODO_REPLICA_MAX_LAG_SECONDS", "10"))
+REPLICA_CHECK_INTERVAL_SECONDS = float(
+    os.getenv("TODO_REPLICA_CHECK_INTERVAL_SECONDS", "5")
+)
+# Health checks give up on a replica after this long.
+REPLICA_PROBE_TIMEOUT_SECONDS = float(
+    os.getenv("TODO_REPLICA_PROBE_TIMEOUT_SECONDS", "2")
+)
+
+# The window above also travels with the client, so it holds whichever
+# worker process serves the next request. Set per request by
+# `StickinessMiddleware`: "read_until" is the client's marker, and
+# "written_until" is filled in when the request commits a write. Both are
+# wall-clock times.
+request_stickiness: ContextVar[Optional[dict]] = ContextVar(
+    "request_stickiness", default=None
+)
+
+READ_ONLY_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+REPLICA_LAG_SQL = {
+    "postgresql": text(
+        "SELECT CASE WHEN NOT pg_is_in_recovery() "
+        "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+    ),
+}
+
+
+def probe_engine(replica, timeout: float = REPLICA_PROBE_TIMEOUT_SECONDS):
+    """An unpooled engine for health checks of `replica`, so a hung replica
+    costs a check at most `timeout` seconds."""
+    connect_args = {}
+
+    if replica.dialect.name == "postgresql":
+        connect_args = {
+            "connect_timeout": max(1, round(timeout)),
+            "options": f"-c statement_timeout={int(timeout * 1000)}",
+        }
+
+    return create_engine(replica.url, poolclass=NullPool, connect_args=connect_args)
+
+
+def replica_lag(replica) -> float:
+    """Seconds the replica is behind its primary; 0 where the dialect has no
+    way to tell. Raises if the replica cannot be reached."""
+    with replica.connect() as connection:
+        query = REPLICA_LAG_SQL.get(replica.dialect.name, text("SELECT 0"))
+        return float(connection.scalar(query) or 0)
+
+
+class ReplicaRouter:
+    def __init__(
+        self,
+        primary,
+        replicas: list,
+        sticky_seconds: float = 5,
+        max_lag_seconds: float = 10,
+        check_interval: float = 5,
+    ):
+        self.primary = primary
+        self.replicas = replicas
+        self.sticky_seconds = sticky_seconds
+        self.max_lag_seconds = max_lag_seconds
+        self.check_interval = check_interval
+        self.sessionmakers = {
+            db_engine: sessionmaker(autocommit=False, autoflush=False, bind=db_engine)
+            for db_engine in [primary, *replicas]
+        }
+        self._probes = {replica: probe_engine(replica) for replica in replicas}
+        self._lock = threading.Lock()
+        self._healthy = []
+        self._checked_at = None
+        self._checking = False
+        self._next = itertools.count()
+        self._recent_writes = {}
+
+    def mark_write(self, user_id: Optional[int]):
+        if user_id is None or not self.replicas:
+            return
+
+        now = time.monotonic()
+        stickiness = request_stickiness.get()
+
+        if stickiness is not None:
+            stickiness["written_until"] = time.time() + self.sticky_seconds
+
+        with self._lock:
+            if len(self._recent_writes) > 10_000:
+                self._recent_writes = {
+                    key: until
+                    for key, until in self._recent_writes.items()
+                    if until > now
+                }
+            self._recent_writes[user_id] = now + self.sticky_seconds
+
+    def is_sticky(self, user_id: Optional[int]) -> bool:
+        if self._recent_writes.get(user_id, 0) > time.monotonic():
+            return True
+
+        # A write seen by another worker; a marker further out than one
+        # window cannot come from us and is not trusted.
+        stickiness = request_stickiness.get()
+        now = time.time()
+        read_until = (stickiness or {}).get("read_until", 0)
+
+        return now < read_until <= now + self.sticky_seconds
+
+    def healthy_replicas(self) -> list:
+        """Replicas that answered and are within `max_lag_seconds`, checked at
+        most every `check_interval` seconds. The check runs outside the lock
+        and by one caller at a time; the others use the last result."""
+        with self._lock:
+            now = time.monotonic()
+            due = (
+                self._checked_at is None
+                or now - self._checked_at >= self.check_interval
+            )
+
+            if not due or self._checking:
+                return self._healthy
+
+            self._checking = True
+
+        healthy = []
+        try:
+            healthy = [
+                replica for replica in self.replicas if self._is_healthy(replica)
+            ]
+        finally:
+            with self._lock:
+                self._healthy = healthy
+                self._checked_at = time.monotonic()
+                self._checking = False
+
+        return healthy
+
+    def _is_healthy(self, replica) -> bool:
+        try:
+            lag = replica_lag(self._probes[replica])
+        except Exception:
+            logger.warning("Replica %s is unreachable", replica.url, exc_info=True)
+            return False
+
+        if lag > self.max_lag_seconds:
+            logger.warning("Replica %s is %.1fs behind", replica.url, lag)
+            return False
+
+        return True
+
+    def engine_for(self, read_only: bool, user_id: Optional[int] = None):
+        if not read_only or not self.replicas or self.is_sticky(user_id):
+            return self.primary
+
+        healthy = self.healthy_replicas()
+
+        if not healthy:
+            return self.primary
+
+        return healthy[next(self._next) % len(healthy)]
+
+    def session(self, read_only: bool, user_id: Optional[int] = None) -> Session:
+        return self.sessionmakers[self.engine_for(read_only, user_id)]()
+
+
+replica_router = ReplicaRouter(
+    engine,
+    [new_engine(url) for url in SQLALCHEMY_REPLICA_URLS],
+    sticky_seconds=REPLICA_STICKY_SECONDS,
+    max_lag_seconds=REPLICA_MAX_LAG_SECONDS,
+    check_interval=REPLICA_CHECK_INTERVAL_SECONDS,
+)
+
+
+def open_session(
+    user_id: Optional[int], read_only: bool, sharded: bool = False
+) -> Session:
+    """A session for one request. Todos (`sharded`) go to the user's shard
+    when sharding is on; everything else reads from a replica when it can."""
+    if sharded and shard_router.sharded:
+        db = shard_router.session_for(user_id)
+    else:
+        db = replica_router.session(read_only, user_id)
+
+    if not read_only:
+        # Marked as soon as a commit succeeds, before the response is sent,
+        # and never for writes that failed.
+        event.listen(
+            db, "after_commit", lambda session: replica_router.mark_write(user_id)
+        )
+
+    return db
+
+
+def dispose_engines():
+    """Drop pooled connections inherited from the parent after a fork,
+    without closing them under the parent's feet."""
+    for db_engine in {engine, *shard_router.engines, *replica_router.replicas}:
+        db_engine.dispose(close=False)
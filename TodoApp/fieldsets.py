@@ -0,0 +1,67 @@
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+
+def resolve_fields(model, fields: Optional[str], hidden: tuple = ()):
+    """Turn a `fields=id,title` query value into the model columns to select.
+
+    Returns None when no fieldset was requested and every visible column
+    should be returned."""
+    visible = [
+        column.key for column in model.__table__.columns if column.key not in hidden
+    ]
+
+    if fields is None:
+        return None
+
+    names = list(
+        dict.fromkeys(name.strip() for name in fields.split(",") if name.strip())
+    )
+    unknown = [name for name in names if name not in visible]
+
+    if not names or unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid fields: {', '.join(unknown) or fields}. "
+            f"Allowed fields: {', '.join(visible)}",
+        )
+
+    return [getattr(model, name) for name in names]
+
+
+def columns_of(model, columns: list):
+    return [getattr(model, column.key) for column in columns]
+
+
+def resolve_sort(model, sort: Optional[str], allowed: dict):
+    """Turn a `sort=-priority,title` query value into ORDER BY clauses.
+
+    `allowed` whitelists the sortable names and maps each to the model
+    attribute it sorts by."""
+    if sort is None:
+        return []
+
+    order_by = []
+
+    for name in (name.strip() for name in sort.split(",")):
+        column = name.lstrip("-")
+
+        if column not in allowed:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid sort: {name or sort}. "
+                f"Allowed sort fields: {', '.join(allowed)}",
+            )
+
+        expression = getattr(model, allowed[column])
+        order_by.append(expression.desc() if name.startswith("-") else expression)
+
+    return order_by
+
+
+def select_fields(db: Session, columns: list, *criteria, order_by=()):
+    query = select(*columns).where(*criteria).order_by(*order_by)
+
+    return [row._asdict() for row in db.execute(query)]
@@ -0,0 +1,290 @@
+"""Production entry point: a pre-fork master running uvicorn workers.
+
+Run from the repository root:
+
+    python -m TodoApp.launcher --workers 4 --port 8000
+
+The app is imported once in the master and the workers are forked from it,
+so they share its memory copy-on-write. Each worker gets an equal slice of
+TODO_DB_CONNECTION_BUDGET per database, is replaced after
+TODO_WORKER_MAX_REQUESTS requests or TODO_WORKER_MAX_RSS_MB of memory, and
+finishes in-flight requests when the master gets SIGTERM.
+"""
+
+import argparse
+import gc
+import logging
+import os
+import random
+import signal
+import socket
+import time
+from typing import Optional
+
+WORKERS = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+# Connections each database may receive from all workers together; 0 leaves
+# SQLAlchemy's per-process defaults in place.
+DB_CONNECTION_BUDGET = int(os.getenv("TODO_DB_CONNECTION_BUDGET", "0"))
+WORKER_MAX_REQUESTS = int(os.getenv("TODO_WORKER_MAX_REQUESTS", "0"))
+WORKER_MAX_REQUESTS_JITTER = int(os.getenv("TODO_WORKER_MAX_REQUESTS_JITTER", "0"))
+WORKER_MAX_RSS_MB = float(os.getenv("TODO_WORKER_MAX_RSS_MB", "0"))
+GRACEFUL_TIMEOUT_SECONDS = float(os.getenv("TODO_GRACEFUL_TIMEOUT_SECONDS", "30"))
+
+# Workers that die this soon after starting are restarted with a delay, so a
+# broken deploy does not turn into a fork loop.
+MIN_WORKER_LIFETIME_SECONDS = 1.0
+
+logger = logging.getLogger("todoapp.launcher")
+
+
+def pool_sizes(budget: int, workers: int) -> dict:
+    """Each worker's share of `budget` connections to one database: two
+    thirds kept open in the pool, the rest as overflow for bursts."""
+    if budget < workers:
+        raise ValueError(
+            f"A budget of {budget} connections cannot give {workers} workers one each"
+        )
+
+    share = budget // workers
+    pool_size = max(1, share * 2 // 3)
+
+    return {"pool_size": pool_size, "max_overflow": share - pool_size}
+
+
+def max_requests_for(
+    limit: int, jitter: int, rng: random.Random = random
+) -> Optional[int]:
+    # The jitter staggers restarts so workers do not all recycle at once.
+    if limit <= 0:
+        return None
+
+    return limit + rng.randint(0, max(0, jitter))
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    return sock
+
+
+def load_app():
+    from .main import app
+
+    return app
+
+
+class Master:
+    def __init__(
+        self,
+        workers: int,
+        host: str,
+        port: int,
+        preload: bool = True,
+        max_requests: int = 0,
+        max_requests_jitter: int = 0,
+        max_rss_mb: float = 0,
+        graceful_timeout: float = 30,
+    ):
+        self.worker_count = workers
+        self.host = host
+        self.port = port
+        self.preload = preload
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.max_rss = max_rss_mb * 1024 * 1024
+        self.graceful_timeout = graceful_timeout
+        self.app = None
+        self.sock = None
+        self.workers = {}
+        self.started = {}
+        self.retiring = set()
+        self.stopping = False
+
+    def run(self):
+        self.sock = bind_socket(self.host, self.port)
+
+        if self.preload:
+            self.app = load_app()
+            # Objects created so far never change; keeping them out of the
+            # collector stops it from touching and un-sharing their pages.
+            gc.freeze()
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        for slot in range(self.worker_count):
+            self.spawn(slot)
+
+        logger.info(
+            "Serving on %s:%d with %d workers", self.host, self.port, self.worker_count
+        )
+
+        while not self.stopping:
+            self.reap()
+            self.retire_bloated()
+            time.sleep(0.5)
+
+        self.shutdown()
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def spawn(self, slot: int):
+        pid = os.fork()
+
+        if pid == 0:
+            code = 0
+            try:
+                self.run_worker(slot)
+            except BaseException:
+                logger.exception("Worker %d crashed", slot)
+                code = 1
+            finally:
+                os._exit(code)
+
+        self.workers[pid] = slot
+        self.started[pid] = time.monotonic()
+
+    def run_worker(self, slot: int):
+        import uvicorn
+
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        # The archiver and purger only need to run once per host.
+        os.environ["TODO_BACKGROUND_JOBS"] = "true" if slot == 0 else "false"
+
+        if self.preload:
+            from .database import dispose_engines
+
+            dispose_engines()
+
+        config = uvicorn.Config(
+            self.app or load_app(),
+            limit_max_requests=max_requests_for(
+                self.max_requests, self.max_requests_jitter
+            ),
+            timeout_graceful_shutdown=max(1, int(self.graceful_timeout) - 1),
+        )
+        uvicorn.Server(config).run(sockets=[self.sock])
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+
+            if pid == 0:
+                return
+
+            slot = self.workers.pop(pid, None)
+            lifetime = time.monotonic() - self.started.pop(pid, time.monotonic())
+            self.retiring.discard(pid)
+
+            if slot is None:
+                continue
+
+            logger.info(
+                "Worker %d (pid %d) exited with %d",
+                slot,
+                pid,
+                os.waitstatus_to_exitcode(status),
+            )
+
+            if self.stopping:
+                continue
+
+            if lifetime < MIN_WORKER_LIFETIME_SECONDS:
+                time.sleep(MIN_WORKER_LIFETIME_SECONDS)
+
+            self.spawn(slot)
+
+    def retire_bloated(self):
+        if not self.max_rss:
+            return
+
+        for pid, slot in list(self.workers.items()):
+            rss = rss_bytes(pid)
+
+            if pid not in self.retiring and rss is not None and rss > self.max_rss:
+                logger.info(
+                    "Recycling worker %d (pid %d) at %.0f MB", slot, pid, rss / 2**20
+                )
+                self.retiring.add(pid)
+                os.kill(pid, signal.SIGTERM)
+
+    def shutdown(self):
+        logger.info("Draining %d workers", len(self.workers))
+
+        for pid in self.workers:
+            os.kill(pid, signal.SIGTERM)
+
+        deadline = time.monotonic() + self.graceful_timeout
+
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+
+        for pid in list(self.workers):
+            logger.warning("Killing worker pid %d after the graceful timeout", pid)
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            self.workers.pop(pid)
+
+        self.sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--no-preload", dest="preload", action="store_false")
+    parser.add_argument(
+        "--db-connection-budget", type=int, default=DB_CONNECTION_BUDGET
+    )
+    parser.add_argument("--max-requests", type=int, default=WORKER_MAX_REQUESTS)
+    parser.add_argument(
+        "--max-requests-jitter", type=int, default=WORKER_MAX_REQUESTS_JITTER
+    )
+    parser.add_argument("--max-rss-mb", type=float, default=WORKER_MAX_RSS_MB)
+    parser.add_argument(
+        "--graceful-timeout", type=float, default=GRACEFUL_TIMEOUT_SECONDS
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    if args.db_connection_budget:
+        # Must be set before the app, and with it the engines, is imported.
+        sizes = pool_sizes(args.db_connection_budget, args.workers)
+        os.environ["TODO_DB_POOL_SIZE"] = str(sizes["pool_size"])
+        os.environ["TODO_DB_MAX_OVERFLOW"] = str(sizes["max_overflow"])
+
+    Master(
+        workers=args.workers,
+        host=args.host,
+        port=args.port,
+        preload=args.preload,
+        max_requests=args.max_requests,
+        max_requests_jitter=args.max_requests_jitter,
+        max_rss_mb=args.max_rss_mb,
+        graceful_timeout=args.graceful_timeout,
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
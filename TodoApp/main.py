@@ -1,14 +1,54 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, status
 from fastapi.responses import RedirectResponse
 from .models import Base
 from .database import engine
+from .sharding import prepare_shards
+from .archive import ARCHIVE_INTERVAL_SECONDS, run_archiver
+from .purge import PURGE_INTERVAL_SECONDS, run_purger
+from .compression import COMPRESSION_ENABLED, CompressionMiddleware
+from .profiling import PROFILING_ENABLED, ProfilingMiddleware
+from .stickiness import StickinessMiddleware
 from .routers import auth, todos, admin, users
 from fastapi.staticfiles import StaticFiles
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    workers = []
+    # Read at startup, not import: the launcher preloads this module and then
+    # keeps background jobs to one of its worker processes.
+    background_jobs = os.getenv("TODO_BACKGROUND_JOBS", "true").lower() == "true"
+
+    if background_jobs and ARCHIVE_INTERVAL_SECONDS > 0:
+        workers.append(asyncio.create_task(run_archiver()))
+
+    if background_jobs and PURGE_INTERVAL_SECONDS > 0:
+        workers.append(asyncio.create_task(run_purger()))
+
+    yield
+
+    for worker in workers:
+        worker.cancel()
+
+
+app = FastAPI(lifespan=lifespan)
+
+app.add_middleware(StickinessMiddleware)
+
+if COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+
+# Added last so it is outermost and also times compression.
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
 
 Base.metadata.create_all(bind=engine)
 
+prepare_shards()
+
 
 app.mount("/static", StaticFiles(directory="TodoApp/static"), name="static")
 
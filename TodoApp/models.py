@@ -1,5 +1,10 @@
 from .database import Base
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey
+from datetime import datetime, timezone
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Index
+
+
+def utcnow():
+    return datetime.now(timezone.utc)
 
 
 class Users(Base):
@@ -25,3 +30,75 @@ class Todos(Base):
     priority = Column(Integer)
     complete = Column(Boolean, default=False)
     user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    completed_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True), default=utcnow, onupdate=utcnow)
+    # Set by deletes; the purge worker removes the row later.
+    deleted_at = Column(DateTime(timezone=True))
+
+    # Reads only ever want live rows, so their indexes leave deleted ones out.
+    __table_args__ = (
+        Index(
+            "ix_todos_user_id_updated_at",
+            user_id,
+            updated_at,
+            postgresql_where=deleted_at.is_(None),
+            sqlite_where=deleted_at.is_(None),
+        ),
+        # Serves GET /todos/next: incomplete todos by priority, in index order.
+        Index(
+            "ix_todos_next_up",
+            user_id,
+            complete,
+            priority.desc(),
+            id,
+            postgresql_where=deleted_at.is_(None),
+            sqlite_where=deleted_at.is_(None),
+        ),
+        Index(
+            "ix_todos_user_id_live",
+            user_id,
+            id,
+            postgresql_where=deleted_at.is_(None),
+            sqlite_where=deleted_at.is_(None),
+        ),
+        # Serves the archiver's scan for completed todos past the cutoff.
+        Index(
+            "ix_todos_archivable",
+            complete,
+            completed_at,
+            postgresql_where=deleted_at.is_(None),
+            sqlite_where=deleted_at.is_(None),
+        ),
+        Index(
+            "ix_todos_deleted_at",
+            deleted_at,
+            postgresql_where=deleted_at.isnot(None),
+            sqlite_where=deleted_at.isnot(None),
+        ),
+    )
+
+
+class TodosArchive(Base):
+    __tablename__ = "todos_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    title = Column(String)
+    description = Column(String)
+    priority = Column(Integer)
+    complete = Column(Boolean, default=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    completed_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), default=utcnow)
+
+
+class TodoTombstones(Base):
+    __tablename__ = "todo_tombstones"
+
+    id = Column(Integer, primary_key=True, index=True)
+    todo_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"))
+    deleted_at = Column(DateTime(timezone=True), default=utcnow)
+
+    __table_args__ = (
+        Index("ix_todo_tombstones_user_id_deleted_at", "user_id", "deleted_at"),
+    )
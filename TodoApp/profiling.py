@@ -0,0 +1,422 @@
+import cProfile
+import marshal
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+from starlette.requests import Request
+from .models import utcnow
+from .routers.auth import claims_from_request
+
+PROFILING_ENABLED = os.getenv("TODO_PROFILING", "false").lower() == "true"
+# Share of all requests profiled without being asked, e.g. 0.001; 0 disables.
+PROFILE_SAMPLE_RATE = float(os.getenv("TODO_PROFILE_SAMPLE_RATE", "0"))
+# Randomly picked requests use the cheaper sampling profiler by default.
+PROFILE_SAMPLE_MODE = os.getenv("TODO_PROFILE_SAMPLE_MODE", "sampling")
+PROFILE_RING_SIZE = int(os.getenv("TODO_PROFILE_RING_SIZE", "20"))
+PROFILE_INTERVAL_SECONDS = float(os.getenv("TODO_PROFILE_INTERVAL_MS", "1")) / 1000
+
+MODES = ("deterministic", "sampling")
+# Requests to these paths are never picked at random.
+UNSAMPLED_PATHS = ("/admin/profiles", "/static", "/healthy")
+
+MAX_SAMPLES = 100_000
+# Innermost frames of threadpool threads waiting for work; such samples are
+# dropped, as the thread is not doing anything for any request.
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+MAX_STACK_DEPTH = 200
+# Call paths worth less than this are left out of speedscope files converted
+# from deterministic profiles, which keeps deep call graphs small.
+MIN_PATH_SECONDS = 1e-6
+
+
+def frame_key(code) -> tuple:
+    return (code.co_filename, code.co_firstlineno, code.co_name)
+
+
+def frame_name(key: tuple) -> str:
+    filename, line, name = key
+
+    if filename == "~":
+        return name
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+@dataclass
+class Profile:
+    method: str
+    path: str
+    mode: str
+    trigger: str
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    worker: int = field(default_factory=os.getpid)
+    status: Optional[int] = None
+    duration_ms: float = 0.0
+    started_at: datetime = field(default_factory=utcnow)
+    # pstats layout: {(file, line, name): (cc, nc, tt, ct, callers)}
+    stats: dict = field(default_factory=dict, repr=False)
+    # Sampling mode only: (stack from root to leaf, seconds) pairs.
+    samples: list = field(default_factory=list, repr=False)
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "mode": self.mode,
+            "trigger": self.trigger,
+            "worker": self.worker,
+            "status": self.status,
+            "duration_ms": round(self.duration_ms, 3),
+            "started_at": self.started_at,
+            "functions": len(self.stats),
+            "samples": len(self.samples),
+        }
+
+    def to_pstats(self) -> bytes:
+        """The bytes of a `.prof` file, as written by `pstats.Stats.dump_stats`
+        and read by `pstats`, snakeviz and similar tools."""
+        return marshal.dumps(self.stats)
+
+    def to_speedscope(self) -> dict:
+        frames, indexes = [], {}
+
+        def index(key):
+            if key not in indexes:
+                indexes[key] = len(frames)
+                frames.append({"name": frame_name(key), "file": key[0], "line": key[1]})
+            return indexes[key]
+
+        stacks = self.samples if self.mode == "sampling" else call_paths(self.stats)
+        samples, weights = [], []
+
+        for stack, seconds in stacks:
+            samples.append([index(key) for key in stack])
+            weights.append(seconds * 1000)
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{self.method} {self.path}",
+            "exporter": "TodoApp.profiling",
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": f"{self.method} {self.path} ({self.mode})",
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": sum(weights),
+                    "samples": samples,
+                    "weights": weights,
+                }
+            ],
+        }
+
+
+def call_paths(stats: dict) -> list:
+    """Turn deterministic stats into weighted call stacks for speedscope.
+
+    cProfile only keeps caller -> callee totals, so each function's time is
+    split between its callers in proportion to the time they spent in it;
+    the result is a flame graph that adds up but may mix call paths."""
+    children = {}
+
+    for callee, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            children.setdefault(caller, []).append((callee, edge[3]))
+
+    roots = [key for key, value in stats.items() if not value[4]]
+    paths = []
+
+    def walk(key, seconds, stack):
+        if len(paths) >= MAX_SAMPLES:
+            return
+
+        stack = stack + [key]
+        _, _, own, total, _ = stats[key]
+        share = seconds / total if total else 0.0
+
+        if own * share > 0:
+            paths.append((stack, own * share))
+
+        if len(stack) >= MAX_STACK_DEPTH:
+            return
+
+        for child, child_seconds in children.get(key, ()):
+            if child in stack or child_seconds * share < MIN_PATH_SECONDS:
+                continue
+            walk(child, child_seconds * share, stack)
+
+    for root in roots:
+        walk(root, stats[root][3], [])
+
+    return paths
+
+
+def sampled_stats(samples: list) -> dict:
+    """pstats-style stats built from sampled stacks; call counts are numbers
+    of samples rather than numbers of calls."""
+    stats = {}
+
+    for stack, seconds in samples:
+        seen = set()
+
+        for depth, key in enumerate(stack):
+            cc, nc, tt, ct, callers = stats.get(key, (0, 0, 0.0, 0.0, {}))
+            leaf = depth == len(stack) - 1
+
+            if key not in seen:
+                seen.add(key)
+                nc, ct = nc + 1, ct + seconds
+                cc += 1
+
+            if leaf:
+                tt += seconds
+
+            if depth:
+                caller = stack[depth - 1]
+                e_nc, e_cc, e_tt, e_ct = callers.get(caller, (0, 0, 0.0, 0.0))
+                callers[caller] = (
+                    e_nc + 1,
+                    e_cc + 1,
+                    e_tt + (seconds if leaf else 0.0),
+                    e_ct + seconds,
+                )
+
+            stats[key] = (cc, nc, tt, ct, callers)
+
+    return stats
+
+
+def merge_stats(*all_stats: dict) -> dict:
+    """Add up pstats-style stats, e.g. of the loop thread and the threadpool."""
+    merged = {}
+
+    for stats in all_stats:
+        for key, (cc, nc, tt, ct, callers) in stats.items():
+            m_cc, m_nc, m_tt, m_ct, m_callers = merged.get(key, (0, 0, 0.0, 0.0, {}))
+            m_callers = dict(m_callers)
+
+            for caller, edge in callers.items():
+                before = m_callers.get(caller, (0, 0, 0.0, 0.0))
+                m_callers[caller] = tuple(a + b for a, b in zip(before, edge))
+
+            merged[key] = (m_cc + cc, m_nc + nc, m_tt + tt, m_ct + ct, m_callers)
+
+    return merged
+
+
+class Sampler:
+    """Records thread stacks every `interval` seconds from a helper thread,
+    at a cost that does not grow with the number of calls.
+
+    `main_thread` is sampled unless `main` is false, e.g. when cProfile
+    already watches it. With `others`, every other busy thread is sampled
+    too, under a root frame named after the thread, so work handed to the
+    threadpool shows up next to the loop's."""
+
+    def __init__(
+        self,
+        main_thread: int,
+        interval: float = PROFILE_INTERVAL_SECONDS,
+        others: bool = False,
+        main: bool = True,
+    ):
+        self.main_thread = main_thread
+        self.interval = interval
+        self.others = others
+        self.main = main
+        self.samples = []
+        self._names = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> list:
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+    def _run(self):
+        me = threading.get_ident()
+        last = time.perf_counter()
+
+        while not self._stop.wait(self.interval) and len(self.samples) < MAX_SAMPLES:
+            now = time.perf_counter()
+
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self.main_thread:
+                    if not self.main:
+                        continue
+                elif thread_id == me or not self.others:
+                    continue
+
+                stack = []
+
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(frame_key(frame.f_code))
+                    frame = frame.f_back
+
+                if not stack:
+                    continue
+
+                if thread_id != self.main_thread:
+                    filename, _, name = stack[0]
+                    if (os.path.basename(filename), name) in IDLE_FRAMES:
+                        continue
+                    stack.append(("~", 0, f"[{self.thread_name(thread_id)}]"))
+
+                self.samples.append((stack[::-1], now - last))
+            last = now
+
+    def thread_name(self, thread_id: int) -> str:
+        if thread_id not in self._names:
+            self._names = {
+                thread.ident: thread.name for thread in threading.enumerate()
+            }
+        return self._names.get(thread_id, f"thread {thread_id}")
+
+
+class ProfileStore:
+    """The last `size` profiles of this process, oldest dropped first."""
+
+    def __init__(self, size: int = PROFILE_RING_SIZE):
+        self._lock = threading.Lock()
+        self._profiles = deque(maxlen=size)
+
+    def add(self, profile: Profile):
+        with self._lock:
+            self._profiles.append(profile)
+
+    def list(self) -> list:
+        with self._lock:
+            return [profile.summary() for profile in reversed(self._profiles)]
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        with self._lock:
+            for profile in self._profiles:
+                if profile.id == profile_id:
+                    return profile
+        return None
+
+
+profile_store = ProfileStore()
+
+
+def requested_mode(request: Request) -> Optional[str]:
+    """The mode asked for with `X-Profile` or `?profile=`: a mode name, or
+    `1`/`true` for deterministic. Only admins may ask."""
+    flag = request.headers.get("x-profile") or request.query_params.get("profile")
+
+    if not flag or flag.lower() in ("0", "false"):
+        return None
+
+    if (claims_from_request(request).get("role") or "").lower() != "admin":
+        return None
+
+    flag = flag.lower()
+    return flag if flag in MODES else "deterministic"
+
+
+class ProfilingMiddleware:
+    """Profiles requests that an admin asks for, and a random share of all
+    requests, into `profile_store`.
+
+    The event loop thread, where the async endpoints, token checks and most
+    queries run, is profiled with the chosen mode. Busy threadpool threads,
+    where sync dependencies, single-flight reads and streamed templates
+    run, are sampled alongside in both modes; deterministic profiles count
+    their frames in samples rather than calls. Nothing is tied to the
+    request itself: whatever else the loop and the threadpool do while it
+    is in flight is recorded too. One request is profiled at a time per
+    process; others asking meanwhile run unprofiled."""
+
+    def __init__(
+        self,
+        app,
+        sample_rate: float = PROFILE_SAMPLE_RATE,
+        sample_mode: str = PROFILE_SAMPLE_MODE,
+        store: ProfileStore = profile_store,
+    ):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.sample_mode = sample_mode if sample_mode in MODES else "sampling"
+        self.store = store
+        self._busy = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request = Request(scope)
+        mode, trigger = requested_mode(request), "admin"
+
+        if (
+            mode is None
+            and self.sample_rate > 0
+            and not scope["path"].startswith(UNSAMPLED_PATHS)
+            and random.random() < self.sample_rate
+        ):
+            mode, trigger = self.sample_mode, "sampled"
+
+        if mode is None or not self._busy.acquire(blocking=False):
+            return await self.app(scope, receive, send)
+
+        try:
+            await self.profile(scope, receive, send, mode, trigger)
+        finally:
+            self._busy.release()
+
+    async def profile(self, scope, receive, send, mode: str, trigger: str):
+        profile = Profile(scope["method"], scope["path"], mode, trigger)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+
+                if trigger == "admin":
+                    headers = [*message.get("headers", [])]
+                    headers.append((b"x-profile-id", profile.id.encode()))
+                    message = {**message, "headers": headers}
+
+            await send(message)
+
+        # cProfile watches the loop thread in deterministic mode; the sampler
+        # covers whatever it does not.
+        profiler = cProfile.Profile() if mode == "deterministic" else None
+        sampler = Sampler(threading.get_ident(), others=True, main=profiler is None)
+        sampler.start()
+
+        if profiler is not None:
+            profiler.enable()
+
+        started = time.perf_counter()
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profile.duration_ms = (time.perf_counter() - started) * 1000
+
+            if profiler is not None:
+                profiler.disable()
+                profiler.create_stats()
+
+            profile.samples = sampler.stop()
+            profile.stats = sampled_stats(profile.samples)
+
+            if profiler is not None:
+                profile.stats = merge_stats(profiler.stats, profile.stats)
+
+            self.store.add(profile)
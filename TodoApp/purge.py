@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from sqlalchemy import delete, func, select
+from .database import SessionLocal, shard_router
+from .models import Todos, TodoTombstones
+from .sync import aware, tombstone_cutoff
+
+PURGE_AFTER_SECONDS = float(os.getenv("TODO_PURGE_AFTER_SECONDS", "300"))
+PURGE_BATCH_SIZE = int(os.getenv("TODO_PURGE_BATCH_SIZE", "1000"))
+PURGE_INTERVAL_SECONDS = float(os.getenv("TODO_PURGE_INTERVAL_SECONDS", "60"))
+PURGE_PAUSE_SECONDS = float(os.getenv("TODO_PURGE_PAUSE_MS", "50")) / 1000
+# The purge waits while more pool connections than this are checked out by
+# requests, so it mostly runs when the app is quiet.
+PURGE_MAX_BUSY_CONNECTIONS = int(os.getenv("TODO_PURGE_MAX_BUSY_CONNECTIONS", "2"))
+
+logger = logging.getLogger(__name__)
+
+
+class PurgeMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rows = 0
+        self.batches = 0
+        self.runs = 0
+        self.skipped_busy = 0
+        self.tombstones = 0
+        self.last_run_rows = 0
+        self.last_run_seconds = 0.0
+        self.last_run_at = None
+
+    def record_run(self, rows: int, batches: int, seconds: float):
+        with self._lock:
+            self.rows += rows
+            self.batches += batches
+            self.runs += 1
+            self.last_run_rows = rows
+            self.last_run_seconds = seconds
+            self.last_run_at = datetime.now(timezone.utc)
+
+    def record_skip(self):
+        with self._lock:
+            self.skipped_busy += 1
+
+    def record_tombstones(self, rows: int):
+        with self._lock:
+            self.tombstones += rows
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "rows_purged": self.rows,
+                "batches": self.batches,
+                "runs": self.runs,
+                "skipped_busy": self.skipped_busy,
+                "tombstones_pruned": self.tombstones,
+                "last_run_at": self.last_run_at,
+                "last_run_rows": self.last_run_rows,
+                "last_run_rows_per_second": (
+                    self.last_run_rows / self.last_run_seconds
+                    if self.last_run_seconds
+                    else 0.0
+                ),
+            }
+
+
+purge_metrics = PurgeMetrics()
+
+
+def purge_backlog(db) -> int:
+    """Soft-deleted todos still waiting to be removed."""
+    return db.scalar(select(func.count()).where(Todos.deleted_at.isnot(None)))
+
+
+def purge_batch(db, cutoff: datetime, batch_size: int) -> int:
+    ids = (
+        db.execute(
+            select(Todos.id)
+            .where(Todos.deleted_at < cutoff)
+            .order_by(Todos.deleted_at)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        .scalars()
+        .all()
+    )
+
+    if ids:
+        db.execute(delete(Todos).where(Todos.id.in_(ids)))
+        db.commit()
+
+    return len(ids)
+
+
+def purge_deleted_todos(
+    session_factory=SessionLocal,
+    older_than: timedelta = timedelta(seconds=PURGE_AFTER_SECONDS),
+    batch_size: int = PURGE_BATCH_SIZE,
+    max_batches: Optional[int] = None,
+    pause: float = 0.0,
+) -> int:
+    """Physically delete todos soft-deleted more than `older_than` ago, one
+    short transaction per batch, and return how many rows were removed."""
+    cutoff = datetime.now(timezone.utc) - older_than
+    started = time.perf_counter()
+    purged = 0
+    batches = 0
+
+    while max_batches is None or batches < max_batches:
+        db = session_factory()
+        try:
+            count = purge_batch(db, cutoff, batch_size)
+        finally:
+            db.close()
+
+        purged += count
+        batches += int(count > 0)
+
+        if count < batch_size:
+            break
+
+        if pause:
+            time.sleep(pause)
+
+    purge_metrics.record_run(purged, batches, time.perf_counter() - started)
+
+    return purged
+
+
+def prune_tombstone_batch(db, cutoff: datetime, batch_size: int) -> tuple:
+    """Delete the expired tombstones among the `batch_size` oldest by id, and
+    tell whether all of them were; tombstones are appended as todos go, so
+    walking the primary key finds the old ones without another index."""
+    oldest = db.execute(
+        select(TodoTombstones.id, TodoTombstones.deleted_at)
+        .order_by(TodoTombstones.id)
+        .limit(batch_size)
+    ).all()
+    expired = [
+        row.id
+        for row in oldest
+        if row.deleted_at is not None and aware(row.deleted_at) < cutoff
+    ]
+
+    if expired:
+        db.execute(delete(TodoTombstones).where(TodoTombstones.id.in_(expired)))
+        db.commit()
+
+    return len(expired), len(oldest) == batch_size and len(expired) == len(oldest)
+
+
+def prune_tombstones(
+    session_factory=SessionLocal,
+    cutoff: Optional[datetime] = None,
+    batch_size: int = PURGE_BATCH_SIZE,
+    pause: float = 0.0,
+) -> int:
+    """Delete tombstones no sync cursor still accepted can need, one short
+    transaction per batch, and return how many were removed."""
+    cutoff = cutoff or tombstone_cutoff()
+    pruned = 0
+
+    while True:
+        db = session_factory()
+        try:
+            count, more = prune_tombstone_batch(db, cutoff, batch_size)
+        finally:
+            db.close()
+
+        pruned += count
+
+        if not more:
+            break
+
+        if pause:
+            time.sleep(pause)
+
+    purge_metrics.record_tombstones(pruned)
+
+    return pruned
+
+
+def busy_connections(session_factory) -> int:
+    pool = session_factory.kw["bind"].pool
+
+    return pool.checkedout() if hasattr(pool, "checkedout") else 0
+
+
+async def run_purger(
+    session_factories: Optional[list] = None,
+    interval: float = PURGE_INTERVAL_SECONDS,
+):
+    session_factories = session_factories or shard_router.sessionmakers
+
+    while True:
+        for shard, session_factory in enumerate(session_factories):
+            if busy_connections(session_factory) > PURGE_MAX_BUSY_CONNECTIONS:
+                purge_metrics.record_skip()
+                continue
+
+            try:
+                purged = await asyncio.to_thread(
+                    purge_deleted_todos, session_factory, pause=PURGE_PAUSE_SECONDS
+                )
+                logger.info("Purged %d deleted todos on shard %d", purged, shard)
+                pruned = await asyncio.to_thread(
+                    prune_tombstones, session_factory, pause=PURGE_PAUSE_SECONDS
+                )
+                logger.info("Pruned %d tombstones on shard %d", pruned, shard)
+            except Exception:
+                logger.exception("Purging deleted todos failed on shard %d", shard)
+
+        await asyncio.sleep(interval)
@@ -0,0 +1,102 @@
+from dataclasses import dataclass, fields
+from datetime import datetime
+from typing import Iterator, Optional
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from .models import Todos, TodosArchive, Users
+
+
+# Read-only endpoints select plain columns and map them into these slotted
+# rows instead of hydrating tracked ORM instances they would throw away.
+@dataclass(slots=True)
+class TodoRow:
+    id: int
+    title: str
+    description: str
+    priority: int
+    complete: bool
+    user_id: int
+
+
+@dataclass(slots=True)
+class ChangedTodoRow(TodoRow):
+    updated_at: Optional[datetime]
+
+
+@dataclass(slots=True)
+class UserRow:
+    id: int
+    email: str
+    username: str
+    first_name: str
+    last_name: str
+    is_active: bool
+    role: str
+    phone_number: Optional[str]
+
+
+def row_columns(model, row_type):
+    return [getattr(model, field.name) for field in fields(row_type)]
+
+
+TODO_COLUMNS = row_columns(Todos, TodoRow)
+ARCHIVED_TODO_COLUMNS = row_columns(TodosArchive, TodoRow)
+CHANGED_TODO_COLUMNS = row_columns(Todos, ChangedTodoRow)
+USER_COLUMNS = row_columns(Users, UserRow)
+
+
+def read_todos(
+    db: Session, *criteria, order_by=(), limit: Optional[int] = None
+) -> list[TodoRow]:
+    query = (
+        select(*TODO_COLUMNS)
+        .where(Todos.deleted_at.is_(None), *criteria)
+        .order_by(*order_by)
+        .limit(limit)
+    )
+
+    return [TodoRow(*row) for row in db.execute(query)]
+
+
+def read_archived_todos(db: Session, *criteria, order_by=()) -> list[TodoRow]:
+    query = select(*ARCHIVED_TODO_COLUMNS).where(*criteria).order_by(*order_by)
+
+    return [TodoRow(*row) for row in db.execute(query)]
+
+
+def iter_todos(db: Session, *criteria, chunk_size: int = 500) -> Iterator[TodoRow]:
+    rows = db.execute(
+        select(*TODO_COLUMNS)
+        .where(Todos.deleted_at.is_(None), *criteria)
+        .order_by(Todos.id)
+        .execution_options(yield_per=chunk_size)
+    )
+
+    for row in rows:
+        yield TodoRow(*row)
+
+
+def read_todo_page(db: Session, *criteria, offset: int, limit: int) -> list[TodoRow]:
+    rows = db.execute(
+        select(*TODO_COLUMNS)
+        .where(Todos.deleted_at.is_(None), *criteria)
+        .order_by(Todos.id)
+        .offset(offset)
+        .limit(limit)
+    )
+
+    return [TodoRow(*row) for row in rows]
+
+
+def find_todo(db: Session, *criteria) -> Optional[TodoRow]:
+    row = db.execute(
+        select(*TODO_COLUMNS).where(Todos.deleted_at.is_(None), *criteria).limit(1)
+    ).first()
+
+    return TodoRow(*row) if row is not None else None
+
+
+def read_users(db: Session, *criteria) -> list[UserRow]:
+    rows = db.execute(select(*USER_COLUMNS).where(*criteria))
+
+    return [UserRow(*row) for row in rows]
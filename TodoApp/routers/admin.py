@@ -1,8 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Path
-from typing import Annotated
-from sqlalchemy.orm import Session
-from ..models import Todos
-from ..database import SessionLocal
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    HTTPException,
+    status,
+    Path,
+    Query,
+)
+from fastapi.responses import JSONResponse, Response
+from typing import Annotated, Optional
+from sqlalchemy.orm import Session, sessionmaker
+from ..models import Todos, TodosArchive, Users, utcnow
+from ..database import SessionLocal, shard_router
+from ..batching import BATCH_INSERTS_ENABLED, batcher_metrics
+from ..fieldsets import columns_of, resolve_fields, select_fields
+from ..readers import read_archived_todos, read_todos
+from ..profiling import profile_store
+from ..purge import purge_backlog, purge_metrics
+from ..singleflight import read_flight
+from ..sync import record_tombstones
+from ..user_removal import remove_user, removal_jobs
 from .auth import get_current_user
 
 router = APIRouter(prefix="/admin", tags=["admin"])
@@ -21,22 +38,186 @@ user_deps = Annotated[dict, Depends(get_current_user)]
 
 
 @router.get("/todo", status_code=status.HTTP_200_OK)
-async def read_all(user: user_deps, db: db_deps):
+async def read_all(
+    user: user_deps,
+    db: db_deps,
+    fields: Optional[str] = None,
+    include_archived: bool = False,
+):
     if user.get("user_role").lower() != "admin":
         raise HTTPException(status_code=404, detail="Unauthorized")
 
-    return db.query(Todos).all()
+    columns = resolve_fields(Todos, fields)
+
+    def query(shard_db):
+        if columns is not None:
+            todos = select_fields(shard_db, columns, Todos.deleted_at.is_(None))
+
+            if include_archived:
+                todos += select_fields(shard_db, columns_of(TodosArchive, columns))
+
+            return todos
+
+        todos = read_todos(shard_db)
+
+        if include_archived:
+            todos += read_archived_todos(shard_db)
+
+        return todos
+
+    return shard_router.fan_out(db, query)
+
+
+@router.get("/metrics/todo-batcher", status_code=status.HTTP_200_OK)
+async def todo_batcher_metrics(user: user_deps):
+    if user.get("user_role").lower() != "admin":
+        raise HTTPException(status_code=404, detail="Unauthorized")
+
+    return {"enabled": BATCH_INSERTS_ENABLED, **batcher_metrics()}
+
+
+@router.get("/metrics/single-flight", status_code=status.HTTP_200_OK)
+async def single_flight_metrics(user: user_deps):
+    if user.get("user_role").lower() != "admin":
+        raise HTTPException(status_code=404, detail="Unauthorized")
+
+    return read_flight.snapshot()
+
+
+@router.get("/metrics/purge", status_code=status.HTTP_200_OK)
+async def purge_worker_metrics(user: user_deps, db: db_deps):
+    if user.get("user_role").lower() != "admin":
+        raise HTTPException(status_code=404, detail="Unauthorized")
+
+    backlog = shard_router.fan_out(db, lambda shard_db: [purge_backlog(shard_db)])
+
+    return {"backlog": sum(backlog), **purge_metrics.snapshot()}
 
 
 @router.delete("/todo/delete/{id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_todo(db: db_deps, user: user_deps, id: int = Path(gt=0)):
+async def delete_todo(
+    db: db_deps,
+    user: user_deps,
+    id: int = Path(gt=0),
+    user_id: Optional[int] = Query(default=None, gt=0),
+):
+    if user.get("user_role").lower() != "admin":
+        raise HTTPException(status_code=404, detail="Unauthorized")
+
+    # Todo ids are only unique per shard; the owner's id picks the shard.
+    with shard_router.shard_sessions(db, user_id) as sessions:
+        found = [
+            (shard_db, todo_model)
+            for shard_db in sessions
+            for todo_model in shard_db.query(Todos).filter(
+                Todos.id == id,
+                Todos.deleted_at.is_(None),
+                *([Todos.user_id == user_id] if user_id is not None else []),
+            )
+        ]
+
+        if not found:
+            raise HTTPException(status_code=404, detail="Todo Not Found")
+
+        if len(found) > 1:
+            raise HTTPException(
+                status_code=409,
+                detail="Todo id exists on more than one shard, pass user_id",
+            )
+
+        shard_db, todo_model = found[0]
+        todo_model.deleted_at = utcnow()
+        shard_db.add(todo_model)
+        record_tombstones(shard_db, [(todo_model.id, todo_model.user_id)])
+        shard_db.commit()
+        read_flight.forget(("todos", todo_model.user_id))
+
+
+@router.delete("/users/{user_id}", status_code=status.HTTP_202_ACCEPTED)
+async def delete_user(
+    db: db_deps,
+    user: user_deps,
+    background_tasks: BackgroundTasks,
+    user_id: int = Path(gt=0),
+):
     if user.get("user_role").lower() != "admin":
         raise HTTPException(status_code=404, detail="Unauthorized")
 
-    todo_model = db.query(Todos).filter(Todos.id == id).first()
+    if user_id == user.get("user_id"):
+        raise HTTPException(status_code=400, detail="Admins cannot remove themselves")
+
+    user_model = db.query(Users).filter(Users.id == user_id).first()
 
-    if todo_model is None:
-        raise HTTPException(status_code=404, detail="Todo Not Found")
+    if user_model is None:
+        raise HTTPException(status_code=404, detail="User Not Found")
 
-    db.delete(todo_model)
+    # Locked out straight away; their data goes in the background.
+    user_model.is_active = False
+    db.add(user_model)
     db.commit()
+
+    job, created = removal_jobs.start(user_id)
+
+    if created:
+        background_tasks.add_task(
+            remove_user, job, directory_session=sessionmaker(bind=db.get_bind())
+        )
+
+    return job.as_dict()
+
+
+@router.get("/users/removals/{job_id}", status_code=status.HTTP_200_OK)
+async def read_user_removal(user: user_deps, job_id: str):
+    if user.get("user_role").lower() != "admin":
+        raise HTTPException(status_code=404, detail="Unauthorized")
+
+    job = removal_jobs.get(job_id)
+
+    if job is None:
+        raise HTTPException(status_code=404, detail="Removal Job Not Found")
+
+    return job.as_dict()
+
+
+@router.get("/profiles", status_code=status.HTTP_200_OK)
+async def read_profiles(user: user_deps):
+    if user.get("user_role").lower() != "admin":
+        raise HTTPException(status_code=404, detail="Unauthorized")
+
+    return profile_store.list()
+
+
+@router.get("/profiles/{profile_id}", status_code=status.HTTP_200_OK)
+async def download_profile(
+    user: user_deps, profile_id: str, format: str = "speedscope"
+):
+    if user.get("user_role").lower() != "admin":
+        raise HTTPException(status_code=404, detail="Unauthorized")
+
+    profile = profile_store.get(profile_id)
+
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile Not Found")
+
+    if format == "pstats":
+        return Response(
+            profile.to_pstats(),
+            media_type="application/octet-stream",
+            headers={
+                "Content-Disposition": f'attachment; filename="{profile.id}.prof"'
+            },
+        )
+
+    if format == "speedscope":
+        return JSONResponse(
+            profile.to_speedscope(),
+            headers={
+                "Content-Disposition": (
+                    f'attachment; filename="{profile.id}.speedscope.json"'
+                )
+            },
+        )
+
+    raise HTTPException(
+        status_code=400, detail="Unsupported profile format, use speedscope or pstats"
+    )
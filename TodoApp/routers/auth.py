@@ -1,11 +1,15 @@
 from fastapi import APIRouter, status, Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from pydantic import BaseModel
-from ..database import SessionLocal
+from ..database import READ_ONLY_METHODS, SessionLocal, open_session
+from ..sharding import place_user
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from typing import Annotated
+from typing import Annotated, Optional
 from datetime import timedelta, datetime, timezone
 from ..models import Users
+from ..fieldsets import resolve_fields, select_fields
+from ..readers import read_users
 from passlib.context import CryptContext
 from jose import jwt, JWTError
 from fastapi.templating import Jinja2Templates
@@ -18,9 +22,13 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 bcrypt_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_bearer = OAuth2PasswordBearer(tokenUrl="auth/token")
 
+HIDDEN_USER_FIELDS = ("hash_password",)
 
-def get_db():
-    db = SessionLocal()
+
+def get_db(request: Request):
+    user_id = user_id_from_request(request)
+    read_only = request.method in READ_ONLY_METHODS
+    db = open_session(user_id, read_only)
     try:
         yield db
     finally:
@@ -30,6 +38,19 @@ def get_db():
 db_deps = Annotated[Session, Depends(get_db)]
 
 
+def get_directory_db():
+    # Always the primary: a deactivation must count on the next request,
+    # not once a replica has caught up.
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+directory_deps = Annotated[Session, Depends(get_directory_db)]
+
+
 class Token(BaseModel):
     access_token: str
     type: str
@@ -77,7 +98,7 @@ def render_register_page(request: Request):
 def authenticate_user(username: str, password: str, db: db_deps):
     user = db.query(Users).filter(Users.username == username).first()
 
-    if not user:
+    if not user or user.is_active is False:
         return False
 
     is_valid_password = bcrypt_context.verify(password, user.hash_password)
@@ -98,7 +119,8 @@ def create_access_token(
     return jwt.encode(encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_bearer)]):
+def get_current_user(token: Annotated[str, Depends(oauth2_bearer)], db: directory_deps):
+    # Sync so FastAPI runs the lookup in the threadpool, never on the loop.
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -108,14 +130,52 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_bearer)]):
         if not username or not user_id:
             raise HTTPException(status_code=401, detail="Could not Authenticate")
 
+        # Tokens outlive deactivation; a removed user is shut out at once.
+        try:
+            is_active = db.scalar(select(Users.is_active).where(Users.id == user_id))
+        finally:
+            # Hand the connection back now rather than when the response
+            # is done; the request has no further use for it.
+            db.close()
+
+        if not is_active:
+            raise HTTPException(status_code=401, detail="Could not Authenticate")
+
         return {"username": username, "user_id": user_id, "user_role": user_role}
     except JWTError:
         raise HTTPException(status_code=401, detail="Could not Authenticate")
 
 
+def claims_from_request(request: Request) -> dict:
+    """The claims of the bearer header or the access_token cookie, or an
+    empty dict when there is no valid token; never fails the request."""
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+
+    if scheme.lower() != "bearer":
+        token = request.cookies.get("access_token")
+
+    if not token:
+        return {}
+
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return {}
+
+
+def user_id_from_request(request: Request) -> Optional[int]:
+    """The user id of the request's token; used to route to the user's shard."""
+    return claims_from_request(request).get("id")
+
+
 @router.get("/", status_code=status.HTTP_200_OK)
-async def get_user(db: db_deps):
-    return db.query(Users).all()
+async def get_user(db: db_deps, fields: Optional[str] = None):
+    columns = resolve_fields(Users, fields, hidden=HIDDEN_USER_FIELDS)
+
+    if columns is not None:
+        return select_fields(db, columns)
+
+    return read_users(db)
 
 
 @router.post("/", status_code=status.HTTP_201_CREATED)
@@ -135,8 +195,19 @@ async def create_user(db: db_deps, user_request: CreateUserRequest):
         )
 
         db.add(user_model)
+        db.flush()
+        # Placed before the commit: a user in the directory without a copy on
+        # their shard could log in but never add a todo.
+        place_user(
+            user_model.id,
+            user={
+                column.name: getattr(user_model, column.name)
+                for column in Users.__table__.columns
+            },
+        )
         db.commit()
     except:
+        db.rollback()
         raise HTTPException(status_code=404, detail="User not created")
 
 
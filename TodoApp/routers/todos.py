@@ -1,25 +1,61 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Path, Request
-from pydantic import BaseModel, Field
-from typing import Annotated
+import asyncio
+import itertools
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    status,
+    Path,
+    Query,
+    Request,
+    UploadFile,
+)
+from pydantic import BaseModel, Field, ValidationError
+from typing import Annotated, Optional
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
-from ..models import Todos
-from ..database import SessionLocal
-from .auth import get_current_user
-from starlette.responses import RedirectResponse
+from datetime import datetime, timezone
+from ..models import Todos, TodosArchive, utcnow
+from ..database import READ_ONLY_METHODS, open_session, replica_router
+from ..batching import BATCH_INSERTS_ENABLED, batcher_for
+from ..bulk_import import detect_format, iter_records
+from ..sync import read_changes, record_tombstones
+from ..singleflight import read_flight, read_key, with_session
+from ..fieldsets import columns_of, resolve_fields, resolve_sort, select_fields
+from ..readers import (
+    find_todo,
+    iter_todos,
+    read_archived_todos,
+    read_todo_page,
+    read_todos,
+)
+from .auth import directory_deps, get_current_user, user_id_from_request
+from starlette.responses import RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 
 router = APIRouter(prefix="/todos", tags=["todos"])
 
 
-def get_db():
-    db = SessionLocal()
+def get_db(request: Request):
+    user_id = user_id_from_request(request)
+    read_only = request.method in READ_ONLY_METHODS
+    db = open_session(user_id, read_only, sharded=True)
     try:
         yield db
     finally:
         db.close()
 
 
+def no_db():
+    return None
+
+
 db_deps = Annotated[Session, Depends(get_db)]
+# Batched inserts are written by the batcher's own sessions, so creating a
+# todo only needs the request's session when batching is off.
+insert_db_deps = Annotated[
+    Optional[Session], Depends(no_db if BATCH_INSERTS_ENABLED else get_db)
+]
 user_deps = Annotated[dict, Depends(get_current_user)]
 
 
@@ -41,6 +77,32 @@ class TodoRequest(BaseModel):
     complete: bool
 
 
+def completed_at(complete: bool):
+    return datetime.now(timezone.utc) if complete else None
+
+
+def todo_filters(
+    model,
+    user_id: int,
+    complete: Optional[bool] = None,
+    priority_min: Optional[int] = None,
+    priority_max: Optional[int] = None,
+    title_prefix: Optional[str] = None,
+):
+    criteria = [model.user_id == user_id]
+
+    if complete is not None:
+        criteria.append(model.complete == complete)
+    if priority_min is not None:
+        criteria.append(model.priority >= priority_min)
+    if priority_max is not None:
+        criteria.append(model.priority <= priority_max)
+    if title_prefix:
+        criteria.append(model.title.startswith(title_prefix, autoescape=True))
+
+    return criteria
+
+
 def redirect_to_login():
     redirect_response = RedirectResponse(
         url="/auth/login-page", status_code=status.HTTP_302_FOUND
@@ -52,34 +114,121 @@ def redirect_to_login():
 
 templates = Jinja2Templates(directory="TodoApp/templates")
 
+SORTABLE_TODO_FIELDS = {
+    name: name for name in ("id", "title", "priority", "complete", "updated_at")
+}
+# Archived todos were last touched when they were archived.
+SORTABLE_ARCHIVED_FIELDS = {**SORTABLE_TODO_FIELDS, "updated_at": "archived_at"}
+
+IMPORT_BATCH_SIZE = 1000
+IMPORT_MAX_REPORTED_ERRORS = 100
+
+STREAM_CHUNK_SIZE = 8192
+# Rows of the unpaged todo page read through single-flight before the rest
+# is streamed.
+COALESCED_PAGE_ROWS = 1000
+
+
+def stream_template(name: str, context: dict):
+    """Render `name` incrementally so the page head and first rows go out
+    while later rows are still being fetched."""
+
+    def chunks():
+        buffer, size = [], 0
+
+        for piece in templates.get_template(name).generate(context):
+            buffer.append(piece)
+            size += len(piece)
+
+            if size >= STREAM_CHUNK_SIZE:
+                yield "".join(buffer).encode()
+                buffer, size = [], 0
+
+        if buffer:
+            yield "".join(buffer).encode()
+
+    return StreamingResponse(chunks(), media_type="text/html")
+
+
 # Pages
 
 
 @router.get("/todo-page")
-async def render_todo_page(request: Request, db: db_deps):
+async def render_todo_page(
+    request: Request,
+    db: db_deps,
+    directory_db: directory_deps,
+    page: Optional[int] = Query(default=None, ge=1),
+    page_size: int = Query(default=100, ge=1, le=1000),
+):
     try:
         access_token = request.cookies.get("access_token")
 
-        user = await get_current_user(access_token)
+        user = await asyncio.to_thread(get_current_user, access_token, directory_db)
 
         if user is None:
             return redirect_to_login()
 
-        todos = db.query(Todos).filter(Todos.user_id == user.get("user_id")).all()
-
-        return templates.TemplateResponse(
-            "todo.html", {"request": request, "todos": todos, "user": user}
-        )
+        context = {"request": request, "user": user, "page": page, "offset": 0}
+
+        if page is None:
+            # Tabs opening the page together share the first rows' query; a
+            # longer list streams the rest so its head still goes out early.
+            head = await read_flight.do(
+                read_key(db, "todos", user.get("user_id"), "page-head"),
+                with_session(
+                    db,
+                    lambda shared_db: read_todo_page(
+                        shared_db,
+                        Todos.user_id == user.get("user_id"),
+                        offset=0,
+                        limit=COALESCED_PAGE_ROWS,
+                    ),
+                ),
+            )
+            context["todos"] = head
+
+            if len(head) == COALESCED_PAGE_ROWS:
+                context["todos"] = itertools.chain(
+                    head,
+                    iter_todos(
+                        db,
+                        Todos.user_id == user.get("user_id"),
+                        Todos.id > head[-1].id,
+                    ),
+                )
+        else:
+            offset = (page - 1) * page_size
+            todos = await read_flight.do(
+                read_key(db, "todos", user.get("user_id"), "page", offset, page_size),
+                with_session(
+                    db,
+                    lambda shared_db: read_todo_page(
+                        shared_db,
+                        Todos.user_id == user.get("user_id"),
+                        offset=offset,
+                        limit=page_size + 1,
+                    ),
+                ),
+            )
+            context.update(
+                todos=todos[:page_size],
+                offset=offset,
+                page_size=page_size,
+                has_next=len(todos) > page_size,
+            )
+
+        return stream_template("todo.html", context)
     except Exception:
         return redirect_to_login()
 
 
 @router.get("/add-todo-page")
-async def render_add_todo_page(request: Request):
+async def render_add_todo_page(request: Request, directory_db: directory_deps):
     try:
         access_token = request.cookies.get("access_token")
 
-        user = await get_current_user(access_token)
+        user = await asyncio.to_thread(get_current_user, access_token, directory_db)
 
         if user is None:
             return redirect_to_login()
@@ -92,14 +241,22 @@ async def render_add_todo_page(request: Request):
 
 
 @router.get("/edit-todo-page/{todo_id}")
-async def render_edit_todo_page(request: Request, todo_id: int, db: db_deps):
+async def render_edit_todo_page(
+    request: Request, todo_id: int, db: db_deps, directory_db: directory_deps
+):
     try:
-        user = await get_current_user(request.cookies.get("access_token"))
+        user = await asyncio.to_thread(
+            get_current_user, request.cookies.get("access_token"), directory_db
+        )
 
         if user is None:
             return redirect_to_login()
 
-        todo = db.query(Todos).filter(Todos.id == todo_id).first()
+        todo = (
+            db.query(Todos)
+            .filter(Todos.id == todo_id, Todos.deleted_at.is_(None))
+            .first()
+        )
 
         return templates.TemplateResponse(
             "edit-todo.html", {"request": request, "todo": todo, "user": user}
@@ -111,18 +268,94 @@ async def render_edit_todo_page(request: Request, todo_id: int, db: db_deps):
 
 # Endpoints
 @router.get("/")
-async def read_all(user: user_deps, db: db_deps):
-    return db.query(Todos).filter(Todos.user_id == user.get("user_id")).all()
+async def read_all(
+    user: user_deps,
+    db: db_deps,
+    fields: Optional[str] = None,
+    include_archived: bool = False,
+    complete: Optional[bool] = None,
+    priority_min: Optional[int] = Query(default=None, ge=1, le=5),
+    priority_max: Optional[int] = Query(default=None, ge=1, le=5),
+    title_prefix: Optional[str] = Query(default=None, max_length=100),
+    sort: Optional[str] = None,
+):
+    filters = {
+        "user_id": user.get("user_id"),
+        "complete": complete,
+        "priority_min": priority_min,
+        "priority_max": priority_max,
+        "title_prefix": title_prefix,
+    }
+    columns = resolve_fields(Todos, fields)
+    order_by = resolve_sort(Todos, sort, SORTABLE_TODO_FIELDS)
+    archived_order_by = (
+        resolve_sort(TodosArchive, sort, SORTABLE_ARCHIVED_FIELDS)
+        if include_archived
+        else ()
+    )
+
+    # Archived rows follow the live ones, each part sorted on its own.
+    def query(db):
+        if columns is not None:
+            todos = select_fields(
+                db,
+                columns,
+                Todos.deleted_at.is_(None),
+                *todo_filters(Todos, **filters),
+                order_by=order_by,
+            )
+
+            if include_archived:
+                todos += select_fields(
+                    db,
+                    columns_of(TodosArchive, columns),
+                    *todo_filters(TodosArchive, **filters),
+                    order_by=archived_order_by,
+                )
+
+            return todos
+
+        todos = read_todos(db, *todo_filters(Todos, **filters), order_by=order_by)
+
+        if include_archived:
+            todos += read_archived_todos(
+                db, *todo_filters(TodosArchive, **filters), order_by=archived_order_by
+            )
+
+        return todos
+
+    key = read_key(
+        db, "todos", user.get("user_id"), "list", fields, include_archived, sort
+    )
+    return await read_flight.do(key + tuple(filters.values()), with_session(db, query))
+
+
+@router.get("/next", status_code=status.HTTP_200_OK)
+async def read_next(
+    user: user_deps, db: db_deps, limit: int = Query(default=5, ge=1, le=100)
+):
+    return read_todos(
+        db,
+        Todos.user_id == user.get("user_id"),
+        Todos.complete.is_(False),
+        order_by=(Todos.priority.desc(), Todos.id),
+        limit=limit,
+    )
+
+
+@router.get("/changes", status_code=status.HTTP_200_OK)
+async def sync_changes(
+    user: user_deps,
+    db: db_deps,
+    since: Optional[str] = None,
+    limit: int = Query(default=500, ge=1, le=5000),
+):
+    return read_changes(db, user.get("user_id"), since, limit)
 
 
 @router.get("/todo/{id}", status_code=status.HTTP_200_OK)
 async def read_todo(db: db_deps, user: user_deps, id: int = Path(gt=0)):
-    todo = (
-        db.query(Todos)
-        .filter(Todos.id == id)
-        .filter(Todos.user_id == user.get("user_id"))
-        .first()
-    )
+    todo = find_todo(db, Todos.id == id, Todos.user_id == user.get("user_id"))
 
     if todo is None:
         raise HTTPException(status_code=404, detail="Todo Not Found")
@@ -131,13 +364,96 @@ async def read_todo(db: db_deps, user: user_deps, id: int = Path(gt=0)):
 
 
 @router.post("/todo/create", status_code=status.HTTP_201_CREATED)
-async def create_todo(db: db_deps, user: user_deps, todo_request: TodoRequest):
+async def create_todo(db: insert_db_deps, user: user_deps, todo_request: TodoRequest):
     if user is None:
         raise HTTPException(status_code=401, detail="Authentication Failed")
 
-    todo_model = Todos(**todo_request.model_dump(), user_id=user.get("user_id"))
+    values = {
+        **todo_request.model_dump(),
+        "user_id": user.get("user_id"),
+        "completed_at": completed_at(todo_request.complete),
+    }
+
+    batcher = batcher_for(user.get("user_id"))
+
+    if batcher.enabled:
+        await batcher.submit(values)
+        # The batcher's session is not the request's, so mark the write here.
+        replica_router.mark_write(user.get("user_id"))
+        read_flight.forget(("todos", user.get("user_id")))
+        return
+
+    todo_model = Todos(**values)
     db.add(todo_model)
     db.commit()
+    read_flight.forget(("todos", user.get("user_id")))
+
+
+def insert_import_batch(db: Session, batch: list) -> int:
+    # One short transaction per batch, so a large import never holds a long
+    # write transaction. Batches committed before a failure are kept.
+    db.execute(insert(Todos), batch)
+    db.commit()
+    return len(batch)
+
+
+# Sync on purpose: FastAPI runs it in the threadpool, so parsing a large
+# upload does not block the event loop.
+@router.post("/todo/import", status_code=status.HTTP_200_OK)
+def import_todos(
+    db: db_deps, user: user_deps, file: UploadFile, format: Optional[str] = None
+):
+    format = format or detect_format(file.filename, file.content_type)
+
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(
+            status_code=400, detail="Unsupported import format, use csv or ndjson"
+        )
+
+    accepted = 0
+    rejected = 0
+    errors = []
+    batch = []
+
+    for line, record, error in iter_records(file.file, format):
+        if error is None:
+            try:
+                todo_request = TodoRequest.model_validate(record)
+            except ValidationError as exc:
+                error = "; ".join(
+                    f"{'.'.join(map(str, e['loc'])) or 'record'}: {e['msg']}"
+                    for e in exc.errors()
+                )
+
+        if error is not None:
+            rejected += 1
+            if len(errors) < IMPORT_MAX_REPORTED_ERRORS:
+                errors.append({"line": line, "error": error})
+            continue
+
+        batch.append(
+            {
+                **todo_request.model_dump(),
+                "user_id": user.get("user_id"),
+                "completed_at": completed_at(todo_request.complete),
+            }
+        )
+
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            accepted += insert_import_batch(db, batch)
+            batch = []
+
+    if batch:
+        accepted += insert_import_batch(db, batch)
+
+    read_flight.forget(("todos", user.get("user_id")))
+
+    return {
+        "accepted": accepted,
+        "rejected": rejected,
+        "errors": errors,
+        "errors_truncated": rejected > len(errors),
+    }
 
 
 @router.put("/todo/update/{id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -148,6 +464,7 @@ async def update_todo(
         db.query(Todos)
         .filter(Todos.id == id)
         .filter(Todos.user_id == user.get("user_id"))
+        .filter(Todos.deleted_at.is_(None))
         .first()
     )
 
@@ -157,10 +474,15 @@ async def update_todo(
     todo_model.title = todo_request.title
     todo_model.description = todo_request.description
     todo_model.priority = todo_request.priority
+
+    if todo_request.complete != todo_model.complete:
+        todo_model.completed_at = completed_at(todo_request.complete)
+
     todo_model.complete = todo_request.complete
 
     db.add(todo_model)
     db.commit()
+    read_flight.forget(("todos", user.get("user_id")))
 
 
 @router.delete("/todo/delete/{id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -169,11 +491,16 @@ async def delete_todo(db: db_deps, user: user_deps, id: int = Path(gt=0)):
         db.query(Todos)
         .filter(Todos.id == id)
         .filter(Todos.user_id == user.get("user_id"))
+        .filter(Todos.deleted_at.is_(None))
         .first()
     )
 
     if todo_model is None:
         raise HTTPException(status_code=404, detail="Todo Not Found")
 
-    db.delete(todo_model)
+    # A soft delete only sets deleted_at; the purge worker removes the row.
+    todo_model.deleted_at = utcnow()
+    db.add(todo_model)
+    record_tombstones(db, [(todo_model.id, todo_model.user_id)])
     db.commit()
+    read_flight.forget(("todos", user.get("user_id")))
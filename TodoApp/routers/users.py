@@ -1,16 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Path
+from fastapi import APIRouter, Depends, HTTPException, status, Path, Request
 from pydantic import BaseModel, Field
 from typing import Annotated, Optional
 from sqlalchemy.orm import Session
 from ..models import Users
-from ..database import SessionLocal
-from .auth import get_current_user, bcrypt_context
+from ..singleflight import read_flight, read_key, with_session
+from ..database import READ_ONLY_METHODS, open_session
+from .auth import get_current_user, bcrypt_context, user_id_from_request
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 
-def get_db():
-    db = SessionLocal()
+def get_db(request: Request):
+    user_id = user_id_from_request(request)
+    read_only = request.method in READ_ONLY_METHODS
+    db = open_session(user_id, read_only)
     try:
         yield db
     finally:
@@ -45,7 +48,15 @@ user_deps = Annotated[dict, Depends(get_current_user)]
 
 @router.get("/current_user", status_code=status.HTTP_200_OK)
 async def get_user(user: user_deps, db: db_deps):
-    return db.query(Users).filter(Users.id == user.get("user_id")).first()
+    return await read_flight.do(
+        read_key(db, "users", user.get("user_id")),
+        with_session(
+            db,
+            lambda shared_db: shared_db.query(Users)
+            .filter(Users.id == user.get("user_id"))
+            .first(),
+        ),
+    )
 
 
 @router.put("/change_password", status_code=status.HTTP_204_NO_CONTENT)
@@ -72,6 +83,7 @@ async def change_password(
 
     db.add(user_model)
     db.commit()
+    read_flight.forget(("users", user.get("user_id")))
 
 
 @router.put("/update_phone_number", status_code=status.HTTP_204_NO_CONTENT)
@@ -87,3 +99,4 @@ async def update_phone_number(
 
     db.add(user_model)
     db.commit()
+    read_flight.forget(("users", user.get("user_id")))
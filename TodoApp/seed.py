@@ -0,0 +1,270 @@
+"""Generate and bulk load a synthetic dataset for scale testing.
+
+Run from the repository root, e.g. one million todos across 10k users:
+
+    python -m TodoApp.seed --users 10000 --todos-per-user 100
+"""
+
+import argparse
+import csv
+import io
+import os
+import random
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, Optional
+from sqlalchemy import create_engine, func, insert, select, text
+from sqlalchemy.engine import Engine
+from .database import SQLALCHEMY_DATABASE_URL, ShardRouter, shard_router
+from .models import Todos, Users
+from .sharding import stride_sequences
+from .routers.auth import bcrypt_context
+
+PRIORITY_WEIGHTS = {1: 0.10, 2: 0.20, 3: 0.40, 4: 0.20, 5: 0.10}
+
+WORDS = (
+    "buy call clean email finish fix write plan book review pay send read "
+    "update schedule order prepare groceries report invoice dentist taxes "
+    "project meeting garden laundry car insurance budget slides client team "
+    "birthday gift flight hotel notes backup homework recipe workout"
+).split()
+
+
+@dataclass
+class DatasetSpec:
+    users: int = 100
+    todos_per_user: int = 50
+    completion_ratio: float = 0.35
+    seed: int = 42
+    password: str = "password"
+
+
+def text_of(rng: random.Random, min_words: int, max_words: int, limit: int) -> str:
+    # Word counts follow a triangular distribution skewed towards short text.
+    count = round(rng.triangular(min_words, max_words, min_words))
+    return " ".join(rng.choice(WORDS) for _ in range(count)).capitalize()[:limit]
+
+
+def todo_count(rng: random.Random, mean: int) -> int:
+    # Heavy-tailed: most users have a few todos, a handful have very many.
+    return max(0, round(rng.paretovariate(2.0) * mean / 2))
+
+
+def generate_users(
+    spec: DatasetSpec, first_id: int, password_hash: str
+) -> Iterator[dict]:
+    for user_id in range(first_id, first_id + spec.users):
+        yield {
+            "id": user_id,
+            "email": f"user{user_id}@example.com",
+            "username": f"user{user_id}",
+            "first_name": f"First{user_id}",
+            "last_name": f"Last{user_id}",
+            "hash_password": password_hash,
+            "is_active": True,
+            "role": "admin" if user_id == first_id else "user",
+            "phone_number": f"555-{user_id // 10000 % 1000:03d}-{user_id % 10000:04d}",
+        }
+
+
+def generate_todos(spec: DatasetSpec, user_ids: range, first_id: int) -> Iterator[dict]:
+    rng = random.Random(spec.seed)
+    priorities = list(PRIORITY_WEIGHTS)
+    weights = list(PRIORITY_WEIGHTS.values())
+    now = datetime.now(timezone.utc)
+    todo_id = first_id
+
+    for user_id in user_ids:
+        for _ in range(todo_count(rng, spec.todos_per_user)):
+            complete = rng.random() < spec.completion_ratio
+
+            yield {
+                "id": todo_id,
+                "title": text_of(rng, 2, 8, 100),
+                "description": text_of(rng, 3, 16, 100),
+                "priority": rng.choices(priorities, weights)[0],
+                "complete": complete,
+                "user_id": user_id,
+                "completed_at": (
+                    now - timedelta(days=rng.expovariate(1 / 30)) if complete else None
+                ),
+                "updated_at": now,
+            }
+            todo_id += 1
+
+
+def batched(rows: Iterator[dict], size: int) -> Iterator[list]:
+    batch = []
+
+    for row in rows:
+        batch.append(row)
+
+        if len(batch) >= size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+def copy_rows(engine: Engine, table: str, columns: list, rows: list):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    for row in rows:
+        writer.writerow(
+            ["" if row[column] is None else row[column] for column in columns]
+        )
+
+    buffer.seek(0)
+    connection = engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def by_shard(router: ShardRouter, rows: list, user_key: str) -> list:
+    groups = {}
+
+    for row in rows:
+        shard_engine = router.engines[router.shard_id(row[user_key])]
+        groups.setdefault(shard_engine, []).append(row)
+
+    return list(groups.items())
+
+
+def write_rows(engine: Engine, table, rows: list, method: str):
+    if method == "copy":
+        copy_rows(engine, table.__tablename__, list(rows[0]), rows)
+    else:
+        with engine.begin() as connection:
+            connection.execute(insert(table), rows)
+
+
+def load_dataset(
+    engine: Engine,
+    spec: DatasetSpec,
+    batch_size: int = 10_000,
+    method: str = "auto",
+    password_hash: Optional[str] = None,
+    router: Optional[ShardRouter] = None,
+) -> dict:
+    """Insert `spec.users` users and their todos after the existing rows and
+    return counts and timings. bcrypt runs once; every user shares the hash.
+
+    With a sharded `router`, whose directory `engine` must be, users go to
+    the directory and each user's todos, with a copy of the user for their
+    foreign key, to the user's shard."""
+    if method == "auto":
+        method = "copy" if engine.dialect.name == "postgresql" else "insert"
+
+    if router is None or not router.sharded:
+        router = ShardRouter([engine], lambda user_id: 0, engine)
+
+    password_hash = password_hash or bcrypt_context.hash(spec.password)
+    started = time.perf_counter()
+
+    with engine.connect() as connection:
+        first_user = (connection.scalar(select(func.max(Users.id))) or 0) + 1
+
+    # New todo ids start past every shard's, so they are unique across shards.
+    first_todo = 1
+
+    for shard_engine in router.engines:
+        with shard_engine.connect() as connection:
+            first_todo = max(
+                first_todo, (connection.scalar(select(func.max(Todos.id))) or 0) + 1
+            )
+
+    user_ids = range(first_user, first_user + spec.users)
+    counts = {"users": 0, "todos": 0}
+
+    for batch in batched(generate_users(spec, first_user, password_hash), batch_size):
+        write_rows(engine, Users, batch, method)
+
+        for shard_engine, rows in by_shard(router, batch, "id"):
+            if shard_engine is not engine:
+                write_rows(shard_engine, Users, rows, method)
+
+        counts["users"] += len(batch)
+
+    for batch in batched(generate_todos(spec, user_ids, first_todo), batch_size):
+        for shard_engine, rows in by_shard(router, batch, "user_id"):
+            write_rows(shard_engine, Todos, rows, method)
+
+        counts["todos"] += len(batch)
+
+    # Explicit ids bypass the serial sequences; move them past the new rows.
+    if engine.dialect.name == "postgresql":
+        tables = ("users",) if router.sharded else ("users", "todos")
+
+        with engine.begin() as connection:
+            for table in tables:
+                connection.execute(
+                    text(
+                        f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                        f"(SELECT COALESCE(MAX(id), 1) FROM {table}))"
+                    )
+                )
+
+    if router.sharded:
+        # Keeps each shard's todo ids in its own residue class.
+        stride_sequences(router, report=lambda line: None)
+
+    return {
+        **counts,
+        "user_ids": user_ids,
+        "method": method,
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=DatasetSpec.users)
+    parser.add_argument(
+        "--todos-per-user", type=int, default=DatasetSpec.todos_per_user
+    )
+    parser.add_argument(
+        "--completion-ratio", type=float, default=DatasetSpec.completion_ratio
+    )
+    parser.add_argument("--seed", type=int, default=DatasetSpec.seed)
+    parser.add_argument("--password", default=DatasetSpec.password)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--method", choices=["auto", "insert", "copy"], default="auto")
+    parser.add_argument("--url", default=os.getenv("SQLALCHEMY_DATABASE_URL"))
+    args = parser.parse_args()
+
+    spec = DatasetSpec(
+        users=args.users,
+        todos_per_user=args.todos_per_user,
+        completion_ratio=args.completion_ratio,
+        seed=args.seed,
+        password=args.password,
+    )
+    # The app's own database is the shard directory when sharding is on.
+    router = shard_router if args.url == SQLALCHEMY_DATABASE_URL else None
+    result = load_dataset(
+        router.directory if router else create_engine(args.url),
+        spec,
+        batch_size=args.batch_size,
+        method=args.method,
+        router=router,
+    )
+
+    rate = (result["users"] + result["todos"]) / result["seconds"]
+    print(
+        f"Loaded {result['users']} users and {result['todos']} todos "
+        f"with {result['method']} in {result['seconds']:.1f}s ({rate:,.0f} rows/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
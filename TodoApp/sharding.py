@@ -0,0 +1,358 @@
+"""Shard maintenance for todos spread over SQLALCHEMY_SHARD_URLS.
+
+Run from the repository root:
+
+    python -m TodoApp.sharding rebalance [--dry-run]
+    python -m TodoApp.sharding stride-sequences
+
+`rebalance` moves every user whose rows sit on a shard other than the one
+the configured strategy now picks, e.g. after adding a shard. Todo ids are
+kept, so synced clients see no change. Moves only succeed when todo ids are
+unique across shards; on PostgreSQL `stride-sequences` makes them so by giving
+each shard its own residue class of ids.
+"""
+
+import argparse
+from typing import Optional
+from alembic.runtime.migration import MigrationContext
+from sqlalchemy import (
+    Column,
+    MetaData,
+    String,
+    Table,
+    bindparam,
+    delete,
+    func,
+    insert,
+    inspect,
+    select,
+    text,
+    union,
+    update,
+)
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from .database import Base, ShardRouter, shard_router
+from .models import Todos, TodosArchive, TodoTombstones, Users
+
+SHARDED_TABLES = (Todos, TodosArchive, TodoTombstones)
+# A todo only ever moves on to the archive or gains a tombstone, never back.
+# Copying those later states first means a row that changes during a move is
+# at worst left on the source for the next run, never copied twice.
+MOVE_ORDER = (TodoTombstones, TodosArchive, Todos)
+# What is kept of each copied row to delete it from the source afterwards.
+COPY_KEYS = {
+    Todos: ("id", "updated_at", "deleted_at"),
+    TodosArchive: ("id",),
+    TodoTombstones: ("id",),
+}
+
+
+# Alembic's own table; written directly to stamp new shards, since loading
+# the revision scripts needs the alembic working directory on sys.path.
+alembic_version = Table(
+    "alembic_version",
+    MetaData(),
+    Column("version_num", String(32), primary_key=True),
+)
+
+
+class ShardConflict(Exception):
+    pass
+
+
+class ShardSchemaMismatch(Exception):
+    pass
+
+
+def migration_revision(db_engine: Engine) -> Optional[str]:
+    with db_engine.connect() as connection:
+        return MigrationContext.configure(connection).get_current_revision()
+
+
+def prepare_shards(router: ShardRouter = shard_router):
+    """Create the tables of shards that have none yet, stamped at the
+    directory's Alembic revision, and refuse shards at any other revision.
+
+    Existing shards only get schema changes from `alembic upgrade head`,
+    which migrates every shard in SQLALCHEMY_SHARD_URLS; `create_all` never
+    alters a table that is already there."""
+    revision = migration_revision(router.directory)
+
+    for shard_engine in router.engines:
+        if shard_engine is router.directory:
+            continue
+
+        if not inspect(shard_engine).has_table(Todos.__tablename__):
+            Base.metadata.create_all(bind=shard_engine)
+
+            if revision is not None:
+                with shard_engine.begin() as connection:
+                    alembic_version.create(connection, checkfirst=True)
+                    connection.execute(
+                        insert(alembic_version), {"version_num": revision}
+                    )
+            continue
+
+        shard_revision = migration_revision(shard_engine)
+
+        if revision is not None and shard_revision != revision:
+            raise ShardSchemaMismatch(
+                f"Shard {shard_engine.url!r} is at revision {shard_revision}, "
+                f"the directory at {revision}; run `alembic upgrade head` "
+                "with SQLALCHEMY_SHARD_URLS set"
+            )
+
+
+def copy_user(
+    router: ShardRouter, user_id: int, target: Engine, user: Optional[dict] = None
+):
+    """Give the user a row on `target` so its todos can reference it there.
+    The directory keeps the authoritative copy; `user` saves reading it when
+    the caller has the row, e.g. before committing it."""
+    if target is router.directory:
+        return
+
+    if user is None:
+        with router.directory.connect() as directory:
+            user = (
+                directory.execute(select(Users.__table__).where(Users.id == user_id))
+                .mappings()
+                .first()
+            )
+
+    if user is None:
+        return
+
+    with target.begin() as shard:
+        # Overwrite a stale copy left by a user whose creation was rolled back.
+        shard.execute(delete(Users).where(Users.id == user_id))
+        shard.execute(insert(Users), [dict(user)])
+
+
+def place_user(
+    user_id: int, router: ShardRouter = shard_router, user: Optional[dict] = None
+):
+    if router.sharded:
+        copy_user(router, user_id, router.engines[router.shard_id(user_id)], user)
+
+
+def misplaced_users(router: ShardRouter, shard_index: int) -> list:
+    owners = union(
+        *(select(table.user_id).distinct() for table in SHARDED_TABLES)
+    ).subquery()
+
+    with router.engines[shard_index].connect() as shard:
+        user_ids = shard.execute(select(owners.c[0])).scalars().all()
+
+    return sorted(
+        user_id
+        for user_id in user_ids
+        if user_id is not None and router.shard_id(user_id) != shard_index
+    )
+
+
+def copy_rows(dst, table, user_id: int, batch: list) -> int:
+    """Insert the rows of `batch` missing from the target and bring the ones
+    already there up to date; return how many were written."""
+    if table is TodoTombstones:
+        # Tombstones have no identity of their own; the same delete of the
+        # same todo is the same tombstone.
+        present = set(
+            dst.execute(
+                select(TodoTombstones.todo_id, TodoTombstones.deleted_at).where(
+                    TodoTombstones.user_id == user_id,
+                    TodoTombstones.todo_id.in_([row["todo_id"] for row in batch]),
+                )
+            ).all()
+        )
+        batch = [
+            {key: value for key, value in row.items() if key != "id"}
+            for row in batch
+            if (row["todo_id"], row["deleted_at"]) not in present
+        ]
+        if batch:
+            dst.execute(insert(table), batch)
+        return len(batch)
+
+    present = set(
+        dst.scalars(
+            select(table.id).where(
+                table.id.in_([row["id"] for row in batch]),
+                table.user_id == user_id,
+            )
+        )
+    )
+    new = [row for row in batch if row["id"] not in present]
+    # Left by an earlier run and changed on the source since.
+    changed = [{**row, "b_id": row["id"]} for row in batch if row["id"] in present]
+
+    if new:
+        dst.execute(insert(table), new)
+    if changed:
+        dst.execute(
+            update(table.__table__)
+            .where(table.__table__.c.id == bindparam("b_id"))
+            .values({column: bindparam(column) for column in batch[0]}),
+            changed,
+        )
+    return len(new) + len(changed)
+
+
+def delete_copied(src, table, batch: list):
+    """Delete the copied rows from the source, except those changed since
+    they were read; the next run moves those."""
+    if table is Todos:
+        src.execute(
+            delete(Todos)
+            .where(Todos.id == bindparam("b_id"))
+            .where(Todos.updated_at.is_not_distinct_from(bindparam("b_updated_at")))
+            .where(Todos.deleted_at.is_not_distinct_from(bindparam("b_deleted_at"))),
+            [
+                {
+                    "b_id": row["id"],
+                    "b_updated_at": row["updated_at"],
+                    "b_deleted_at": row["deleted_at"],
+                }
+                for row in batch
+            ],
+        )
+    else:
+        src.execute(delete(table).where(table.id.in_([row["id"] for row in batch])))
+
+
+def move_user(
+    router: ShardRouter,
+    user_id: int,
+    source_index: int,
+    target_index: int,
+    batch_size: int = 1000,
+) -> dict:
+    """Copy a user's rows to the target shard, then delete exactly the copied
+    rows from the source. Rows written or changed on the source meanwhile,
+    e.g. by processes still on the old configuration, stay there and are
+    moved by the next run. Safe to re-run."""
+    source = router.engines[source_index]
+    target = router.engines[target_index]
+    moved = {}
+    copied = {}
+
+    copy_user(router, user_id, target)
+
+    try:
+        with source.connect() as src, target.begin() as dst:
+            for table in MOVE_ORDER:
+                rows = src.execute(
+                    select(table.__table__)
+                    .where(table.user_id == user_id)
+                    .execution_options(yield_per=batch_size)
+                ).mappings()
+                moved[table.__tablename__] = 0
+                copied[table] = []
+
+                for batch in rows.partitions(batch_size):
+                    batch = [dict(row) for row in batch]
+                    moved[table.__tablename__] += copy_rows(dst, table, user_id, batch)
+                    copied[table].append(
+                        [{key: row[key] for key in COPY_KEYS[table]} for row in batch]
+                    )
+    except IntegrityError as exc:
+        raise ShardConflict(
+            f"User {user_id}: ids already used on shard {target_index}"
+        ) from exc
+
+    with source.begin() as src:
+        for table in MOVE_ORDER:
+            for batch in copied[table]:
+                delete_copied(src, table, batch)
+
+        remaining = any(
+            src.scalar(select(table.id).where(table.user_id == user_id).limit(1))
+            for table in SHARDED_TABLES
+        )
+
+        if source is not router.directory and not remaining:
+            src.execute(delete(Users).where(Users.id == user_id))
+
+    return {table.__tablename__: moved[table.__tablename__] for table in SHARDED_TABLES}
+
+
+def rebalance(
+    router: ShardRouter = shard_router, dry_run: bool = False, report=print
+) -> dict:
+    summary = {"moved": 0, "conflicts": 0}
+
+    for source_index in range(len(router.engines)):
+        for user_id in misplaced_users(router, source_index):
+            target_index = router.shard_id(user_id)
+
+            if dry_run:
+                report(f"user {user_id}: shard {source_index} -> {target_index}")
+                summary["moved"] += 1
+                continue
+
+            try:
+                moved = move_user(router, user_id, source_index, target_index)
+            except ShardConflict as exc:
+                report(str(exc))
+                summary["conflicts"] += 1
+                continue
+
+            report(
+                f"user {user_id}: shard {source_index} -> {target_index} "
+                + ", ".join(f"{count} {table}" for table, count in moved.items())
+            )
+            summary["moved"] += 1
+
+    return summary
+
+
+def stride_sequences(router: ShardRouter = shard_router, report=print):
+    """Make PostgreSQL shards hand out disjoint todo ids: shard k of N
+    continues at ids congruent to k modulo N."""
+    shard_count = len(router.engines)
+    highest = 0
+
+    for shard in router.engines:
+        with shard.connect() as connection:
+            highest = max(highest, connection.scalar(select(func.max(Todos.id))) or 0)
+
+    for index, shard in enumerate(router.engines):
+        if shard.dialect.name != "postgresql":
+            report(f"shard {index}: skipped, sequences need PostgreSQL")
+            continue
+
+        start = highest + 1 + (index - highest - 1) % shard_count
+
+        with shard.begin() as connection:
+            sequence = connection.scalar(
+                text("SELECT pg_get_serial_sequence('todos', 'id')")
+            )
+            connection.execute(
+                text(f"ALTER SEQUENCE {sequence} INCREMENT BY {shard_count}")
+            )
+            connection.execute(
+                text("SELECT setval(:sequence, :start, false)"),
+                {"sequence": sequence, "start": start},
+            )
+
+        report(f"shard {index}: next todo id {start}, step {shard_count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebalance_parser = commands.add_parser("rebalance")
+    rebalance_parser.add_argument("--dry-run", action="store_true")
+    commands.add_parser("stride-sequences")
+    args = parser.parse_args()
+
+    if args.command == "rebalance":
+        summary = rebalance(dry_run=args.dry_run)
+        print(f"{summary['moved']} users moved, {summary['conflicts']} conflicts")
+    else:
+        stride_sequences()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import asyncio
+import os
+import threading
+from typing import Callable, Hashable
+from sqlalchemy.orm import Session
+
+SINGLE_FLIGHT_ENABLED = os.getenv("TODO_SINGLE_FLIGHT", "true").lower() == "true"
+
+
+class SingleFlight:
+    """Coalesces concurrent identical reads: while a call for `key` is running,
+    later callers with the same key wait for its result instead of running
+    the query again. Nothing is cached once the call finishes."""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], object]):
+        """Run the blocking `fn` in the threadpool, or join the run already in
+        flight for `key`. Its result or exception goes to every caller. A
+        caller that is cancelled stops waiting without cancelling the
+        shared run, so the others still get their answer."""
+        if not self.enabled:
+            return await asyncio.to_thread(fn)
+
+        loop = asyncio.get_running_loop()
+
+        with self._lock:
+            self.calls += 1
+            task = self._inflight.get((loop, key))
+
+            if task is None:
+                self.executions += 1
+                task = loop.create_task(asyncio.to_thread(fn))
+                task.add_done_callback(lambda done: self._finish(loop, key, done))
+                self._inflight[(loop, key)] = task
+            else:
+                self.coalesced += 1
+
+        return await asyncio.shield(task)
+
+    def forget(self, prefix: tuple):
+        """Stop handing out runs whose key starts with `prefix`; callers that
+        arrive after a write must not get a result read before it."""
+        with self._lock:
+            for loop, key in list(self._inflight):
+                if key[: len(prefix)] == prefix:
+                    del self._inflight[(loop, key)]
+
+    def _finish(self, loop, key: Hashable, task: asyncio.Task):
+        with self._lock:
+            if self._inflight.get((loop, key)) is task:
+                del self._inflight[(loop, key)]
+
+            # Retrieving the exception also keeps asyncio from logging it
+            # when every caller was cancelled before the run finished.
+            if not task.cancelled() and task.exception() is not None:
+                self.errors += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "calls": self.calls,
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "in_flight": len(self._inflight),
+            }
+
+
+def read_key(db: Session, scope: str, user_id, *parts) -> tuple:
+    """Key for a read of `user_id`'s `scope` on the database `db` is bound
+    to, so a read pinned to the primary never joins one running on a lagging
+    replica. `forget((scope, user_id))` still matches it."""
+    return (scope, user_id, db.get_bind(), *parts)
+
+
+def with_session(db: Session, query: Callable[[Session], object]):
+    """Wrap `query` to run on a fresh session bound where `db` is, so the
+    shared run does not depend on the session of whichever request
+    started it."""
+
+    def run():
+        shared_db = Session(bind=db.get_bind())
+        try:
+            return query(shared_db)
+        finally:
+            shared_db.close()
+
+    return run
+
+
+read_flight = SingleFlight(enabled=SINGLE_FLIGHT_ENABLED)
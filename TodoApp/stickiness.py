@@ -0,0 +1,58 @@
+import time
+from starlette.requests import Request
+from .database import request_stickiness
+
+# Carries the end of a client's read-from-primary window between requests,
+# as a cookie for browsers and a header for API clients.
+STICKY_COOKIE = "primary_until"
+STICKY_HEADER = "x-primary-until"
+
+
+def marker_of(request: Request) -> float:
+    value = request.cookies.get(STICKY_COOKIE) or request.headers.get(STICKY_HEADER)
+
+    try:
+        return float(value or 0)
+    except ValueError:
+        return 0.0
+
+
+class StickinessMiddleware:
+    """Hands the client a marker when its request commits a write, and reads
+    it back on later requests, so the replica router keeps that client on
+    the primary for the sticky window whichever worker process serves it."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stickiness = {"read_until": marker_of(Request(scope))}
+        token = request_stickiness.set(stickiness)
+
+        async def send_with_marker(message):
+            if (
+                message["type"] == "http.response.start"
+                and "written_until" in stickiness
+            ):
+                until = stickiness["written_until"]
+                max_age = max(1, round(until - time.time()))
+                headers = [*message.get("headers", [])]
+                headers.append(
+                    (
+                        b"set-cookie",
+                        f"{STICKY_COOKIE}={until:.3f}; Max-Age={max_age}; "
+                        "Path=/; HttpOnly; SameSite=Lax".encode(),
+                    )
+                )
+                headers.append((STICKY_HEADER.encode(), f"{until:.3f}".encode()))
+                message = {**message, "headers": headers}
+
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_marker)
+        finally:
+            request_stickiness.reset(token)
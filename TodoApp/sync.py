@@ -0,0 +1,189 @@
+import base64
+import binascii
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import and_, insert, or_, select
+from sqlalchemy.orm import Session
+from .models import Todos, TodoTombstones, utcnow
+from .readers import CHANGED_TODO_COLUMNS, ChangedTodoRow
+
+STREAMS = ("todos", "deleted")
+
+# updated_at and deleted_at are stamped when a transaction writes, not when it
+# commits, so a slow transaction can commit rows older than a cursor already
+# handed out, and workers' clocks can drift apart. A caught-up client's next
+# sync re-reads this far behind its cursor; clients apply changes by id, so
+# the rows sent twice are harmless.
+SYNC_SAFETY_WINDOW_SECONDS = float(os.getenv("TODO_SYNC_SAFETY_WINDOW_SECONDS", "30"))
+# Cursors from a sync run that started longer ago than this get a 410, and
+# the client starts over with a full sync. Tombstones are kept at least this
+# long plus the safety window (see `tombstone_cutoff`), so a cursor that is
+# still honored never misses a delete.
+SYNC_CURSOR_MAX_AGE_DAYS = float(os.getenv("TODO_SYNC_CURSOR_MAX_AGE_DAYS", "30"))
+TOMBSTONE_RETENTION_DAYS = float(os.getenv("TODO_TOMBSTONE_RETENTION_DAYS", "60"))
+
+
+def aware(timestamp: datetime) -> datetime:
+    # SQLite hands back naive datetimes; they are stored in UTC.
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp
+
+
+def tombstone_cutoff() -> datetime:
+    """Tombstones deleted before this are no longer needed by any cursor
+    `read_changes` still accepts."""
+    keep = max(
+        timedelta(days=TOMBSTONE_RETENTION_DAYS),
+        timedelta(days=SYNC_CURSOR_MAX_AGE_DAYS, seconds=SYNC_SAFETY_WINDOW_SECONDS),
+    )
+    return utcnow() - keep
+
+
+def encode_cursor(position: dict, rewind: bool, synced_at: datetime) -> str:
+    keys = {
+        stream: [key[0].isoformat(), key[1]] if key else None
+        for stream, key in position.items()
+    }
+    keys["rewind"] = rewind
+    keys["synced_at"] = synced_at.isoformat()
+
+    return base64.urlsafe_b64encode(json.dumps(keys).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """The `(position, rewind, synced_at)` of a cursor. `rewind` is set once a
+    sync has caught up, and cursors from before it existed are treated the
+    same. `synced_at` is when the cursor's sync run started; cursors from
+    before it existed are taken to be as old as the newest row they saw."""
+    try:
+        keys = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+        position = {
+            stream: (
+                (datetime.fromisoformat(keys[stream][0]), int(keys[stream][1]))
+                if keys.get(stream)
+                else None
+            )
+            for stream in STREAMS
+        }
+
+        if keys.get("synced_at"):
+            synced_at = aware(datetime.fromisoformat(keys["synced_at"]))
+        else:
+            seen = [aware(key[0]) for key in position.values() if key]
+            synced_at = max(seen, default=datetime.min.replace(tzinfo=timezone.utc))
+
+        return position, bool(keys.get("rewind", True)), synced_at
+    except (binascii.Error, ValueError, TypeError, AttributeError, IndexError):
+        raise HTTPException(status_code=400, detail="Invalid sync cursor")
+
+
+def after(timestamp_column, id_column, key):
+    # Keyset on (timestamp, id) so rows sharing a timestamp are not skipped.
+    timestamp, id = key
+
+    return or_(
+        timestamp_column > timestamp,
+        and_(timestamp_column == timestamp, id_column > id),
+    )
+
+
+def record_tombstones(db: Session, todos: list):
+    """Remember `(todo_id, user_id)` pairs leaving the todos table so delta
+    sync can tell clients to drop them."""
+    if todos:
+        db.execute(
+            insert(TodoTombstones),
+            [{"todo_id": todo_id, "user_id": user_id} for todo_id, user_id in todos],
+        )
+
+
+def read_changes(db: Session, user_id: int, since: Optional[str], limit: int):
+    """Todos created, updated or deleted for `user_id` after the `since`
+    cursor, oldest first, at most `limit` of each kind per page. The first
+    page after a caught-up cursor starts SYNC_SAFETY_WINDOW_SECONDS earlier,
+    so it may repeat changes the client already has."""
+    position, rewind, synced_at = (
+        decode_cursor(since) if since else (dict.fromkeys(STREAMS), False, None)
+    )
+
+    if synced_at is not None and synced_at < utcnow() - timedelta(
+        days=SYNC_CURSOR_MAX_AGE_DAYS
+    ):
+        # Tombstones it still needs may have been pruned.
+        raise HTTPException(
+            status_code=410, detail="Sync cursor expired, sync again without since"
+        )
+
+    # A run of pages keeps the time it started: until it has caught up, the
+    # client is only known to be complete as of then.
+    if synced_at is None or rewind:
+        synced_at = utcnow()
+
+    if since is None:
+        # A first sync downloads every live todo, so older deletes are moot.
+        latest = db.execute(
+            select(TodoTombstones.deleted_at, TodoTombstones.id)
+            .where(TodoTombstones.user_id == user_id)
+            .order_by(TodoTombstones.deleted_at.desc(), TodoTombstones.id.desc())
+            .limit(1)
+        ).first()
+        position["deleted"] = tuple(latest) if latest else None
+
+    # Pages in the middle of a sync continue exactly after the last row, so
+    # paging always moves forward.
+    start = dict(position)
+
+    if rewind and SYNC_SAFETY_WINDOW_SECONDS > 0:
+        window = timedelta(seconds=SYNC_SAFETY_WINDOW_SECONDS)
+        start = {
+            stream: (key[0] - window, 0) if key else None
+            for stream, key in position.items()
+        }
+
+    todos_query = (
+        select(*CHANGED_TODO_COLUMNS)
+        .where(Todos.user_id == user_id, Todos.deleted_at.is_(None))
+        .order_by(Todos.updated_at, Todos.id)
+        .limit(limit + 1)
+    )
+    if start["todos"]:
+        todos_query = todos_query.where(
+            after(Todos.updated_at, Todos.id, start["todos"])
+        )
+
+    deleted_query = (
+        select(TodoTombstones.id, TodoTombstones.todo_id, TodoTombstones.deleted_at)
+        .where(TodoTombstones.user_id == user_id)
+        .order_by(TodoTombstones.deleted_at, TodoTombstones.id)
+        .limit(limit + 1)
+    )
+    if start["deleted"]:
+        deleted_query = deleted_query.where(
+            after(TodoTombstones.deleted_at, TodoTombstones.id, start["deleted"])
+        )
+
+    todos = [ChangedTodoRow(*row) for row in db.execute(todos_query)]
+    deleted = db.execute(deleted_query).all()
+    has_more = len(todos) > limit or len(deleted) > limit
+    todos, deleted = todos[:limit], deleted[:limit]
+
+    # After a rewound page this can be behind the old cursor; the next pages
+    # carry on from here, so nothing between the two is skipped.
+    if todos:
+        position["todos"] = (todos[-1].updated_at, todos[-1].id)
+    if deleted:
+        position["deleted"] = (deleted[-1].deleted_at, deleted[-1].id)
+
+    return {
+        "todos": todos,
+        "deleted": [
+            {"id": row.todo_id, "deleted_at": row.deleted_at} for row in deleted
+        ],
+        "cursor": encode_cursor(position, rewind=not has_more, synced_at=synced_at),
+        "has_more": has_more,
+    }
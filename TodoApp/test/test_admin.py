@@ -1,5 +1,6 @@
 from .utils import *
 from ..routers.admin import get_current_user, get_db
+from ..singleflight import read_flight
 from fastapi import status
 
 app.dependency_overrides[get_current_user] = override_get_current_user
@@ -32,7 +33,16 @@ def test_admin_delete_todo(test_todo):
 
     model = db.query(Todos).filter(Todos.id == 1).first()
 
-    assert model is None
+    assert model.deleted_at is not None
+
+
+def test_admin_delete_todo_drops_shared_reads(test_todo, monkeypatch):
+    forgotten = []
+    monkeypatch.setattr(read_flight, "forget", forgotten.append)
+
+    client.delete("/admin/todo/delete/1")
+
+    assert forgotten == [("todos", 1)]
 
 
 def test_admin_delete_todo_not_found():
@@ -40,3 +50,10 @@ def test_admin_delete_todo_not_found():
 
     assert response.status_code == status.HTTP_404_NOT_FOUND
     assert response.json() == {"detail": "Todo Not Found"}
+
+
+def test_admin_read_all_sparse_fields(test_todo):
+    response = client.get("/admin/todo", params={"fields": "id,user_id"})
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [{"id": 1, "user_id": 1}]
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta, timezone
+from fastapi import status
+from .utils import *
+from ..archive import archive_completed_todos
+from ..routers.todos import get_current_user, get_db
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+
+def add_completed_todo(title: str, completed_at):
+    db = TestSessionLocal()
+    db.add(
+        Todos(
+            title=title,
+            description="Done",
+            priority=1,
+            complete=True,
+            completed_at=completed_at,
+            user_id=1,
+        )
+    )
+    db.commit()
+    db.close()
+
+
+def test_archive_moves_old_completed_todos(test_todo):
+    old = datetime.now(timezone.utc) - timedelta(days=60)
+    add_completed_todo("Old todo", old)
+    add_completed_todo("Recent todo", datetime.now(timezone.utc))
+    add_completed_todo("Untracked todo", None)
+
+    moved = archive_completed_todos(
+        TestSessionLocal, older_than=timedelta(days=30), batch_size=1
+    )
+
+    assert moved == 1
+
+    db = TestSessionLocal()
+    hot = {todo.title for todo in db.query(Todos).all()}
+    cold = {todo.title for todo in db.query(TodosArchive).all()}
+
+    # Without completed_at a todo's age is unknown, so it is left alone.
+    assert hot == {"Learn to code!", "Recent todo", "Untracked todo"}
+    assert cold == {"Old todo"}
+    assert all(todo.archived_at is not None for todo in db.query(TodosArchive))
+
+
+def test_read_all_include_archived(test_todo):
+    add_completed_todo("Old todo", datetime.now(timezone.utc) - timedelta(days=60))
+    archive_completed_todos(TestSessionLocal, older_than=timedelta(days=30))
+
+    response = client.get("/todos")
+    assert [todo["title"] for todo in response.json()] == ["Learn to code!"]
+
+    response = client.get("/todos", params={"include_archived": True})
+    assert response.status_code == status.HTTP_200_OK
+    assert [todo["title"] for todo in response.json()] == [
+        "Learn to code!",
+        "Old todo",
+    ]
+
+    response = client.get(
+        "/todos", params={"include_archived": True, "fields": "title"}
+    )
+    assert response.json() == [{"title": "Learn to code!"}, {"title": "Old todo"}]
+
+
+def test_complete_todo_sets_completed_at(test_todo):
+    request_data = {
+        "title": "Learn to code!",
+        "description": "Need to learn everyday!",
+        "priority": 3,
+        "complete": True,
+    }
+
+    client.put("/todos/todo/update/1", json=request_data)
+
+    db = TestSessionLocal()
+    assert db.query(Todos).filter(Todos.id == 1).first().completed_at is not None
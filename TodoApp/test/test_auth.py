@@ -51,8 +51,7 @@ def test_create_access_token():
     assert decoded_token["role"] == role
 
 
-@pytest.mark.asyncio
-async def test_get_current_user():
+def test_get_current_user(test_user):
     encode = {
         "sub": "test_user",
         "id": 1,
@@ -62,13 +61,15 @@ async def test_get_current_user():
 
     token = jwt.encode(encode, SECRET_KEY, algorithm=ALGORITHM)
 
-    user = await get_current_user(token)
+    db = TestSessionLocal()
+    user = get_current_user(token, db)
 
     assert user == {"user_id": 1, "user_role": "user", "username": "test_user"}
+    # The connection goes back to the pool before the endpoint runs.
+    assert not db.in_transaction()
 
 
-@pytest.mark.asyncio
-async def test_get_current_user_missing_payload():
+def test_get_current_user_missing_payload():
     encode = {
         "role": "user",
     }
@@ -76,7 +77,46 @@ async def test_get_current_user_missing_payload():
     token = jwt.encode(encode, SECRET_KEY, algorithm=ALGORITHM)
 
     with pytest.raises(HTTPException) as excinfo:
-        await get_current_user(token)
+        get_current_user(token, TestSessionLocal())
 
     assert excinfo.value.status_code == status.HTTP_401_UNAUTHORIZED
     assert excinfo.value.detail == "Could not Authenticate"
+
+
+def test_get_current_user_rejects_deactivated_and_removed_users(test_user):
+    token = create_access_token(
+        "willswinson", test_user.id, "admin", timedelta(minutes=20)
+    )
+    db = TestSessionLocal()
+
+    db.query(Users).update({"is_active": False})
+    db.commit()
+
+    with pytest.raises(HTTPException) as excinfo:
+        get_current_user(token, db)
+
+    assert excinfo.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+    db.query(Users).delete()
+    db.commit()
+
+    with pytest.raises(HTTPException):
+        get_current_user(token, db)
+
+    db.close()
+
+
+def test_get_users_hides_password_hash(test_user):
+    response = client.get("/auth/")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()[0]["username"] == test_user.username
+    assert "hash_password" not in response.json()[0]
+
+    response = client.get("/auth/", params={"fields": "id,username"})
+
+    assert response.json() == [{"id": 1, "username": "willswinson"}]
+
+    response = client.get("/auth/", params={"fields": "hash_password"})
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
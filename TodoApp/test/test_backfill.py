@@ -0,0 +1,108 @@
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, select
+from sqlalchemy.pool import StaticPool
+from ..backfill import checkpoints, run_backfill
+
+metadata = MetaData()
+
+items = Table(
+    "items",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("priority", Integer),
+    Column("label", String),
+)
+
+
+@pytest.fixture
+def connection():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    metadata.create_all(engine)
+
+    with engine.connect() as connection:
+        with connection.begin():
+            connection.execute(
+                items.insert(), [{"id": i, "priority": i % 5} for i in range(1, 26)]
+            )
+
+        yield connection
+
+    engine.dispose()
+
+
+def labels(connection):
+    with connection.begin():
+        query = select(items.c.label).order_by(items.c.id)
+        return connection.execute(query).scalars().all()
+
+
+def test_backfill_updates_in_chunks(connection):
+    reports = []
+
+    report = run_backfill(
+        connection,
+        name="items_label",
+        table=items,
+        values={"label": "done"},
+        batch_size=10,
+        progress=lambda progress: reports.append(progress.rows_done),
+    )
+
+    assert report.completed
+    assert report.rows_done == 25
+    assert reports == [10, 20, 25]
+    assert set(labels(connection)) == {"done"}
+
+
+def test_backfill_resumes_from_checkpoint(connection):
+    first = run_backfill(
+        connection,
+        name="items_label",
+        table=items,
+        values={"label": "done"},
+        batch_size=10,
+        max_batches=1,
+    )
+
+    assert not first.completed
+    assert first.last_key == 10
+    assert labels(connection).count("done") == 10
+
+    second = run_backfill(
+        connection, name="items_label", table=items, values={"label": "done"}
+    )
+
+    assert second.completed
+    assert second.rows_done == 25
+    assert second.rows_this_run == 15
+
+    with connection.begin():
+        state = connection.execute(select(checkpoints)).one()
+
+    assert state.completed
+    assert state.last_key == 25
+
+
+def test_backfill_with_filter_and_callable(connection):
+    def set_label(connection, keys):
+        connection.execute(
+            items.update().where(items.c.id.in_(keys)).values(label="high")
+        )
+
+    report = run_backfill(
+        connection,
+        name="items_high",
+        table=items,
+        values=set_label,
+        where=items.c.priority == 4,
+        batch_size=2,
+    )
+
+    assert report.rows_done == 5
+    assert labels(connection).count("high") == 5
+
+
+def test_backfill_refuses_outer_transaction(connection):
+    with connection.begin():
+        with pytest.raises(RuntimeError):
+            run_backfill(connection, "items_label", items, {"label": "done"})
@@ -0,0 +1,101 @@
+import asyncio
+import httpx
+import pytest
+from fastapi import status
+from .utils import *
+from ..batching import BATCH_INSERTS_ENABLED, TodoInsertBatcher
+from ..routers import todos
+from ..routers.admin import get_current_user
+
+app.dependency_overrides[get_current_user] = override_get_current_user
+app.dependency_overrides[todos.get_db] = override_get_db
+
+
+def new_todo(title: str):
+    return {
+        "title": title,
+        "description": "Batched todo",
+        "priority": 2,
+        "complete": False,
+        "user_id": 1,
+    }
+
+
+@pytest.mark.asyncio
+async def test_batcher_groups_concurrent_inserts(test_todo):
+    batcher = TodoInsertBatcher(TestSessionLocal, max_batch_size=10, max_delay_ms=50)
+
+    ids = await asyncio.gather(
+        *(batcher.submit(new_todo(f"Todo {i}")) for i in range(5))
+    )
+
+    assert len(set(ids)) == 5
+
+    db = TestSessionLocal()
+    titles = {todo.id: todo.title for todo in db.query(Todos).all()}
+
+    assert [titles[id] for id in ids] == [f"Todo {i}" for i in range(5)]
+    assert batcher.metrics.snapshot()["batches"] == 1
+    assert batcher.metrics.snapshot()["max_batch_size"] == 5
+
+
+@pytest.mark.asyncio
+async def test_batcher_flushes_when_full(test_todo):
+    batcher = TodoInsertBatcher(TestSessionLocal, max_batch_size=2, max_delay_ms=1000)
+
+    await asyncio.wait_for(
+        asyncio.gather(*(batcher.submit(new_todo(f"Todo {i}")) for i in range(4))),
+        timeout=1,
+    )
+
+    assert batcher.metrics.snapshot()["batches"] == 2
+
+
+@pytest.mark.asyncio
+async def test_batcher_isolates_failing_rows(test_todo):
+    batcher = TodoInsertBatcher(TestSessionLocal, max_batch_size=10, max_delay_ms=50)
+
+    results = await asyncio.gather(
+        batcher.submit(new_todo("Good todo")),
+        batcher.submit({**new_todo("Bad todo"), "id": test_todo.id}),
+        return_exceptions=True,
+    )
+
+    assert isinstance(results[0], int)
+    assert isinstance(results[1], Exception)
+    assert batcher.metrics.snapshot()["failed_batches"] == 1
+
+
+@pytest.mark.asyncio
+async def test_batched_creates_end_to_end(test_todo, monkeypatch):
+    batcher = TodoInsertBatcher(TestSessionLocal, max_batch_size=8, max_delay_ms=20)
+    monkeypatch.setattr(todos, "batcher_for", lambda user_id: batcher)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as ac:
+        responses = await asyncio.wait_for(
+            asyncio.gather(
+                *(
+                    ac.post("/todos/todo/create", json=new_todo(f"Todo {i}"))
+                    for i in range(20)
+                )
+            ),
+            timeout=10,
+        )
+
+    db = TestSessionLocal()
+    titles = {todo.title for todo in db.query(Todos).filter(Todos.id > test_todo.id)}
+    db.close()
+
+    assert {response.status_code for response in responses} == {201}
+    assert titles == {f"Todo {i}" for i in range(20)}
+    assert batcher.metrics.snapshot()["batches"] >= 3
+    assert not batcher._flushes
+
+
+def test_admin_todo_batcher_metrics():
+    response = client.get("/admin/metrics/todo-batcher")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["enabled"] == BATCH_INSERTS_ENABLED
+    assert "avg_flush_ms" in response.json()
@@ -0,0 +1,124 @@
+import gzip
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
+from starlette.responses import StreamingResponse
+from .utils import *
+from ..compression import CompressionMiddleware, negotiate
+from ..routers.todos import get_current_user, get_db
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+PREFERRED = ["zstd", "br", "gzip"]
+
+
+def small_app(minimum_size: int = 100):
+    demo = FastAPI()
+    demo.add_middleware(CompressionMiddleware, minimum_size=minimum_size)
+
+    @demo.get("/big")
+    def big():
+        return JSONResponse([{"title": "Buy groceries", "priority": 3}] * 50)
+
+    @demo.get("/small")
+    def small():
+        return JSONResponse({"ok": True})
+
+    @demo.get("/text")
+    def text():
+        return PlainTextResponse("x" * 500, headers={"Content-Encoding": "identity"})
+
+    @demo.get("/stream")
+    def stream():
+        rows = (f"<tr><td>Todo {i}</td></tr>".encode() for i in range(200))
+        return StreamingResponse(rows, media_type="text/html")
+
+    return TestClient(demo)
+
+
+def test_negotiate_uses_q_values_then_server_preference():
+    assert negotiate("gzip, br", PREFERRED) == "br"
+    assert negotiate("gzip;q=1.0, br;q=0.5", PREFERRED) == "gzip"
+    assert negotiate("br;q=0, gzip", PREFERRED) == "gzip"
+    assert negotiate("*", PREFERRED) == "zstd"
+    assert negotiate("identity", PREFERRED) is None
+    assert negotiate("", PREFERRED) is None
+
+
+def test_large_json_is_gzipped():
+    response = small_app().get("/big", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < 50 * 30
+    assert response.json()[0]["title"] == "Buy groceries"
+
+
+def test_small_and_unaccepted_responses_are_not_compressed():
+    client = small_app()
+
+    assert "content-encoding" not in client.get("/small").headers
+    assert "content-encoding" not in (
+        client.get("/big", headers={"Accept-Encoding": "identity"}).headers
+    )
+    assert client.get("/text").headers["content-encoding"] == "identity"
+
+
+def test_uncompressed_eligible_responses_vary_on_accept_encoding():
+    client = small_app()
+
+    assert client.get("/small").headers["vary"] == "Accept-Encoding"
+    assert (
+        client.get("/small", headers={"Accept-Encoding": "gzip"}).headers["vary"]
+        == "Accept-Encoding"
+    )
+    assert (
+        client.get("/big", headers={"Accept-Encoding": "identity"}).headers["vary"]
+        == "Accept-Encoding"
+    )
+    assert "vary" not in client.get("/text").headers
+
+
+def test_streaming_response_is_compressed_chunk_by_chunk():
+    with small_app().stream(
+        "GET", "/stream", headers={"Accept-Encoding": "gzip"}
+    ) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        assert "content-length" not in response.headers
+        body = b"".join(response.iter_raw())
+
+    html = gzip.decompress(body).decode()
+
+    assert html.startswith("<tr><td>Todo 0</td></tr>")
+    assert html.endswith("<tr><td>Todo 199</td></tr>")
+
+
+@pytest.mark.parametrize("encoding,module", [("br", "brotli"), ("zstd", "zstandard")])
+def test_optional_encodings(encoding, module):
+    pytest.importorskip(module)
+
+    response = small_app().get("/big", headers={"Accept-Encoding": encoding})
+
+    assert response.headers["content-encoding"] == encoding
+
+
+def test_todo_list_is_compressed(test_todo):
+    db = TestSessionLocal()
+    db.add_all(
+        Todos(
+            title=f"Todo {i}",
+            description="Compressed",
+            priority=1,
+            complete=False,
+            user_id=1,
+        )
+        for i in range(50)
+    )
+    db.commit()
+    db.close()
+
+    response = client.get("/todos", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()) == 51
@@ -0,0 +1,43 @@
+import os
+import random
+import pytest
+from ..launcher import bind_socket, max_requests_for, pool_sizes, rss_bytes
+
+
+def test_pool_sizes_split_the_budget_across_workers():
+    assert pool_sizes(40, 4) == {"pool_size": 6, "max_overflow": 4}
+    assert pool_sizes(4, 4) == {"pool_size": 1, "max_overflow": 0}
+
+    sizes = pool_sizes(100, 3)
+    assert (sizes["pool_size"] + sizes["max_overflow"]) * 3 <= 100
+
+
+def test_pool_sizes_reject_a_budget_below_the_worker_count():
+    with pytest.raises(ValueError):
+        pool_sizes(3, 4)
+
+
+def test_max_requests_for_adds_jitter():
+    limits = {max_requests_for(1000, 50, random.Random(seed)) for seed in range(20)}
+
+    assert max_requests_for(0, 50) is None
+    assert max_requests_for(1000, 0) == 1000
+    assert all(1000 <= limit <= 1050 for limit in limits)
+    assert len(limits) > 1
+
+
+def test_rss_bytes():
+    if not os.path.exists("/proc/self/statm"):
+        pytest.skip("needs /proc")
+
+    assert rss_bytes(os.getpid()) > 0
+    assert rss_bytes(2**22 + 1) is None
+
+
+def test_bind_socket_is_inheritable():
+    sock = bind_socket("127.0.0.1", 0)
+    try:
+        assert sock.get_inheritable()
+        assert sock.getsockname()[1] > 0
+    finally:
+        sock.close()
@@ -0,0 +1,180 @@
+import json
+import marshal
+import os
+import pstats
+import threading
+import time
+from datetime import timedelta
+from fastapi import FastAPI
+from .utils import *
+from ..profiling import (
+    ProfileStore,
+    ProfilingMiddleware,
+    Sampler,
+    call_paths,
+    merge_stats,
+    sampled_stats,
+)
+from ..routers import todos
+from ..routers.admin import get_current_user, get_db
+from ..routers.auth import create_access_token
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[todos.get_db] = override_get_db
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+
+def token(role: str) -> dict:
+    access_token = create_access_token("willswinson", 1, role, timedelta(minutes=5))
+    return {"Authorization": f"Bearer {access_token}"}
+
+
+def busy(milliseconds: float):
+    deadline = time.perf_counter() + milliseconds / 1000
+    while time.perf_counter() < deadline:
+        pass
+
+
+def small_app(**options):
+    demo = FastAPI()
+    store = ProfileStore(size=2)
+    demo.add_middleware(ProfilingMiddleware, store=store, **options)
+
+    @demo.get("/slow")
+    async def slow():
+        busy(20)
+        return {"ok": True}
+
+    @demo.get("/sync")
+    def sync_slow():
+        busy(30)
+        return {"ok": True}
+
+    return TestClient(demo), store
+
+
+def test_admin_header_profiles_request():
+    client, store = small_app()
+
+    response = client.get("/slow", headers={**token("admin"), "X-Profile": "1"})
+
+    profile = store.get(response.headers["x-profile-id"])
+    names = {key[2] for key in profile.stats}
+
+    assert profile.mode == "deterministic"
+    assert profile.status == 200
+    assert profile.duration_ms >= 20
+    assert "busy" in names
+
+
+def test_threadpool_work_is_profiled_in_both_modes():
+    client, store = small_app()
+
+    for mode in ("deterministic", "sampling"):
+        response = client.get("/sync", headers={**token("admin"), "X-Profile": mode})
+
+        profile = store.get(response.headers["x-profile-id"])
+        roots = {stack[0][2] for stack, _ in profile.samples}
+
+        assert profile.mode == mode
+        assert any(key[2] == "busy" for key in profile.stats)
+        assert any(root.startswith("[") for root in roots)
+
+
+def test_non_admin_and_unflagged_requests_are_not_profiled():
+    client, store = small_app()
+
+    assert "x-profile-id" not in client.get("/slow?profile=1").headers
+    assert "x-profile-id" not in (
+        client.get("/slow?profile=1", headers=token("user")).headers
+    )
+    assert "x-profile-id" not in client.get("/slow", headers=token("admin")).headers
+    assert store.list() == []
+
+
+def test_random_sampling_and_bounded_ring():
+    client, store = small_app(sample_rate=1.0)
+
+    for _ in range(3):
+        client.get("/slow")
+
+    profiles = store.list()
+
+    assert len(profiles) == 2
+    assert {profile["trigger"] for profile in profiles} == {"sampled"}
+    assert {profile["mode"] for profile in profiles} == {"sampling"}
+
+
+def test_sampler_stacks_convert_to_stats():
+    sampler = Sampler(threading.get_ident(), interval=0.001)
+    sampler.start()
+    busy(30)
+    samples = sampler.stop()
+
+    stats = sampled_stats(samples)
+    busy_key = next(key for key in stats if key[2] == "busy")
+
+    assert samples
+    assert stats[busy_key][3] > 0
+    assert pstats.Stats(_Loaded(stats)).total_tt > 0
+
+
+def test_merge_stats_adds_up_shared_functions():
+    root, child = ("app.py", 1, "root"), ("app.py", 9, "child")
+    loop = {root: (1, 1, 0.002, 0.002, {})}
+    pool = {
+        root: (2, 2, 0.001, 0.003, {}),
+        child: (2, 2, 0.002, 0.002, {root: (2, 2, 0.002, 0.002)}),
+    }
+
+    merged = merge_stats(loop, pool)
+
+    assert merged[root] == (3, 3, 0.003, 0.005, {})
+    assert merged[child] == pool[child]
+
+
+def test_deterministic_stats_convert_to_call_paths():
+    root, child = ("app.py", 1, "root"), ("app.py", 9, "child")
+    stats = {
+        root: (1, 1, 0.001, 0.004, {}),
+        child: (2, 2, 0.003, 0.003, {root: (2, 2, 0.003, 0.003)}),
+    }
+
+    paths = call_paths(stats)
+
+    assert paths == [([root], 0.001), ([root, child], 0.003)]
+
+
+def test_admin_lists_and_downloads_profiles(test_todo):
+    # Profiling is off by default, so the app is wrapped here.
+    profiled = TestClient(ProfilingMiddleware(app))
+    response = profiled.get("/todos/", headers={**token("admin"), "X-Profile": "1"})
+    profile_id = response.headers["x-profile-id"]
+
+    listed = client.get("/admin/profiles").json()
+    assert listed[0]["id"] == profile_id
+    assert listed[0]["path"] == "/todos/"
+    assert listed[0]["worker"] == os.getpid()
+
+    speedscope = client.get(f"/admin/profiles/{profile_id}")
+    assert speedscope.status_code == 200
+    assert "speedscope.json" in speedscope.headers["content-disposition"]
+    document = json.loads(speedscope.content)
+    assert document["profiles"][0]["samples"]
+
+    prof = client.get(f"/admin/profiles/{profile_id}?format=pstats")
+    stats = marshal.loads(prof.content)
+    assert any(key[2] == "read_all" for key in stats)
+
+    assert client.get(f"/admin/profiles/{profile_id}?format=svg").status_code == 400
+    assert client.get("/admin/profiles/unknown").status_code == 404
+
+
+class _Loaded:
+    """Hands ready-made stats to `pstats.Stats`, as a profiler would."""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
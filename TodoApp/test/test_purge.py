@@ -0,0 +1,113 @@
+from datetime import timedelta
+from fastapi import status
+from .utils import *
+from ..models import TodoTombstones, utcnow
+from ..purge import (
+    prune_tombstones,
+    purge_backlog,
+    purge_deleted_todos,
+    purge_metrics,
+)
+from ..routers import admin
+from ..routers.todos import get_current_user, get_db
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_current_user] = override_get_current_user
+app.dependency_overrides[admin.get_db] = override_get_db
+
+
+def test_delete_hides_todo_until_purged(test_todo):
+    response = client.delete(f"/todos/todo/delete/{test_todo.id}")
+
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert client.get("/todos").json() == []
+    assert client.get(f"/todos/todo/{test_todo.id}").status_code == 404
+    assert client.delete(f"/todos/todo/delete/{test_todo.id}").status_code == 404
+
+    db = TestSessionLocal()
+    assert purge_backlog(db) == 1
+    assert db.query(TodoTombstones).count() == 1
+    db.close()
+
+    assert purge_deleted_todos(TestSessionLocal, older_than=timedelta(0)) == 1
+
+    db = TestSessionLocal()
+    assert db.query(Todos).count() == 0
+    db.close()
+
+
+def test_purge_waits_for_the_grace_period(test_todo):
+    client.delete(f"/todos/todo/delete/{test_todo.id}")
+
+    assert purge_deleted_todos(TestSessionLocal, older_than=timedelta(hours=1)) == 0
+
+    db = TestSessionLocal()
+    assert purge_backlog(db) == 1
+    db.close()
+
+
+def test_purge_runs_in_batches(test_todo):
+    db = TestSessionLocal()
+    db.add_all(
+        Todos(
+            title=f"Deleted {i}",
+            description="Gone",
+            priority=1,
+            complete=False,
+            user_id=1,
+            deleted_at=utcnow() - timedelta(minutes=1),
+        )
+        for i in range(5)
+    )
+    db.commit()
+    db.close()
+    batches = purge_metrics.snapshot()["batches"]
+
+    purged = purge_deleted_todos(
+        TestSessionLocal, older_than=timedelta(0), batch_size=2
+    )
+
+    assert purged == 5
+    assert purge_metrics.snapshot()["batches"] - batches == 3
+    assert purge_metrics.snapshot()["last_run_rows"] == 5
+
+    db = TestSessionLocal()
+    assert [todo.title for todo in db.query(Todos)] == ["Learn to code!"]
+    db.close()
+
+
+def test_admin_purge_metrics(test_todo):
+    client.delete(f"/todos/todo/delete/{test_todo.id}")
+
+    response = client.get("/admin/metrics/purge")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["backlog"] == 1
+    assert "last_run_rows_per_second" in response.json()
+
+
+def test_prune_tombstones_keeps_recent_ones(test_todo):
+    db = TestSessionLocal()
+    db.add_all(
+        [
+            TodoTombstones(
+                todo_id=i, user_id=1, deleted_at=utcnow() - timedelta(days=90)
+            )
+            for i in range(5)
+        ]
+        + [TodoTombstones(todo_id=100, user_id=1)]
+    )
+    db.commit()
+    db.close()
+
+    pruned = prune_tombstones(
+        TestSessionLocal, cutoff=utcnow() - timedelta(days=60), batch_size=2
+    )
+
+    db = TestSessionLocal()
+    left = [tombstone.todo_id for tombstone in db.query(TodoTombstones)]
+    db.close()
+
+    assert pruned == 5
+    assert left == [100]
+    assert purge_metrics.snapshot()["tombstones_pruned"] >= 5
@@ -0,0 +1,220 @@
+import threading
+import time
+import pytest
+from datetime import timedelta
+from fastapi import status
+from sqlalchemy import insert
+from .utils import *
+from .. import database
+from ..database import ReplicaRouter, request_stickiness
+from ..routers import todos
+from ..routers.auth import create_access_token
+
+
+@pytest.fixture
+def primary_and_replica(tmp_path):
+    engines = [
+        create_engine(f"sqlite:///{tmp_path}/{name}.db")
+        for name in ("primary", "replica")
+    ]
+
+    for db_engine in engines:
+        Base.metadata.create_all(bind=db_engine)
+
+    yield engines
+
+    for db_engine in engines:
+        db_engine.dispose()
+
+
+def test_reads_go_to_replica_and_writes_to_primary(primary_and_replica):
+    primary, replica = primary_and_replica
+    router = ReplicaRouter(primary, [replica])
+
+    assert router.engine_for(read_only=True, user_id=1) is replica
+    assert router.engine_for(read_only=False, user_id=1) is primary
+
+
+def test_reads_stick_to_primary_after_a_write(primary_and_replica):
+    primary, replica = primary_and_replica
+    router = ReplicaRouter(primary, [replica], sticky_seconds=0.05)
+
+    router.mark_write(1)
+
+    assert router.engine_for(read_only=True, user_id=1) is primary
+    assert router.engine_for(read_only=True, user_id=2) is replica
+
+    time.sleep(0.06)
+
+    assert router.engine_for(read_only=True, user_id=1) is replica
+
+
+def test_unreachable_replica_falls_back_to_primary(primary_and_replica, tmp_path):
+    primary, _ = primary_and_replica
+    missing = create_engine(f"sqlite:///{tmp_path}/missing/replica.db")
+    router = ReplicaRouter(primary, [missing])
+
+    assert router.engine_for(read_only=True, user_id=1) is primary
+
+
+def test_lagging_replica_falls_back_to_primary(primary_and_replica, monkeypatch):
+    primary, replica = primary_and_replica
+    checks = []
+
+    def lag(db_engine):
+        checks.append(db_engine)
+        return 60.0
+
+    monkeypatch.setattr(database, "replica_lag", lag)
+    router = ReplicaRouter(primary, [replica], max_lag_seconds=10)
+
+    assert router.engine_for(read_only=True) is primary
+    assert router.engine_for(read_only=True) is primary
+    assert len(checks) == 1
+
+
+def test_todo_reads_use_replica_until_the_user_writes(primary_and_replica, monkeypatch):
+    primary, replica = primary_and_replica
+    router = ReplicaRouter(primary, [replica])
+    monkeypatch.setattr(database, "replica_router", router)
+    monkeypatch.setattr(todos, "replica_router", router)
+    monkeypatch.delitem(app.dependency_overrides, todos.get_db, raising=False)
+    monkeypatch.setitem(
+        app.dependency_overrides, todos.get_current_user, override_get_current_user
+    )
+
+    with replica.begin() as connection:
+        connection.execute(
+            insert(Todos),
+            {
+                "title": "Replica copy",
+                "description": "Read from the replica",
+                "priority": 1,
+                "complete": False,
+                "user_id": 1,
+            },
+        )
+
+    token = create_access_token("willswinson", 1, "admin", timedelta(minutes=5))
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.get("/todos/", headers=headers)
+
+    assert [todo["title"] for todo in response.json()] == ["Replica copy"]
+
+    response = client.post(
+        "/todos/todo/create",
+        headers=headers,
+        json={
+            "title": "New todo",
+            "description": "Written to the primary",
+            "priority": 2,
+            "complete": False,
+        },
+    )
+
+    assert response.status_code == status.HTTP_201_CREATED
+
+    response = client.get("/todos/", headers=headers)
+
+    assert [todo["title"] for todo in response.json()] == ["New todo"]
+
+
+def test_only_committed_writes_stick_to_primary(primary_and_replica, monkeypatch):
+    primary, replica = primary_and_replica
+    router = ReplicaRouter(primary, [replica])
+    monkeypatch.setattr(database, "replica_router", router)
+
+    db = database.open_session(1, read_only=False)
+    db.rollback()
+    db.close()
+
+    assert not router.is_sticky(1)
+
+    db = database.open_session(1, read_only=False)
+    db.commit()
+
+    # Sticky as soon as the commit returns, not when the request ends.
+    assert router.is_sticky(1)
+    db.close()
+
+
+def test_write_marker_keeps_other_workers_on_primary(primary_and_replica, monkeypatch):
+    primary, replica = primary_and_replica
+    monkeypatch.delitem(app.dependency_overrides, todos.get_db, raising=False)
+    monkeypatch.setitem(
+        app.dependency_overrides, todos.get_current_user, override_get_current_user
+    )
+
+    def use_worker(router):
+        monkeypatch.setattr(database, "replica_router", router)
+        monkeypatch.setattr(todos, "replica_router", router)
+
+    token = create_access_token("willswinson", 1, "admin", timedelta(minutes=5))
+    headers = {"Authorization": f"Bearer {token}"}
+
+    use_worker(ReplicaRouter(primary, [replica]))
+    response = client.post(
+        "/todos/todo/create",
+        headers=headers,
+        json={
+            "title": "New todo",
+            "description": "Written on one worker",
+            "priority": 2,
+            "complete": False,
+        },
+    )
+
+    assert "x-primary-until" in response.headers
+    assert "primary_until" in client.cookies
+
+    # Another worker has never seen the write, only the client's marker.
+    use_worker(ReplicaRouter(primary, [replica]))
+    response = client.get("/todos/", headers=headers)
+    client.cookies.clear()
+
+    assert [todo["title"] for todo in response.json()] == ["New todo"]
+
+    response = client.get("/todos/", headers=headers)
+
+    assert response.json() == []
+
+
+def test_marker_beyond_one_window_is_ignored(primary_and_replica):
+    primary, replica = primary_and_replica
+    router = ReplicaRouter(primary, [replica], sticky_seconds=5)
+
+    token = request_stickiness.set({"read_until": time.time() + 3})
+    assert router.engine_for(read_only=True, user_id=1) is primary
+    request_stickiness.reset(token)
+
+    token = request_stickiness.set({"read_until": time.time() + 3600})
+    assert router.engine_for(read_only=True, user_id=1) is replica
+    request_stickiness.reset(token)
+
+
+def test_slow_health_check_does_not_block_writes(primary_and_replica, monkeypatch):
+    primary, replica = primary_and_replica
+    probing, release = threading.Event(), threading.Event()
+
+    def slow_lag(db_engine):
+        probing.set()
+        release.wait(timeout=5)
+        return 0.0
+
+    monkeypatch.setattr(database, "replica_lag", slow_lag)
+    router = ReplicaRouter(primary, [replica])
+    check = threading.Thread(target=router.healthy_replicas)
+    check.start()
+    probing.wait(timeout=5)
+
+    started = time.perf_counter()
+    router.mark_write(2)
+    # Others use the last result meanwhile rather than wait for the check.
+    assert router.engine_for(read_only=True, user_id=1) is primary
+    assert time.perf_counter() - started < 1
+
+    release.set()
+    check.join()
+
+    assert router.engine_for(read_only=True, user_id=1) is replica
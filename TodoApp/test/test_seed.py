@@ -0,0 +1,37 @@
+from sqlalchemy import func
+from .utils import *
+from ..routers.auth import authenticate_user
+from ..seed import DatasetSpec, generate_todos
+
+
+def test_synthetic_dataset_loads(synthetic_dataset):
+    db = TestSessionLocal()
+
+    assert db.query(Users).count() == synthetic_dataset["users"]
+    assert db.query(Todos).count() == synthetic_dataset["todos"]
+
+    priorities = {row[0] for row in db.query(Todos.priority).distinct()}
+    assert priorities <= {1, 2, 3, 4, 5}
+
+    longest = db.query(func.max(func.length(Todos.description))).scalar()
+    assert longest <= 100
+
+    completed = db.query(Todos).filter(Todos.complete.is_(True))
+    assert all(todo.completed_at is not None for todo in completed)
+
+
+def test_synthetic_users_share_precomputed_hash(synthetic_dataset):
+    db = TestSessionLocal()
+    username = f"user{synthetic_dataset['user_ids'][0]}"
+
+    assert authenticate_user(username, "password", db).username == username
+    assert db.query(Users.hash_password).distinct().count() == 1
+
+
+def test_generate_todos_is_deterministic():
+    spec = DatasetSpec(users=5, todos_per_user=10, seed=7)
+
+    first = [todo["title"] for todo in generate_todos(spec, range(1, 6), 1)]
+    second = [todo["title"] for todo in generate_todos(spec, range(1, 6), 1)]
+
+    assert first == second
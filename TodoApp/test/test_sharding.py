@@ -0,0 +1,287 @@
+import pytest
+from sqlalchemy import func, insert, select, update
+from fastapi import status
+from .utils import *
+from ..database import ShardRouter, hash_strategy, range_strategy
+from .. import sharding
+from ..models import TodoTombstones, utcnow
+from ..routers import admin, auth
+from ..routers.admin import get_current_user, get_db
+from ..seed import DatasetSpec, load_dataset
+from ..sharding import (
+    ShardConflict,
+    ShardSchemaMismatch,
+    alembic_version,
+    migration_revision,
+    move_user,
+    place_user,
+    prepare_shards,
+    rebalance,
+)
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[auth.get_db] = override_get_db
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+
+@pytest.fixture
+def shards(tmp_path):
+    engines = [
+        create_engine(f"sqlite:///{tmp_path}/{name}.db")
+        for name in ("directory", "shard0", "shard1")
+    ]
+
+    for shard_engine in engines:
+        Base.metadata.create_all(bind=shard_engine)
+
+    # User 1 lives on shard 0, everyone else on shard 1.
+    router = ShardRouter(engines[1:], range_strategy([1]), engines[0])
+
+    with engines[0].begin() as connection:
+        for user_id in (1, 2):
+            connection.execute(
+                insert(Users),
+                {
+                    "id": user_id,
+                    "username": f"user{user_id}",
+                    "email": f"user{user_id}@example.com",
+                    "hash_password": "hash",
+                    "role": "admin",
+                    "is_active": True,
+                },
+            )
+
+    yield router
+
+    for shard_engine in engines:
+        shard_engine.dispose()
+
+
+def add_todo(router: ShardRouter, shard: int, id: int, user_id: int):
+    with router.engines[shard].begin() as connection:
+        connection.execute(
+            insert(Todos),
+            {
+                "id": id,
+                "title": f"Todo {id}",
+                "description": "Sharded",
+                "priority": 1,
+                "complete": False,
+                "user_id": user_id,
+            },
+        )
+
+
+def todo_ids(router: ShardRouter, shard: int) -> list:
+    with router.engines[shard].connect() as connection:
+        return connection.scalars(select(Todos.id).order_by(Todos.id)).all()
+
+
+def test_strategies_are_stable():
+    assert range_strategy([100, 200])(100) == 0
+    assert range_strategy([100, 200])(101) == 1
+    assert range_strategy([100, 200])(201) == 2
+    assert hash_strategy(4)(42) == hash_strategy(4)(42)
+    assert {hash_strategy(4)(user_id) for user_id in range(100)} == {0, 1, 2, 3}
+
+
+def test_session_for_routes_by_user(shards):
+    assert shards.sharded
+    assert shards.session_for(1).get_bind() is shards.engines[0]
+    assert shards.session_for(2).get_bind() is shards.engines[1]
+
+
+def test_place_user_copies_user_to_its_shard(shards):
+    place_user(2, router=shards)
+
+    with shards.engines[1].connect() as connection:
+        assert connection.scalar(select(Users.username)) == "user2"
+
+
+def test_fan_out_reads_every_shard(shards, monkeypatch):
+    add_todo(shards, 0, 1, 1)
+    add_todo(shards, 1, 2, 2)
+    monkeypatch.setattr(admin, "shard_router", shards)
+
+    response = client.get("/admin/todo")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert sorted(todo["id"] for todo in response.json()) == [1, 2]
+
+
+def test_admin_delete_finds_todo_on_its_shard(shards, monkeypatch):
+    add_todo(shards, 1, 2, 2)
+    monkeypatch.setattr(admin, "shard_router", shards)
+
+    response = client.delete("/admin/todo/delete/2")
+
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+    with shards.engines[1].connect() as connection:
+        assert connection.scalar(select(Todos.deleted_at)) is not None
+        assert connection.scalar(select(TodoTombstones.todo_id)) == 2
+
+
+def test_rebalance_moves_misplaced_users(shards):
+    add_todo(shards, 0, 1, 1)
+    add_todo(shards, 0, 5, 2)
+    add_todo(shards, 0, 6, 2)
+
+    summary = rebalance(shards, report=lambda line: None)
+
+    assert summary == {"moved": 1, "conflicts": 0}
+    assert todo_ids(shards, 0) == [1]
+    assert todo_ids(shards, 1) == [5, 6]
+    assert rebalance(shards, report=lambda line: None)["moved"] == 0
+
+
+def test_move_user_reports_id_conflicts(shards):
+    add_todo(shards, 0, 5, 2)
+    add_todo(shards, 1, 5, 3)
+
+    with pytest.raises(ShardConflict):
+        move_user(shards, 2, 0, 1)
+
+    assert todo_ids(shards, 0) == [5]
+
+
+def test_seeded_todos_land_on_their_users_shard(shards):
+    add_todo(shards, 1, 7, 2)
+    spec = DatasetSpec(users=6, todos_per_user=4)
+
+    result = load_dataset(shards.directory, spec, router=shards, password_hash="x")
+
+    owners = {}
+    for shard in (0, 1):
+        with shards.engines[shard].connect() as connection:
+            rows = connection.execute(select(Todos.id, Todos.user_id)).all()
+            copies = connection.scalars(select(Users.id)).all()
+
+        assert {shards.shard_id(user_id) for _, user_id in rows} <= {shard}
+        assert {user_id for _, user_id in rows if user_id > 2} <= set(copies)
+        owners.update({id: user_id for id, user_id in rows})
+
+    assert len(owners) == result["todos"] + 1
+    assert all(id > 7 for id, user_id in owners.items() if user_id > 2)
+
+
+def test_move_user_keeps_rows_written_during_the_copy(shards, monkeypatch):
+    add_todo(shards, 0, 5, 2)
+    add_todo(shards, 0, 6, 2)
+    copy_rows = sharding.copy_rows
+
+    def copy_then_write(dst, table, user_id, batch):
+        written = copy_rows(dst, table, user_id, batch)
+
+        if table is Todos:
+            # A process still on the old configuration writes meanwhile.
+            add_todo(shards, 0, 7, 2)
+            with shards.engines[0].begin() as connection:
+                connection.execute(
+                    update(Todos)
+                    .where(Todos.id == 6)
+                    .values(title="Changed", updated_at=utcnow())
+                )
+        return written
+
+    monkeypatch.setattr(sharding, "copy_rows", copy_then_write)
+    move_user(shards, 2, 0, 1)
+    monkeypatch.setattr(sharding, "copy_rows", copy_rows)
+
+    assert todo_ids(shards, 0) == [6, 7]
+    assert todo_ids(shards, 1) == [5, 6]
+
+    move_user(shards, 2, 0, 1)
+
+    assert todo_ids(shards, 0) == []
+    assert todo_ids(shards, 1) == [5, 6, 7]
+    with shards.engines[1].connect() as connection:
+        assert connection.scalar(select(Todos.title).where(Todos.id == 6)) == "Changed"
+
+
+def test_move_user_does_not_duplicate_tombstones(shards):
+    tombstone = {"todo_id": 5, "user_id": 2, "deleted_at": utcnow()}
+
+    with shards.engines[0].begin() as connection:
+        connection.execute(insert(TodoTombstones), tombstone)
+    move_user(shards, 2, 0, 1)
+
+    # The same tombstone is still on the source when a move is retried.
+    with shards.engines[0].begin() as connection:
+        connection.execute(insert(TodoTombstones), tombstone)
+    move_user(shards, 2, 0, 1)
+
+    with shards.engines[1].connect() as connection:
+        assert connection.scalar(select(func.count()).select_from(TodoTombstones)) == 1
+
+
+def test_admin_delete_uses_owner_to_pick_shard(shards, monkeypatch):
+    add_todo(shards, 0, 3, 1)
+    add_todo(shards, 1, 3, 2)
+    monkeypatch.setattr(admin, "shard_router", shards)
+
+    assert client.delete("/admin/todo/delete/3").status_code == 409
+
+    response = client.delete("/admin/todo/delete/3", params={"user_id": 2})
+
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    with shards.engines[0].connect() as connection:
+        assert connection.scalar(select(Todos.deleted_at)) is None
+    with shards.engines[1].connect() as connection:
+        assert connection.scalar(select(Todos.deleted_at)) is not None
+
+
+def test_failed_placement_does_not_create_user(monkeypatch):
+    def fail(*args, **kwargs):
+        raise OSError("shard down")
+
+    monkeypatch.setattr(auth, "place_user", fail)
+
+    response = client.post(
+        "/auth/",
+        json={
+            "username": "unplaced",
+            "email": "unplaced@example.com",
+            "first_name": "Un",
+            "last_name": "Placed",
+            "password": "test1234",
+            "role": "user",
+            "phone_number": "555",
+        },
+    )
+
+    assert response.status_code == 404
+    db = TestSessionLocal()
+    assert db.query(Users).filter(Users.username == "unplaced").first() is None
+    db.close()
+
+
+def stamp(db_engine, revision: str):
+    with db_engine.begin() as connection:
+        alembic_version.create(connection, checkfirst=True)
+        connection.execute(alembic_version.delete())
+        connection.execute(insert(alembic_version), {"version_num": revision})
+
+
+def test_prepare_shards_stamps_new_shards_and_refuses_stale_ones(tmp_path):
+    directory, existing, new = [
+        create_engine(f"sqlite:///{tmp_path}/{name}.db")
+        for name in ("directory", "existing", "new")
+    ]
+    Base.metadata.create_all(bind=directory)
+    Base.metadata.create_all(bind=existing)
+    stamp(directory, "head0001")
+    stamp(existing, "head0001")
+    router = ShardRouter([directory, existing, new], hash_strategy(3), directory)
+
+    prepare_shards(router)
+
+    assert migration_revision(new) == "head0001"
+
+    stamp(directory, "head0002")
+
+    with pytest.raises(ShardSchemaMismatch):
+        prepare_shards(router)
+
+    for db_engine in (directory, existing, new):
+        db_engine.dispose()
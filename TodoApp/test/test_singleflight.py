@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import pytest
+from fastapi import status
+from .utils import *
+from ..routers.admin import get_current_user
+from ..singleflight import SingleFlight, read_key, with_session
+
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+
+def blocking(release: threading.Event, result):
+    def run():
+        release.wait(timeout=5)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    return run
+
+
+async def started(flight: SingleFlight, count: int):
+    while flight.snapshot()["calls"] < count:
+        await asyncio.sleep(0.001)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = [
+        asyncio.create_task(flight.do(("todos", 1), blocking(release, [1, 2])))
+        for _ in range(5)
+    ]
+
+    await started(flight, 5)
+    release.set()
+
+    assert await asyncio.gather(*calls) == [[1, 2]] * 5
+    assert flight.snapshot()["executions"] == 1
+    assert flight.snapshot()["coalesced"] == 4
+    assert flight.snapshot()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_different_keys_run_separately():
+    flight = SingleFlight()
+
+    results = await asyncio.gather(
+        flight.do(("todos", 1), lambda: 1), flight.do(("todos", 2), lambda: 2)
+    )
+
+    assert results == [1, 2]
+    assert flight.snapshot()["executions"] == 2
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_caller():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = [
+        asyncio.create_task(
+            flight.do(("todos", 1), blocking(release, ValueError("boom")))
+        )
+        for _ in range(3)
+    ]
+
+    await started(flight, 3)
+    release.set()
+    results = await asyncio.gather(*calls, return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.snapshot()["errors"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_the_others():
+    flight = SingleFlight()
+    release = threading.Event()
+    first = asyncio.create_task(flight.do(("todos", 1), blocking(release, "done")))
+    second = asyncio.create_task(flight.do(("todos", 1), blocking(release, "done")))
+
+    await started(flight, 2)
+    first.cancel()
+    release.set()
+
+    assert await second == "done"
+    assert first.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_forget_starts_a_fresh_execution():
+    flight = SingleFlight()
+    release = threading.Event()
+    stale = asyncio.create_task(flight.do(("todos", 1, "list"), blocking(release, 1)))
+
+    await started(flight, 1)
+    flight.forget(("todos", 1))
+    fresh = asyncio.create_task(flight.do(("todos", 1, "list"), lambda: 2))
+    release.set()
+
+    assert await stale == 1
+    assert await fresh == 2
+    assert flight.snapshot()["executions"] == 2
+
+
+@pytest.mark.asyncio
+async def test_with_session_reads_on_its_own_session(test_todo):
+    db = TestSessionLocal()
+    flight = SingleFlight()
+
+    todos = await flight.do(
+        ("todos", 1), with_session(db, lambda shared_db: shared_db.query(Todos).all())
+    )
+    db.close()
+
+    assert [todo.title for todo in todos] == ["Learn to code!"]
+
+
+def test_read_key_separates_binds():
+    primary = TestSessionLocal()
+    other_primary = TestSessionLocal()
+    replica = TestSessionLocal(bind=create_engine("sqlite://"))
+
+    key = read_key(primary, "todos", 1, "list")
+
+    assert key == read_key(other_primary, "todos", 1, "list")
+    assert key != read_key(replica, "todos", 1, "list")
+    assert key[:2] == ("todos", 1)
+
+    for db in (primary, other_primary, replica):
+        db.close()
+
+
+def test_admin_single_flight_metrics():
+    response = client.get("/admin/metrics/single-flight")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert {"calls", "executions", "coalesced", "errors"} <= set(response.json())
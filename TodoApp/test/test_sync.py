@@ -0,0 +1,151 @@
+import base64
+import json
+import pytest
+from datetime import timedelta
+from fastapi import status
+from .utils import *
+from .. import sync
+from ..models import utcnow
+from ..routers.todos import get_current_user, get_db
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+
+def add_todo(title: str):
+    db = TestSessionLocal()
+    todo = Todos(title=title, description="Sync", priority=2, user_id=1)
+    db.add(todo)
+    db.commit()
+    db.refresh(todo)
+    db.close()
+
+    return todo.id
+
+
+@pytest.fixture
+def no_safety_window(monkeypatch):
+    monkeypatch.setattr(sync, "SYNC_SAFETY_WINDOW_SECONDS", 0)
+
+
+def test_sync_returns_only_changes_since_cursor(test_todo, no_safety_window):
+    second = add_todo("Second todo")
+
+    first_sync = client.get("/todos/changes")
+
+    assert first_sync.status_code == status.HTTP_200_OK
+    assert [todo["id"] for todo in first_sync.json()["todos"]] == [1, second]
+    assert first_sync.json()["deleted"] == []
+    assert first_sync.json()["has_more"] is False
+
+    cursor = first_sync.json()["cursor"]
+    empty = client.get("/todos/changes", params={"since": cursor})
+
+    assert empty.json()["todos"] == []
+    assert empty.json()["deleted"] == []
+
+    client.put(
+        "/todos/todo/update/1",
+        json={
+            "title": "Updated",
+            "description": "Updated",
+            "priority": 1,
+            "complete": False,
+        },
+    )
+    client.delete(f"/todos/todo/delete/{second}")
+
+    changes = client.get("/todos/changes", params={"since": cursor})
+
+    assert [todo["title"] for todo in changes.json()["todos"]] == ["Updated"]
+    assert changes.json()["todos"][0]["updated_at"] is not None
+    assert [todo["id"] for todo in changes.json()["deleted"]] == [second]
+
+
+def test_sync_paginates(test_todo, no_safety_window):
+    add_todo("Second todo")
+    add_todo("Third todo")
+
+    seen = []
+    cursor = None
+
+    while True:
+        params = {"limit": 2, **({"since": cursor} if cursor else {})}
+        page = client.get("/todos/changes", params=params).json()
+        seen += [todo["title"] for todo in page["todos"]]
+        cursor = page["cursor"]
+
+        if not page["has_more"]:
+            break
+
+    assert seen == ["Learn to code!", "Second todo", "Third todo"]
+
+
+def test_sync_invalid_cursor():
+    response = client.get("/todos/changes", params={"since": "not-a-cursor"})
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json() == {"detail": "Invalid sync cursor"}
+
+
+def test_sync_delivers_rows_committed_late(test_todo):
+    cursor = client.get("/todos/changes").json()["cursor"]
+
+    # A transaction that stamped its row before the cursor but committed after.
+    db = TestSessionLocal()
+    latest = db.query(Todos).filter(Todos.id == 1).first().updated_at
+    late = Todos(title="Late", description="Sync", priority=2, user_id=1)
+    late.updated_at = latest - timedelta(seconds=1)
+    db.add(late)
+    db.commit()
+    db.close()
+
+    changes = client.get("/todos/changes", params={"since": cursor}).json()
+
+    assert [todo["title"] for todo in changes["todos"]] == ["Late", "Learn to code!"]
+
+    caught_up = client.get("/todos/changes", params={"since": changes["cursor"]})
+
+    assert {todo["title"] for todo in caught_up.json()["todos"]} <= {
+        "Late",
+        "Learn to code!",
+    }
+
+
+def test_sync_refuses_expired_cursors(test_todo):
+    stale = sync.encode_cursor(
+        dict.fromkeys(sync.STREAMS),
+        rewind=True,
+        synced_at=utcnow() - timedelta(days=31),
+    )
+
+    response = client.get("/todos/changes", params={"since": stale})
+
+    assert response.status_code == status.HTTP_410_GONE
+    assert "sync again" in response.json()["detail"]
+
+
+def test_sync_dates_legacy_cursors_by_their_newest_row(test_todo):
+    recent = (utcnow() - timedelta(days=1)).isoformat()
+    old = (utcnow() - timedelta(days=90)).isoformat()
+
+    def legacy(timestamp):
+        keys = {"todos": [timestamp, 1], "deleted": None, "rewind": True}
+        return base64.urlsafe_b64encode(json.dumps(keys).encode()).decode()
+
+    accepted = client.get("/todos/changes", params={"since": legacy(recent)})
+    expired = client.get("/todos/changes", params={"since": legacy(old)})
+
+    assert accepted.status_code == status.HTTP_200_OK
+    assert expired.status_code == status.HTTP_410_GONE
+
+    # Its next cursor carries a run start again.
+    _, _, synced_at = sync.decode_cursor(accepted.json()["cursor"])
+    assert utcnow() - synced_at < timedelta(minutes=1)
+
+
+def test_tombstones_outlive_every_accepted_cursor(monkeypatch):
+    monkeypatch.setattr(sync, "TOMBSTONE_RETENTION_DAYS", 1)
+    monkeypatch.setattr(sync, "SYNC_CURSOR_MAX_AGE_DAYS", 30)
+
+    assert sync.tombstone_cutoff() < utcnow() - timedelta(days=30)
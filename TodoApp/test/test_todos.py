@@ -1,11 +1,15 @@
 from fastapi import status
 from ..routers.todos import get_current_user, get_db
+from ..routers import todos
+from ..routers.auth import create_access_token, get_directory_db
+from datetime import timedelta
 from ..models import Todos
 from .utils import *
 
 
 app.dependency_overrides[get_db] = override_get_db
 app.dependency_overrides[get_current_user] = override_get_current_user
+app.dependency_overrides[get_directory_db] = override_get_db
 
 
 def test_read_all_authenticated(test_todo):
@@ -109,7 +113,7 @@ def test_delete_todo(test_todo):
 
     model = db.query(Todos).filter(Todos.id == 1).first()
 
-    assert model is None
+    assert model.deleted_at is not None
 
 
 def test_delete_todo_not_found():
@@ -117,3 +121,193 @@ def test_delete_todo_not_found():
 
     assert response.status_code == 404
     assert response.json() == {"detail": "Todo Not Found"}
+
+
+def test_read_all_sparse_fields(test_todo):
+    response = client.get("/todos", params={"fields": "id,title,complete"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [{"id": 1, "title": "Learn to code!", "complete": False}]
+
+
+def test_read_all_invalid_fields(test_todo):
+    response = client.get("/todos", params={"fields": "id,secret"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def todo_page_cookies():
+    token = create_access_token("willswinson", 1, "admin", timedelta(minutes=20))
+    return {"access_token": token}
+
+
+def test_render_todo_page_streams_todos(test_todo, test_user):
+    client.cookies = todo_page_cookies()
+    response = client.get("/todos/todo-page")
+    client.cookies.clear()
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/html")
+    assert "Learn to code!" in response.text
+
+
+def test_render_todo_page_paginated(test_todo, test_user):
+    db = TestSessionLocal()
+    db.add(Todos(title="Second todo", description="d", priority=1, user_id=1))
+    db.commit()
+
+    client.cookies = todo_page_cookies()
+    first = client.get("/todos/todo-page", params={"page": 1, "page_size": 1})
+    second = client.get("/todos/todo-page", params={"page": 2, "page_size": 1})
+    client.cookies.clear()
+
+    assert "Learn to code!" in first.text
+    assert "Second todo" not in first.text
+    assert "page=2" in first.text
+    assert "Second todo" in second.text
+    assert "page=3" not in second.text
+
+
+def test_render_todo_page_streams_rows_past_the_coalesced_head(
+    test_todo, test_user, monkeypatch
+):
+    monkeypatch.setattr(todos, "COALESCED_PAGE_ROWS", 1)
+    db = TestSessionLocal()
+    db.add(Todos(title="Second todo", description="d", priority=1, user_id=1))
+    db.commit()
+
+    client.cookies = todo_page_cookies()
+    response = client.get("/todos/todo-page")
+    client.cookies.clear()
+
+    assert "Learn to code!" in response.text
+    assert "Second todo" in response.text
+
+
+def test_render_todo_page_turns_away_deactivated_user(test_todo, test_user):
+    db = TestSessionLocal()
+    db.query(Users).update({"is_active": False})
+    db.commit()
+    db.close()
+
+    client.cookies = todo_page_cookies()
+    response = client.get("/todos/todo-page", follow_redirects=False)
+    client.cookies.clear()
+
+    assert response.status_code == status.HTTP_302_FOUND
+    assert "Learn to code!" not in response.text
+
+
+def test_import_todos_csv(test_todo):
+    content = (
+        "title,description,priority,complete\n"
+        "Imported one,First import,2,false\n"
+        "Imported two,Second import,9,true\n"
+        '"Imported, three","Multi\nline",5,true\n'
+    )
+
+    response = client.post(
+        "/todos/todo/import", files={"file": ("todos.csv", content, "text/csv")}
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["accepted"] == 2
+    assert response.json()["rejected"] == 1
+    assert response.json()["errors"][0]["line"] == 3
+    assert "priority" in response.json()["errors"][0]["error"]
+
+    db = TestSessionLocal()
+    titles = {todo.title for todo in db.query(Todos).filter(Todos.id > 1)}
+
+    assert titles == {"Imported one", "Imported, three"}
+
+
+def test_import_todos_ndjson(test_todo):
+    content = (
+        '{"title": "Json todo", "description": "From json", "priority": 1, "complete": false}\n'
+        "\n"
+        "not json\n"
+        '["a list"]\n'
+    )
+
+    response = client.post(
+        "/todos/todo/import",
+        files={"file": ("todos.ndjson", content, "application/octet-stream")},
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["accepted"] == 1
+    assert [error["line"] for error in response.json()["errors"]] == [3, 4]
+
+
+def test_import_todos_reports_bad_encoding_and_first_line(test_todo):
+    content = (
+        b"title,description,priority,complete\n"
+        b'"Multi","Spans\ntwo lines",2,false\n'
+        b"Bad \xff byte,Latin-1,2,false\n"
+        b'"Also multi","Spans\ntwo lines",9,false\n'
+    )
+
+    response = client.post(
+        "/todos/todo/import", files={"file": ("todos.csv", content, "text/csv")}
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["accepted"] == 1
+    assert [error["line"] for error in response.json()["errors"]] == [4, 5]
+    assert response.json()["errors"][0]["error"] == "Invalid UTF-8"
+
+
+def test_import_todos_unknown_format():
+    response = client.post(
+        "/todos/todo/import", files={"file": ("todos.xlsx", b"", "application/zip")}
+    )
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def add_todos(*todos):
+    db = TestSessionLocal()
+    for title, priority, complete in todos:
+        db.add(
+            Todos(
+                title=title,
+                description="d",
+                priority=priority,
+                complete=complete,
+                user_id=1,
+            )
+        )
+    db.commit()
+
+
+def test_read_all_filters_and_sorts(test_todo):
+    add_todos(("Learn SQL", 5, False), ("Laundry", 1, True), ("Pay rent", 4, False))
+
+    response = client.get(
+        "/todos",
+        params={"complete": False, "priority_min": 3, "sort": "-priority,title"},
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert [todo["title"] for todo in response.json()] == [
+        "Learn SQL",
+        "Pay rent",
+        "Learn to code!",
+    ]
+
+    response = client.get("/todos", params={"title_prefix": "Lea", "sort": "title"})
+    assert [todo["title"] for todo in response.json()] == [
+        "Learn SQL",
+        "Learn to code!",
+    ]
+
+
+def test_read_all_invalid_sort(test_todo):
+    response = client.get("/todos", params={"sort": "description"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_read_next_todos(test_todo):
+    add_todos(("Urgent", 5, False), ("Done", 5, True), ("Someday", 1, False))
+
+    response = client.get("/todos/next", params={"limit": 2})
+    assert response.status_code == status.HTTP_200_OK
+    assert [todo["title"] for todo in response.json()] == ["Urgent", "Learn to code!"]
@@ -0,0 +1,155 @@
+import pytest
+from fastapi import status
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from .utils import *
+from ..database import ShardRouter
+from ..models import TodoTombstones, utcnow
+from ..routers.admin import get_current_user, get_db
+from ..routers.auth import authenticate_user
+from ..singleflight import read_flight
+from ..user_removal import RemovalJob, RemovalJobs, remove_user, sweep_user
+
+app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_current_user] = override_get_current_user
+
+
+@pytest.fixture
+def heavy_user(test_todo):
+    db = TestSessionLocal()
+    db.add(
+        Users(
+            id=2,
+            username="heavy",
+            email="heavy@example.com",
+            hash_password=bcrypt_context.hash("test"),
+            role="user",
+            is_active=True,
+        )
+    )
+    db.execute(
+        insert(Todos),
+        [
+            {
+                "title": f"Todo {i}",
+                "description": "Owned",
+                "priority": 1,
+                "complete": False,
+                "user_id": 2,
+            }
+            for i in range(25)
+        ],
+    )
+    db.add(TodosArchive(id=1000, title="Archived", user_id=2))
+    db.add(TodoTombstones(todo_id=999, user_id=2))
+    db.commit()
+    db.close()
+
+    yield 2
+
+    db = TestSessionLocal()
+    db.query(Users).delete()
+    db.commit()
+    db.close()
+
+
+def count(model, *criteria) -> int:
+    db = TestSessionLocal()
+    try:
+        return db.query(model).filter(*criteria).count()
+    finally:
+        db.close()
+
+
+def test_remove_user_deletes_owned_rows_in_batches(heavy_user):
+    job = RemovalJob(user_id=heavy_user)
+    unsharded = ShardRouter([engine], lambda user_id: 0, engine)
+
+    remove_user(job, unsharded, TestSessionLocal, batch_size=10, pause=0)
+
+    assert job.status == "completed"
+    assert job.total == 27
+    assert job.deleted == {"todos": 25, "todos_archive": 1, "todo_tombstones": 1}
+    assert job.batches == 5
+    assert job.percent == 100.0
+    assert count(Users, Users.id == heavy_user) == 0
+    assert count(Todos, Todos.user_id == heavy_user) == 0
+    assert count(Todos, Todos.user_id == 1) == 1
+
+
+def test_remove_user_drops_shared_reads(heavy_user, monkeypatch):
+    forgotten = []
+    monkeypatch.setattr(read_flight, "forget", forgotten.append)
+    unsharded = ShardRouter([engine], lambda user_id: 0, engine)
+
+    remove_user(RemovalJob(user_id=heavy_user), unsharded, TestSessionLocal, pause=0)
+
+    assert ("todos", heavy_user) in forgotten
+    assert forgotten[-1] == ("users", heavy_user)
+
+
+def test_sweep_runs_again_when_a_late_write_blocks_the_user_delete(heavy_user):
+    job = RemovalJob(user_id=heavy_user)
+    db = TestSessionLocal()
+    commit, commits = db.commit, []
+
+    def commit_after_late_write():
+        commits.append(True)
+
+        if len(commits) == 1:
+            raise IntegrityError("DELETE FROM users", {}, Exception("FOREIGN KEY"))
+        commit()
+
+    db.commit = commit_after_late_write
+    sweep_user(db, heavy_user, job)
+    db.close()
+
+    assert len(commits) == 2
+    assert job.deleted == {"todos": 25, "todos_archive": 1, "todo_tombstones": 1}
+    assert count(Users, Users.id == heavy_user) == 0
+    assert count(Todos, Todos.user_id == heavy_user) == 0
+
+
+def test_job_store_keeps_only_the_last_finished_jobs():
+    jobs = RemovalJobs(kept=2)
+    started = [jobs.start(user_id)[0] for user_id in (1, 2, 3)]
+
+    for job in started:
+        job.finished_at = utcnow()
+
+    running, _ = jobs.start(4)
+
+    assert jobs.get(started[0].id) is None
+    assert jobs.get(started[1].id) is started[1]
+    assert jobs.get(running.id) is running
+
+
+def test_admin_removes_user_in_background(heavy_user):
+    response = client.delete(f"/admin/users/{heavy_user}")
+
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert response.json()["user_id"] == heavy_user
+
+    job = client.get(f"/admin/users/removals/{response.json()['id']}").json()
+
+    assert job["status"] == "completed"
+    assert job["deleted"]["todos"] == 25
+    assert count(Users, Users.id == heavy_user) == 0
+    assert count(Todos) == 1
+
+
+def test_deactivated_user_cannot_log_in(heavy_user):
+    db = TestSessionLocal()
+    assert authenticate_user("heavy", "test", db)
+
+    db.query(Users).filter(Users.id == heavy_user).update({"is_active": False})
+    db.commit()
+
+    assert authenticate_user("heavy", "test", db) is False
+    db.close()
+
+
+def test_admin_remove_user_errors(heavy_user):
+    assert client.delete("/admin/users/1").status_code == 400
+    assert client.delete("/admin/users/999").status_code == 404
+    assert client.get("/admin/users/removals/unknown").status_code == 404
@@ -1,10 +1,12 @@
+import os
 import pytest
 from sqlalchemy import create_engine, text
 from sqlalchemy.pool import StaticPool
 from sqlalchemy.orm import sessionmaker
-from ..models import Base, Todos, Users
+from ..models import Base, Todos, TodosArchive, Users
 from ..main import app
 from ..routers.auth import bcrypt_context
+from ..seed import DatasetSpec, load_dataset
 from fastapi.testclient import TestClient
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./testdb.db"
@@ -58,6 +60,8 @@ def test_todo():
     yield todo
     with engine.connect() as connection:
         connection.execute(text("DELETE FROM todos;"))
+        connection.execute(text("DELETE FROM todos_archive;"))
+        connection.execute(text("DELETE FROM todo_tombstones;"))
         connection.commit()
 
 
@@ -83,3 +87,17 @@ def test_user():
     with engine.connect() as connection:
         connection.execute(text("DELETE FROM users;"))
         connection.commit()
+
+
+@pytest.fixture
+def synthetic_dataset():
+    spec = DatasetSpec(
+        users=int(os.getenv("TEST_DATASET_USERS", "20")),
+        todos_per_user=int(os.getenv("TEST_DATASET_TODOS_PER_USER", "10")),
+    )
+
+    yield load_dataset(engine, spec)
+    with engine.connect() as connection:
+        connection.execute(text("DELETE FROM todos;"))
+        connection.execute(text("DELETE FROM users;"))
+        connection.commit()
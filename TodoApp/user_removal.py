@@ -0,0 +1,210 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+from .database import ShardRouter, SessionLocal, shard_router
+from .models import Todos, TodosArchive, TodoTombstones, Users, utcnow
+from .singleflight import read_flight
+
+REMOVAL_BATCH_SIZE = int(os.getenv("TODO_USER_REMOVAL_BATCH_SIZE", "500"))
+REMOVAL_PAUSE_SECONDS = float(os.getenv("TODO_USER_REMOVAL_PAUSE_MS", "10")) / 1000
+REMOVAL_JOBS_KEPT = int(os.getenv("TODO_USER_REMOVAL_JOBS_KEPT", "100"))
+# Final sweeps retried when a late write keeps the user row from going.
+FINAL_SWEEP_ATTEMPTS = 5
+
+OWNED_TABLES = (Todos, TodosArchive, TodoTombstones)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RemovalJob:
+    user_id: int
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "queued"
+    total: int = 0
+    deleted: dict = field(
+        default_factory=lambda: {table.__tablename__: 0 for table in OWNED_TABLES}
+    )
+    batches: int = 0
+    error: Optional[str] = None
+    created_at: datetime = field(default_factory=utcnow)
+    finished_at: Optional[datetime] = None
+
+    @property
+    def percent(self) -> float:
+        if self.status == "completed":
+            return 100.0
+        if not self.total:
+            return 0.0
+        return min(100.0, sum(self.deleted.values()) / self.total * 100)
+
+    def as_dict(self) -> dict:
+        return {**asdict(self), "percent": self.percent}
+
+
+class RemovalJobs:
+    """Jobs of this process, of which the last `kept` finished ones are
+    remembered. They are not shared between workers and are forgotten on
+    restart; a user's row stays until their job finishes, so a lost job can
+    simply be started again."""
+
+    def __init__(self, kept: int = REMOVAL_JOBS_KEPT):
+        self.kept = kept
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def start(self, user_id: int) -> tuple[RemovalJob, bool]:
+        """The user's unfinished job if there is one, else a new one; the
+        flag tells whether the job is new."""
+        with self._lock:
+            for job in self._jobs.values():
+                if job.user_id == user_id and job.status in ("queued", "running"):
+                    return job, False
+
+            job = RemovalJob(user_id=user_id)
+            self._jobs[job.id] = job
+            self._evict()
+            return job, True
+
+    def get(self, job_id: str) -> Optional[RemovalJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _evict(self):
+        finished = [
+            job_id for job_id, job in self._jobs.items() if job.finished_at is not None
+        ]
+
+        for job_id in finished[: max(0, len(finished) - self.kept)]:
+            del self._jobs[job_id]
+
+
+removal_jobs = RemovalJobs()
+
+
+def delete_owned_rows(db, table, user_id: int, batch_size: int, pause: float, job):
+    """Delete `table` rows owned by `user_id` in id order, one short
+    transaction per batch of at most `batch_size` rows."""
+    last_id = 0
+
+    while True:
+        ids = (
+            db.execute(
+                select(table.id)
+                .where(table.user_id == user_id, table.id > last_id)
+                .order_by(table.id)
+                .limit(batch_size)
+            )
+            .scalars()
+            .all()
+        )
+
+        if not ids:
+            return
+
+        db.execute(delete(table).where(table.id.in_(ids)))
+        db.commit()
+        read_flight.forget(("todos", user_id))
+
+        last_id = ids[-1]
+        job.deleted[table.__tablename__] += len(ids)
+        job.batches += 1
+
+        if len(ids) < batch_size:
+            return
+
+        if pause:
+            time.sleep(pause)
+
+
+def sweep_user(db, user_id: int, job, attempts: int = FINAL_SWEEP_ATTEMPTS):
+    """Delete the user's remaining rows and the user's row on `db` in one
+    transaction. A write committed after the sweep trips the foreign key of
+    the user delete, so the sweep runs again; writes even later fail on the
+    foreign key themselves, as the user is gone."""
+    for attempt in range(attempts):
+        try:
+            swept = {
+                table.__tablename__: db.execute(
+                    delete(table).where(table.user_id == user_id)
+                ).rowcount
+                for table in OWNED_TABLES
+            }
+            db.execute(delete(Users).where(Users.id == user_id))
+            db.commit()
+            read_flight.forget(("todos", user_id))
+            read_flight.forget(("users", user_id))
+        except IntegrityError:
+            db.rollback()
+
+            if attempt == attempts - 1:
+                raise
+        else:
+            for name, count in swept.items():
+                job.deleted[name] += count
+            return
+
+
+def remove_user(
+    job: RemovalJob,
+    router: ShardRouter = shard_router,
+    directory_session=SessionLocal,
+    batch_size: int = REMOVAL_BATCH_SIZE,
+    pause: float = REMOVAL_PAUSE_SECONDS,
+):
+    """Delete everything the job's user owns on every shard, then the user.
+    Meant to run in the background after the user was deactivated."""
+    job.status = "running"
+    user_id = job.user_id
+    # Unsharded, the todos live next to the user in the directory.
+    session_factories = router.sessionmakers if router.sharded else [directory_session]
+
+    try:
+        for session_factory in session_factories:
+            db = session_factory()
+            try:
+                job.total += sum(
+                    db.scalar(
+                        select(func.count())
+                        .select_from(table)
+                        .where(table.user_id == user_id)
+                    )
+                    for table in OWNED_TABLES
+                )
+            finally:
+                db.close()
+
+        for session_factory in session_factories:
+            db = session_factory()
+            try:
+                for table in OWNED_TABLES:
+                    delete_owned_rows(db, table, user_id, batch_size, pause, job)
+
+                # Rows written while the batches ran go with the user's copy.
+                sweep_user(db, user_id, job)
+            finally:
+                db.close()
+
+        if router.sharded:
+            db = directory_session()
+            try:
+                db.execute(delete(Users).where(Users.id == user_id))
+                db.commit()
+                read_flight.forget(("users", user_id))
+            finally:
+                db.close()
+    except Exception as exc:
+        logger.exception("Removing user %d failed", user_id)
+        job.status = "failed"
+        job.error = str(exc)
+    else:
+        job.status = "completed"
+    finally:
+        job.finished_at = utcnow()